@@ -1,7 +1,12 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 
-from .models import User, UserProfile, NutritionPlan, Meal, AppRating, PendingSignup, PaymentReceiptIOS, Entitlement, Report
+from .models import (
+    User, SocialIdentity, UserProfile, NutritionPlan, Meal, AppRating, PendingSignup, RateLimitBucket, OutboundEmail, PaymentReceiptIOS, Entitlement, AppStoreNotification, Report,
+    AnalysisUsage, DailyTokenUsage, FoodItem, PlanStrategy, WeightLog,
+)
+from .services import report_search
+from .services.emailer import SECRET_KINDS
 
 
 @admin.register(User)
@@ -24,18 +29,44 @@ class UserAdmin(DjangoUserAdmin):
     )
 
 
+@admin.register(SocialIdentity)
+class SocialIdentityAdmin(admin.ModelAdmin):
+    list_display = ("id", "provider", "sub", "user", "email", "created_at")
+    list_filter = ("provider",)
+    search_fields = ("sub", "email", "user__email")
+    raw_id_fields = ("user",)
+
+
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "gender", "units", "activity", "goal", "has_premium")
     search_fields = ("user__email",)
+    # копия Entitlement (api/services/entitlements.py): премиум вручную — Entitlement без срока
+    readonly_fields = ("has_premium",)
+
+
+@admin.register(WeightLog)
+class WeightLogAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "weight_kg", "recorded_at")
+    search_fields = ("user__email",)
+    date_hierarchy = "recorded_at"
+    raw_id_fields = ("user",)
 
 
 @admin.register(NutritionPlan)
 class NutritionPlanAdmin(admin.ModelAdmin):
-    list_display = ("id", "user", "calories", "protein_g", "fat_g", "carbs_g", "generated_at")
+    list_display = ("id", "user", "calories", "protein_g", "fat_g", "carbs_g", "strategy", "is_custom", "generated_at")
+    list_filter = ("strategy", "is_custom")
     search_fields = ("user__email",)
 
 
+@admin.register(PlanStrategy)
+class PlanStrategyAdmin(admin.ModelAdmin):
+    list_display = ("name", "version", "is_active", "note", "created_at")
+    list_filter = ("name", "is_active")
+    ordering = ("name", "-version")
+
+
 @admin.register(Meal)
 class MealAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "title", "calories", "taken_at")
@@ -44,7 +75,7 @@ class MealAdmin(admin.ModelAdmin):
 
 @admin.register(AppRating)
 class AppRatingAdmin(admin.ModelAdmin):
-    list_display = ("id", "user", "stars", "sent_to_store", "created_at")
+    list_display = ("id", "user", "stars", "sent_to_store", "forwarded_at", "created_at")
     list_filter = ("sent_to_store", "stars")
     search_fields = ("user__email", "comment")
 
@@ -56,10 +87,30 @@ class PendingSignupAdmin(admin.ModelAdmin):
     readonly_fields = ("session_id", "otp_hash", "otp_salt", "created_at", "updated_at")
 
 
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "to_email", "status", "attempts", "next_attempt_at", "sent_at", "created_at")
+    list_filter = ("status", "kind")
+    search_fields = ("to_email",)
+    readonly_fields = ("claim", "locked_at", "last_error", "created_at", "sent_at")
+
+    def get_exclude(self, request, obj=None):
+        # текст OTP-письма — действующий код подтверждения
+        if obj is not None and obj.kind in SECRET_KINDS:
+            return ("text_body", "html_body")
+        return super().get_exclude(request, obj)
+
+
+@admin.register(RateLimitBucket)
+class RateLimitBucketAdmin(admin.ModelAdmin):
+    list_display = ("key", "tokens", "refilled_at")
+    search_fields = ("key",)
+
+
 
 @admin.register(PaymentReceiptIOS)
 class PaymentReceiptIOSAdmin(admin.ModelAdmin):
-    list_display = ("user", "product_id", "original_transaction_id", "status", "expires_at", "created_at")
+    list_display = ("user", "product_id", "original_transaction_id", "status", "attempts", "expires_at", "created_at")
     search_fields = ("user__email", "original_transaction_id", "transaction_id", "product_id")
     list_filter = ("status",)
 
@@ -70,9 +121,51 @@ class EntitlementAdmin(admin.ModelAdmin):
     list_filter = ("is_active",)
 
 
+@admin.register(AppStoreNotification)
+class AppStoreNotificationAdmin(admin.ModelAdmin):
+    list_display = ("notification_type", "subtype", "original_transaction_id", "status", "attempts", "signed_at", "received_at")
+    search_fields = ("notification_uuid", "original_transaction_id")
+    list_filter = ("status", "notification_type")
+
+
 @admin.register(Report)
 class ReportAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "user", "created_at")
+    list_display = ("id", "name", "user", "created_at", "forwarded_at")
     list_filter = ("created_at",)
-    search_fields = ("name", "comment", "user__email")
+    # name/comment ищутся по полнотекстовому индексу (get_search_results), а не icontains
+    search_fields = ("user__email",)
+    search_help_text = "Название, комментарий (по словам) или email"
     readonly_fields = ("created_at",)
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if not search_term:
+            return results, may_have_duplicates
+        return results | queryset.filter(report_search.match_filter(search_term)), may_have_duplicates
+
+
+@admin.register(AnalysisUsage)
+class AnalysisUsageAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "model", "prompt_tokens", "completion_tokens", "image_bytes", "latency_ms", "attempts", "ok", "created_at")
+    list_filter = ("ok", "model", "created_at")
+    search_fields = ("user__email",)
+    date_hierarchy = "created_at"
+    list_select_related = ("user",)
+    raw_id_fields = ("user", "meal")
+
+
+@admin.register(DailyTokenUsage)
+class DailyTokenUsageAdmin(admin.ModelAdmin):
+    list_display = ("user", "day", "tokens", "calls")
+    list_filter = ("day",)
+    search_fields = ("user__email",)
+    ordering = ("-day", "-tokens")
+    list_select_related = ("user",)
+
+
+@admin.register(FoodItem)
+class FoodItemAdmin(admin.ModelAdmin):
+    list_display = ("name", "kcal_100g", "protein_100g", "fat_100g", "carbs_100g", "portion_g", "source")
+    list_filter = ("source",)
+    search_fields = ("name_key",)
+    ordering = ("name_key",)
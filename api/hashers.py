@@ -0,0 +1,73 @@
+# api/hashers.py
+"""
+Хэшеры паролей с параметрами из настроек и ограничением параллельности.
+
+Профиль выбирается PASSWORD_HASHER (scrypt | pbkdf2) — он первый
+в PASSWORD_HASHERS, остальные нужны только чтобы проверить старые хэши.
+Django сам перехэширует пароль при успешном входе, если хэш сделан другим
+алгоритмом или с другими параметрами (check_password -> setter), так что
+смена профиля и подкрутка параметров применяются постепенно, без миграций.
+
+Хэширование — самая дорогая по CPU операция запроса. Одновременно на процесс
+считается не больше PASSWORD_HASHING_POOL_SIZE хэшей (по умолчанию — число
+CPU, 0 — без ограничения), в потоке самого запроса; остальные ждут место не
+дольше PASSWORD_HASHING_TIMEOUT и получают 503. hashlib отпускает GIL, поэтому
+в gthread-воркере дешёвые запросы в соседних потоках не стоят за пачкой логинов.
+"""
+from __future__ import annotations
+
+import threading
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, ScryptPasswordHasher
+from rest_framework.exceptions import APIException
+
+
+class HashingBusy(APIException):
+    status_code = 503
+    default_detail = "Server is busy, try again later."
+    default_code = "hashing_busy"
+
+
+class HashingPool:
+    def __init__(self, size: int, timeout: float):
+        self.size = size
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(size, 1))
+        self._local = threading.local()
+
+    def run(self, fn, *args, **kwargs):
+        # verify() внутри зовёт encode() — слот уже взят этим потоком, второй не берём
+        if self.size <= 0 or getattr(self._local, "inside", False):
+            return fn(*args, **kwargs)
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HashingBusy()
+        self._local.inside = True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._local.inside = False
+            self._slots.release()
+
+
+hashing_pool = HashingPool(settings.PASSWORD_HASHING_POOL_SIZE, settings.PASSWORD_HASHING_TIMEOUT)
+
+
+class PooledHashingMixin:
+    def encode(self, password, salt, *args, **kwargs):
+        return hashing_pool.run(super().encode, password, salt, *args, **kwargs)
+
+    def verify(self, password, encoded):
+        return hashing_pool.run(super().verify, password, encoded)
+
+
+class TunedScryptPasswordHasher(PooledHashingMixin, ScryptPasswordHasher):
+    work_factor = settings.SCRYPT_WORK_FACTOR
+    block_size = settings.SCRYPT_BLOCK_SIZE
+    parallelism = settings.SCRYPT_PARALLELISM
+    # 128 * N * r байт на хэш + запас
+    maxmem = 2 * 128 * settings.SCRYPT_WORK_FACTOR * settings.SCRYPT_BLOCK_SIZE
+
+
+class TunedPBKDF2PasswordHasher(PooledHashingMixin, PBKDF2PasswordHasher):
+    iterations = settings.PBKDF2_ITERATIONS or PBKDF2PasswordHasher.iterations
@@ -0,0 +1,57 @@
+# api/management/commands/backfill_social_identities.py
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from api.models import SocialIdentity
+from api.services.social_identity import SYNTHETIC_EMAIL_RE
+
+
+class Command(BaseCommand):
+    help = (
+        "Создаёт SocialIdentity для пользователей с техническими адресами "
+        "{google|apple}_{sub}@example.invalid. Пачками, идемпотентно."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **opts):
+        User = get_user_model()
+        users = User.objects.filter(email__endswith="@example.invalid")
+        started = time.perf_counter()
+        scanned = linked = 0
+        last_id = 0
+
+        while True:
+            # keyset-пагинация по id
+            chunk = list(users.filter(id__gt=last_id).order_by("id").values_list("id", "email")[:opts["chunk_size"]])
+            if not chunk:
+                break
+            last_id = chunk[-1][0]
+            scanned += len(chunk)
+
+            identities = []
+            for user_id, email in chunk:
+                m = SYNTHETIC_EMAIL_RE.match(email)
+                if m:
+                    identities.append(SocialIdentity(user_id=user_id, provider=m["provider"], sub=m["sub"]))
+            if not identities:
+                continue
+
+            existing = set(
+                SocialIdentity.objects.filter(user_id__in=[i.user_id for i in identities])
+                .values_list("provider", "sub")
+            )
+            new = [i for i in identities if (i.provider, i.sub) not in existing]
+            linked += len(new)
+            if not opts["dry_run"] and new:
+                SocialIdentity.objects.bulk_create(new, ignore_conflicts=True)
+
+        elapsed = time.perf_counter() - started
+        prefix = "[dry-run] would link" if opts["dry_run"] else "Linked"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {linked} identities; scanned {scanned} synthetic-email users in {elapsed:.2f}s"
+        ))
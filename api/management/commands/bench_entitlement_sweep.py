@@ -0,0 +1,120 @@
+# api/management/commands/bench_entitlement_sweep.py
+import random
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.models import Entitlement, UserProfile
+from api.services.entitlements import expire_due
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк expire_entitlements на синтетических данных в текущей БД (SQLite или "
+        "Postgres — что настроено в DATABASES): план запроса по частичному индексу "
+        "expires_at WHERE is_active, проверка «в лоб» по строкам против sweep-а пачками, строк/с и время одной пачки. "
+        "Временные пользователи удаляются в конце."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("-n", type=int, default=1_000_000, help="Сколько Entitlement создать")
+        parser.add_argument("--expired", type=float, default=0.1, help="Доля истёкших, 0..1")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--seed-batch", type=int, default=20000)
+        parser.add_argument("--keep", action="store_true", help="Не удалять синтетические данные")
+
+    def handle(self, *args, **opts):
+        run = uuid.uuid4().hex[:8]
+        prefix = f"bench-ent-{run}-"
+        self.stdout.write(f"backend {connection.vendor}, n={opts['n']}, expired share {opts['expired']}")
+        try:
+            self._seed(prefix, opts)
+            self._bench(opts)
+        finally:
+            if not opts["keep"]:
+                self._cleanup(prefix)
+
+    def _seed(self, prefix, opts):
+        User = get_user_model()
+        now = timezone.now()
+        rnd = random.Random(42)
+        started = time.perf_counter()
+        for start in range(0, opts["n"], opts["seed_batch"]):
+            size = min(opts["seed_batch"], opts["n"] - start)
+            with transaction.atomic():
+                # bulk_create не шлёт post_save — профили создаём сами
+                users = User.objects.bulk_create(
+                    [User(email=f"{prefix}{start + i}@example.com", password="!") for i in range(size)]
+                )
+                UserProfile.objects.bulk_create([UserProfile(user_id=u.id, has_premium=True) for u in users])
+                Entitlement.objects.bulk_create([
+                    Entitlement(
+                        user_id=u.id, product_id="pro.month", is_active=True,
+                        expires_at=now + timedelta(minutes=rnd.randint(-30 * 24 * 60, -1)
+                                                   if rnd.random() < opts["expired"]
+                                                   else rnd.randint(1, 30 * 24 * 60)),
+                    )
+                    for u in users
+                ])
+        self.stdout.write(f"seed: {time.perf_counter() - started:.1f}s")
+
+    def _bench(self, opts):
+        now = timezone.now()
+        due = Entitlement.objects.filter(is_active=True, expires_at__lte=now)
+
+        self.stdout.write("plan:\n  " + due.order_by("expires_at").values("id", "user_id")
+                          .explain().replace("\n", "\n  "))
+
+        t = time.perf_counter()
+        indexed = due.count()
+        indexed_s = time.perf_counter() - t
+
+        # как было бы без sweep-а: сравнивать сроки построчно при чтении
+        t = time.perf_counter()
+        by_rows = sum(1 for exp in Entitlement.objects.filter(is_active=True)
+                      .values_list("expires_at", flat=True).iterator(chunk_size=10000) if exp and exp <= now)
+        rows_s = time.perf_counter() - t
+        self.stdout.write(f"due: {indexed} by index in {indexed_s * 1000:.1f} ms, "
+                          f"{by_rows} row by row in {rows_s * 1000:.1f} ms")
+
+        chunk_ms = []
+        expired = synced = 0
+        started = t = time.perf_counter()
+        for n_expired, n_synced in expire_due(opts["chunk_size"], now=now):
+            chunk_ms.append((time.perf_counter() - t) * 1000)
+            expired += n_expired
+            synced += n_synced
+            t = time.perf_counter()
+        elapsed = time.perf_counter() - started
+
+        if chunk_ms:
+            p95 = sorted(chunk_ms)[min(len(chunk_ms) - 1, int(round(0.95 * (len(chunk_ms) - 1))))]
+            self.stdout.write(
+                f"sweep: {expired} expired, {synced} profiles synced in {elapsed:.2f}s "
+                f"({expired / elapsed if elapsed else 0:.0f} rows/s); {len(chunk_ms)} chunks, "
+                f"chunk p50 {statistics.median(chunk_ms):.1f} ms, p95 {p95:.1f} ms"
+            )
+
+        t = time.perf_counter()
+        left = list(expire_due(opts["chunk_size"], now=now))
+        self.stdout.write(f"second sweep (nothing due): {len(left)} chunks in "
+                          f"{(time.perf_counter() - t) * 1000:.1f} ms")
+
+    def _cleanup(self, prefix):
+        User = get_user_model()
+        started = time.perf_counter()
+        users = User.objects.filter(email__startswith=prefix).values("id")
+        # у синтетических пользователей нет других связей — обходимся без сбора каскада
+        # (post_delete на User заставил бы Django загрузить миллион объектов)
+        Entitlement.objects.filter(user_id__in=users).delete()
+        UserProfile.objects.filter(user_id__in=users).delete()
+        with connection.cursor() as cur:
+            cur.execute(f"DELETE FROM {connection.ops.quote_name(User._meta.db_table)} WHERE email LIKE %s",
+                        [prefix + "%"])
+        self.stdout.write(f"cleanup: {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,85 @@
+# api/management/commands/bench_login.py
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test.utils import override_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк логина (/api/auth/token/) для разных профилей хэширования: "
+        "логины/с, p50/p95 и сколько из них отдали 503. Создаёт временных "
+        "пользователей в текущей БД и удаляет их в конце."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", default="pbkdf2,scrypt", help="Через запятую: pbkdf2,scrypt")
+        parser.add_argument("-n", type=int, default=40, help="Логинов на профиль")
+        parser.add_argument("--concurrency", type=int, default=4, help="Параллельных клиентов (потоков)")
+        parser.add_argument("--users", type=int, default=8)
+
+    def handle(self, *args, **opts):
+        profiles = [p.strip() for p in opts["profiles"].split(",") if p.strip()]
+        unknown = [p for p in profiles if p not in settings.PASSWORD_HASHER_PROFILES]
+        if unknown:
+            raise CommandError(f"Unknown profiles: {', '.join(unknown)}")
+
+        header = f"{'profile':<8} {'hash ms':>8} {'logins/s':>9} {'p50 ms':>7} {'p95 ms':>7} {'503':>4}"
+        self.stdout.write(f"pool size {settings.PASSWORD_HASHING_POOL_SIZE}, concurrency {opts['concurrency']}")
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for profile in profiles:
+            hashers = [settings.PASSWORD_HASHER_PROFILES[profile]] + [
+                h for name, h in settings.PASSWORD_HASHER_PROFILES.items() if name != profile
+            ]
+            with override_settings(PASSWORD_HASHERS=hashers):
+                self._bench(profile, opts)
+
+    def _bench(self, profile, opts):
+        from rest_framework.test import APIClient
+
+        User = get_user_model()
+        run = uuid.uuid4().hex[:8]
+        password = "Bench-" + uuid.uuid4().hex[:10]
+
+        t = time.perf_counter()
+        hasher = get_hasher()
+        encoded = hasher.encode(password, hasher.salt())
+        hash_ms = (time.perf_counter() - t) * 1000
+
+        emails = [f"bench-login-{run}-{i}@example.com" for i in range(opts["users"])]
+        User.objects.bulk_create([User(email=e, password=encoded) for e in emails])
+
+        def login(i):
+            client = APIClient()
+            t = time.perf_counter()
+            r = client.post("/api/auth/token/", {"email": emails[i % len(emails)], "password": password}, format="json")
+            close_old_connections()
+            return r.status_code, time.perf_counter() - t
+
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(opts["concurrency"]) as pool:
+                results = list(pool.map(login, range(opts["n"])))
+            elapsed = time.perf_counter() - started
+        finally:
+            User.objects.filter(email__startswith=f"bench-login-{run}-").delete()
+
+        bad = [code for code, _ in results if code not in (200, 503)]
+        if bad:
+            raise CommandError(f"Unexpected statuses: {sorted(set(bad))}")
+        lat = sorted(dt for _, dt in results)
+        n = len(lat)
+        p95 = lat[min(n - 1, int(round(0.95 * (n - 1))))]
+        self.stdout.write(
+            f"{profile:<8} {hash_ms:>8.1f} {n / elapsed:>9.1f} "
+            f"{statistics.median(lat) * 1000:>7.1f} {p95 * 1000:>7.1f} "
+            f"{sum(code == 503 for code, _ in results):>4}"
+        )
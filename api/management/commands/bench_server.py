@@ -0,0 +1,244 @@
+# api/management/commands/bench_server.py
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from snapAI.gunicorn_conf import PROFILES
+
+# PNG 1x1: содержимое картинки заглушке OpenAI не важно
+PIXEL_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000100e221bc330000000049454e44ae426082"
+)
+STUB_REPLY = json.dumps({"t": "Bench salad", "k": 320, "p": 12, "f": 14, "c": 30,
+                         "i": [["lettuce", 20, 1, 0, 4], ["chicken", 300, 11, 14, 26]],
+                         "h": 8, "l": ["bench"]})
+
+
+def _stub_openai(latency: float) -> ThreadingHTTPServer:
+    """OpenAI-совместимый /v1/chat/completions, отвечающий через latency секунд."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            time.sleep(latency)
+            body = json.dumps({
+                "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()),
+                "model": "bench",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": STUB_REPLY}}],
+                "usage": {"prompt_tokens": 300, "completion_tokens": 60, "total_tokens": 360},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _children(pid: int) -> list[int]:
+    out = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            stat = Path(f"/proc/{entry}/stat").read_text()
+        except OSError:
+            continue
+        # поле 4 после "(comm)" — ppid
+        if int(stat.rsplit(")", 1)[1].split()[1]) == pid:
+            out.append(int(entry))
+    return out
+
+
+def _memory_kb(pid: int) -> tuple[int, int]:
+    """(RSS, PSS) в КБ. PSS делит общие страницы между процессами — он и показывает выигрыш preload."""
+    fields = {}
+    try:
+        for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines():
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                fields[key] = int(rest.split()[0])
+    except OSError:
+        return 0, 0
+    return fields.get("Rss", 0), fields.get("Pss", 0)
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест профилей snapAI/gunicorn_conf.py: для каждого профиля поднимает "
+        "gunicorn на свободном порту, гоняет параллельные запросы (анализ фото с заглушкой "
+        "OpenAI, отвечающей через --vision-latency сек, и автодополнение ингредиентов) и "
+        "печатает запросы/с, p50/p95 и RSS/PSS на воркер. Вариант профиля «gthread:nopreload» — "
+        "то же без preload_app. Временный пользователь и его приёмы пищи удаляются в конце."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", default="gthread,sync,gthread:nopreload",
+                            help="Через запятую: профиль[:nopreload]")
+        parser.add_argument("--scenarios", default="analyze,suggest", help="analyze,suggest")
+        parser.add_argument("-n", type=int, default=64, help="Запросов на сценарий")
+        parser.add_argument("--concurrency", type=int, default=16, help="Параллельных клиентов")
+        parser.add_argument("--vision-latency", type=float, default=1.0,
+                            help="Сколько «думает» заглушка OpenAI, сек")
+        parser.add_argument("--workers", type=int, help="GUNICORN_WORKERS для всех профилей")
+
+    def handle(self, *args, **opts):
+        if not Path("/proc/self/smaps_rollup").exists():
+            self.stderr.write("no /proc/<pid>/smaps_rollup — memory columns will be 0")
+        variants = []
+        for spec in (p.strip() for p in opts["profiles"].split(",")):
+            if not spec:
+                continue
+            name, _, flag = spec.partition(":")
+            if name not in PROFILES or flag not in ("", "nopreload"):
+                raise CommandError(f"Bad profile {spec!r}; profiles: {', '.join(PROFILES)}")
+            variants.append((spec, name, flag != "nopreload"))
+        scenarios = [s.strip() for s in opts["scenarios"].split(",") if s.strip()]
+        if set(scenarios) - {"analyze", "suggest"}:
+            raise CommandError("Scenarios: analyze, suggest")
+
+        User = get_user_model()
+        user = User.objects.create_user(email=f"bench-server-{uuid.uuid4().hex[:8]}@example.com",
+                                        password=None, is_active=True)
+        token = str(RefreshToken.for_user(user).access_token)
+        stub = _stub_openai(opts["vision_latency"])
+        media = tempfile.TemporaryDirectory(prefix="bench-server-media-")
+
+        self.stdout.write(
+            f"concurrency {opts['concurrency']}, {opts['n']} requests per scenario, "
+            f"vision latency {opts['vision_latency']:.2f}s, cpus {os.cpu_count()}"
+        )
+        header = (f"{'profile':<18} {'scenario':<8} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'err':>4} "
+                  f"{'workers':>7} {'RSS/w MB':>9} {'PSS/w MB':>9} {'total PSS MB':>12}")
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        try:
+            for spec, name, preload in variants:
+                self._bench(spec, name, preload, scenarios, token, stub, media.name, opts)
+        finally:
+            stub.shutdown()
+            media.cleanup()
+            user.delete()
+
+    def _bench(self, spec, name, preload, scenarios, token, stub, media_root, opts):
+        port = _free_port()
+        env = {
+            **os.environ,
+            "GUNICORN_PROFILE": name,
+            "GUNICORN_BIND": f"127.0.0.1:{port}",
+            "GUNICORN_PRELOAD": str(preload),
+            "GUNICORN_ACCESSLOG": "",
+            "GUNICORN_LOGLEVEL": "warning",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{stub.server_port}/v1",
+            "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "bench",
+            "MEDIA_ROOT": media_root,
+            "ANALYSIS_DAILY_TOKEN_BUDGET": "0",
+            "ANALYZE_REQUIRES_PREMIUM": "False",
+        }
+        if opts["workers"]:
+            env["GUNICORN_WORKERS"] = str(opts["workers"])
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "python:snapAI.gunicorn_conf", "snapAI.wsgi:application"],
+            env=env, cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL,
+        )
+        base = f"http://127.0.0.1:{port}"
+        headers = {"Authorization": f"Bearer {token}"}
+        try:
+            self._wait_ready(proc, base, headers)
+            local = threading.local()
+
+            def session():
+                if not hasattr(local, "s"):
+                    local.s = requests.Session()
+                    local.s.headers.update(headers)
+                return local.s
+
+            calls = {
+                "analyze": lambda: session().post(f"{base}/api/analyze/", timeout=120,
+                                                  files={"image": ("bench.png", PIXEL_PNG, "image/png")}),
+                "suggest": lambda: session().get(f"{base}/api/ingredients/suggest/",
+                                                 params={"q": "chi"}, timeout=120),
+            }
+            ok = {"analyze": 201, "suggest": 200}
+            for scenario in scenarios:
+                call = calls[scenario]
+
+                def one(_):
+                    t = time.perf_counter()
+                    try:
+                        code = call().status_code
+                    except requests.RequestException:
+                        code = 0
+                    return code, time.perf_counter() - t
+
+                # прогрев: импорт ленивых модулей и первое соединение с БД в каждом воркере
+                with ThreadPoolExecutor(opts["concurrency"]) as pool:
+                    list(pool.map(one, range(opts["concurrency"])))
+                started = time.perf_counter()
+                with ThreadPoolExecutor(opts["concurrency"]) as pool:
+                    results = list(pool.map(one, range(opts["n"])))
+                elapsed = time.perf_counter() - started
+
+                workers = _children(proc.pid)
+                mem = [_memory_kb(pid) for pid in workers]
+                master_pss = _memory_kb(proc.pid)[1]
+                lat = sorted(dt for _, dt in results)
+                n = len(lat)
+                p95 = lat[min(n - 1, int(round(0.95 * (n - 1))))]
+                rss_w = statistics.mean(r for r, _ in mem) / 1024 if mem else 0
+                pss_w = statistics.mean(p for _, p in mem) / 1024 if mem else 0
+                total_pss = (sum(p for _, p in mem) + master_pss) / 1024
+                self.stdout.write(
+                    f"{spec:<18} {scenario:<8} {n / elapsed:>7.1f} {statistics.median(lat) * 1000:>8.1f} "
+                    f"{p95 * 1000:>8.1f} {sum(code != ok[scenario] for code, _ in results):>4} "
+                    f"{len(workers):>7} {rss_w:>9.1f} {pss_w:>9.1f} {total_pss:>12.1f}"
+                )
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=35)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    def _wait_ready(self, proc, base, headers, timeout=60.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise CommandError(f"gunicorn exited with code {proc.returncode}")
+            try:
+                requests.get(f"{base}/api/", headers=headers, timeout=2)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise CommandError(f"gunicorn did not start in {timeout:.0f}s")
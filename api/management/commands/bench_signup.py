@@ -0,0 +1,82 @@
+# api/management/commands/bench_signup.py
+import re
+import statistics
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from api.models import OutboundEmail, PendingSignup
+
+OTP_RE = re.compile(r"(\d{4,8})")
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк регистрации по OTP через весь стек DRF: register/start + register/verify. "
+        "Пишет в текущую БД и удаляет за собой созданных пользователей (если не --keep)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("-n", type=int, default=50, help="Сколько регистраций")
+        parser.add_argument("--keep", action="store_true")
+
+    def handle(self, *args, **opts):
+        from rest_framework.test import APIClient
+
+        User = get_user_model()
+        client = APIClient()
+        run = uuid.uuid4().hex[:8]
+        password = "Bench-" + uuid.uuid4().hex[:10]
+        timings = {"start": [], "verify": []}
+        queries = {"start": [], "verify": []}
+
+        # без лимитов и без SMTP: письмо остаётся в очереди, код берём из него
+        with override_settings(RATE_LIMIT_ENABLED=False, EMAIL_OUTBOX=True, DEBUG=False):
+            started = time.perf_counter()
+            for i in range(opts["n"]):
+                email = f"bench-{run}-{i}@example.com"
+
+                with CaptureQueriesContext(connection) as q:
+                    t = time.perf_counter()
+                    r = client.post("/api/auth/register/start/", {"email": email, "password": password}, format="json")
+                    timings["start"].append(time.perf_counter() - t)
+                queries["start"].append(len(q))
+                if r.status_code != 200:
+                    self.stderr.write(f"start failed: {r.status_code} {r.data}")
+                    return
+
+                body = OutboundEmail.objects.filter(to_email=email).values_list("text_body", flat=True).last()
+                otp = OTP_RE.search(body).group(1)
+
+                with CaptureQueriesContext(connection) as q:
+                    t = time.perf_counter()
+                    r = client.post("/api/auth/register/verify/", {
+                        "session_id": r.data["session_id"], "otp": otp, "password": password,
+                    }, format="json")
+                    timings["verify"].append(time.perf_counter() - t)
+                queries["verify"].append(len(q))
+                if r.status_code != 201:
+                    self.stderr.write(f"verify failed: {r.status_code} {r.data}")
+                    return
+            elapsed = time.perf_counter() - started
+
+        n = opts["n"]
+        self.stdout.write(f"{'phase':<8} {'p50 ms':>7} {'p95 ms':>7} {'queries':>7}")
+        for phase in ("start", "verify"):
+            lat = sorted(timings[phase])
+            p95 = lat[min(n - 1, int(round(0.95 * (n - 1))))]
+            self.stdout.write(
+                f"{phase:<8} {statistics.median(lat) * 1000:>7.1f} {p95 * 1000:>7.1f} "
+                f"{statistics.mean(queries[phase]):>7.1f}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"{n} signups in {elapsed:.2f}s ({n / elapsed:.1f} signups/s)"))
+
+        if not opts["keep"]:
+            prefix = f"bench-{run}-"
+            User.objects.filter(email__startswith=prefix).delete()
+            OutboundEmail.objects.filter(to_email__startswith=prefix).delete()
+            PendingSignup.objects.filter(email__startswith=prefix).delete()
@@ -0,0 +1,115 @@
+# api/management/commands/bench_startup.py
+import os
+import shlex
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# старый entrypoint.sh: каждый шаг — отдельный процесс, заново импортирующий Django
+LEGACY_STEPS = [
+    ("makemigrations", ["makemigrations", "--noinput", "--dry-run"]),
+    ("migrate", ["migrate", "--noinput"]),
+    ("load_foods", ["load_foods"]),
+    ("collectstatic", ["collectstatic", "--noinput"]),
+    ("superuser", ["shell", "-c",
+                   "from django.contrib.auth import get_user_model; from django.conf import settings\n"
+                   "User = get_user_model()\n"
+                   "if not User.objects.filter(is_superuser=True).exists():\n"
+                   "    User.objects.create_superuser(email=settings.SUPERUSER_EMAIL, "
+                   "password=settings.SUPERUSER_PASSWORD, is_active=True)"]),
+]
+BOOTSTRAP_STEPS = [("bootstrap", ["bootstrap"])]
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк холодного старта контейнера на текущей БД: старая последовательность "
+        "entrypoint.sh (makemigrations, migrate, load_foods, collectstatic, shell) против "
+        "manage.py bootstrap — время каждого шага и медиана по --runs перезапускам, затем "
+        "время от запуска gunicorn до первого ответа. Статика пишется во временные каталоги; "
+        "оба варианта идемпотентны, первый прогон каждого — прогрев и в медиану не входит."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=3)
+        parser.add_argument("--launcher", default="",
+                            help='Префикс команд, например "uv run" — как в entrypoint.sh')
+        parser.add_argument("--skip-server", action="store_true", help="Не мерить старт gunicorn")
+
+    def handle(self, *args, **opts):
+        launcher = shlex.split(opts["launcher"]) or [sys.executable]
+        manage = [*launcher, *(["python"] if opts["launcher"] else []), str(Path(settings.BASE_DIR) / "manage.py")]
+
+        with tempfile.TemporaryDirectory(prefix="bench-startup-") as tmp:
+            build, volume = Path(tmp) / "static-build", Path(tmp) / "static"
+            env = {**os.environ, "STATIC_ROOT": str(volume), "STATIC_BUILD_ROOT": str(build)}
+
+            # что делает Dockerfile при сборке образа
+            t = time.perf_counter()
+            self._run(manage + ["collectstatic", "--noinput"], {**env, "STATIC_ROOT": str(build)})
+            (build / ".build-id").write_text(uuid.uuid4().hex)
+            self.stdout.write(f"image build collectstatic: {time.perf_counter() - t:.2f}s (once per image)")
+
+            results = {}
+            for name, steps in (("legacy", LEGACY_STEPS), ("bootstrap", BOOTSTRAP_STEPS)):
+                runs = [self._sequence(manage, steps, env) for _ in range(opts["runs"] + 1)]
+                first, rest = runs[0], runs[1:]
+                results[name] = statistics.median(sum(r.values()) for r in rest)
+                per_step = ", ".join(f"{step} {statistics.median(r[step] for r in rest):.2f}s"
+                                     for step, _ in steps)
+                self.stdout.write(f"{name:<9} first {sum(first.values()):.2f}s, "
+                                  f"restart median {results[name]:.2f}s: {per_step}")
+            self.stdout.write(self.style.SUCCESS(
+                f"before gunicorn: {results['legacy']:.2f}s -> {results['bootstrap']:.2f}s "
+                f"({results['legacy'] / results['bootstrap']:.1f}x faster)"
+            ))
+
+            if not opts["skip_server"]:
+                ready = [self._server_ready(launcher, opts["launcher"], env) for _ in range(opts["runs"])]
+                self.stdout.write(f"gunicorn start to first response: median {statistics.median(ready):.2f}s")
+
+    def _run(self, cmd, env):
+        proc = subprocess.run(cmd, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if proc.returncode:
+            raise CommandError(f"{' '.join(cmd[-3:])} failed:\n{proc.stderr[-2000:]}")
+
+    def _sequence(self, manage, steps, env) -> dict[str, float]:
+        out = {}
+        for name, args in steps:
+            t = time.perf_counter()
+            self._run(manage + args, env)
+            out[name] = time.perf_counter() - t
+        return out
+
+    def _server_ready(self, launcher, launcher_opt, env, timeout=60.0) -> float:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        cmd = [*launcher, *([] if launcher_opt else ["-m"]), "gunicorn",
+               "-c", "python:snapAI.gunicorn_conf", "snapAI.wsgi:application"]
+        started = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                env={**env, "GUNICORN_BIND": f"127.0.0.1:{port}", "GUNICORN_ACCESSLOG": ""})
+        try:
+            while time.perf_counter() - started < timeout:
+                if proc.poll() is not None:
+                    raise CommandError(f"gunicorn exited with code {proc.returncode}")
+                try:
+                    # любой HTTP-ответ (401 без токена) — воркер принимает запросы
+                    requests.get(f"http://127.0.0.1:{port}/api/", timeout=2)
+                    return time.perf_counter() - started
+                except requests.RequestException:
+                    time.sleep(0.05)
+            raise CommandError(f"gunicorn did not answer in {timeout:.0f}s")
+        finally:
+            proc.terminate()
+            proc.wait(timeout=35)
@@ -0,0 +1,64 @@
+# api/management/commands/bench_vision_prompts.py
+import statistics
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.services.openai_vision import PROMPT_VARIANTS, analyze_image
+from api.services.usage import CallStats
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Локальный бенчмарк вариантов промпта vision-модели на наборе фото: "
+        "токены, латентность, доля валидных ответов. Ходит в OpenAI (нужен OPENAI_API_KEY)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", required=True, help="Папка с фото-фикстурами")
+        parser.add_argument("--variants", default=",".join(PROMPT_VARIANTS), help="compact,verbose")
+        parser.add_argument("--detail", default="low,high", help="low,high,auto")
+        parser.add_argument("--repeat", type=int, default=1)
+
+    def handle(self, *args, **opts):
+        folder = Path(opts["images"])
+        images = sorted(p for p in folder.iterdir() if p.suffix.lower() in IMAGE_EXTS) if folder.is_dir() else []
+        if not images:
+            raise CommandError(f"No images found in {folder}")
+
+        variants = [v.strip() for v in opts["variants"].split(",") if v.strip()]
+        unknown = set(variants) - PROMPT_VARIANTS.keys()
+        if unknown:
+            raise CommandError(f"Unknown variants: {', '.join(sorted(unknown))}")
+        details = [d.strip() for d in opts["detail"].split(",") if d.strip()]
+
+        self.stdout.write(f"{len(images)} images x {opts['repeat']} repeat(s)\n")
+        header = f"{'variant':<8} {'detail':<6} {'ok':>5} {'prompt':>7} {'compl':>6} {'p50 ms':>7} {'p95 ms':>7} {'retries':>7}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+
+        for variant in variants:
+            for detail in details:
+                runs, ok = [], 0
+                for _ in range(opts["repeat"]):
+                    for path in images:
+                        stats = CallStats()
+                        with path.open("rb") as fh:
+                            result = analyze_image(fh, stats=stats, variant=variant, detail=detail)
+                        ok += bool(result)
+                        runs.append(stats)
+                self._row(variant, detail, runs, ok)
+
+    def _row(self, variant, detail, runs, ok):
+        n = len(runs)
+        lat = sorted(s.latency_ms for s in runs)
+        p95 = lat[min(n - 1, int(round(0.95 * (n - 1))))]
+        self.stdout.write(
+            f"{variant:<8} {detail:<6} {ok / n:>5.0%} "
+            f"{statistics.mean(s.prompt_tokens for s in runs):>7.0f} "
+            f"{statistics.mean(s.completion_tokens for s in runs):>6.0f} "
+            f"{statistics.median(lat):>7.0f} {p95:>7} "
+            f"{sum(max(s.attempts - 1, 0) for s in runs):>7}"
+        )
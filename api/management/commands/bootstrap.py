@@ -0,0 +1,84 @@
+# api/management/commands/bootstrap.py
+import io
+import shutil
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+BUILD_ID = ".build-id"
+
+
+class Command(BaseCommand):
+    help = (
+        "Подготовка контейнера к запуску одним процессом (entrypoint.sh): миграции, если есть "
+        "неприменённые; таблица продуктов; суперюзер, если его нет; статика из образа в "
+        "STATIC_ROOT, если образ новее. Идемпотентно — повторный запуск ничего не меняет."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument("--skip-foods", action="store_true", help="Не загружать таблицу продуктов")
+
+    def handle(self, *args, **opts):
+        self._verbosity = opts["verbosity"]
+        started = time.perf_counter()
+        self._step("migrate", self._migrate, opts["database"])
+        if not opts["skip_foods"]:
+            self._step("foods", self._load_foods)
+        self._step("superuser", self._ensure_superuser)
+        self._step("static", self._publish_static)
+        self.stdout.write(self.style.SUCCESS(f"Bootstrap done in {time.perf_counter() - started:.2f}s"))
+
+    def _step(self, name, fn, *args):
+        t = time.perf_counter()
+        result = fn(*args)
+        self.stdout.write(f"{name}: {result or 'ok'} ({(time.perf_counter() - t) * 1000:.0f} ms)")
+
+    def _migrate(self, database):
+        connection = connections[database]
+        executor = MigrationExecutor(connection)
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+        if not plan:
+            return "up to date"
+        call_command("migrate", database=database, interactive=False, verbosity=self._verbosity)
+        return f"applied {len(plan)} migrations"
+
+    def _load_foods(self):
+        # upsert по name_key — на уже загруженной таблице ничего не меняет
+        out = io.StringIO()
+        call_command("load_foods", stdout=out)
+        return out.getvalue().strip()
+
+    def _ensure_superuser(self):
+        User = get_user_model()
+        if User.objects.filter(is_superuser=True).exists():
+            return "exists"
+        User.objects.create_superuser(
+            email=settings.SUPERUSER_EMAIL,
+            password=settings.SUPERUSER_PASSWORD,
+            is_active=True,
+        )
+        return f"created {settings.SUPERUSER_EMAIL}"
+
+    def _publish_static(self):
+        # collectstatic выполняется при сборке образа в STATIC_BUILD_ROOT. STATIC_ROOT —
+        # volume, общий с nginx: Docker заполняет его из образа только при создании,
+        # поэтому новую статику копируем сами — по .build-id, без обхода finders
+        if not settings.STATIC_BUILD_ROOT:
+            return "STATIC_BUILD_ROOT not set, skipped"
+        src, dst = Path(settings.STATIC_BUILD_ROOT), Path(settings.STATIC_ROOT)
+        if not (src / BUILD_ID).exists():
+            raise CommandError(f"{src / BUILD_ID} is missing — run collectstatic at image build")
+        build_id = (src / BUILD_ID).read_text().strip()
+        if (dst / BUILD_ID).exists() and (dst / BUILD_ID).read_text().strip() == build_id:
+            return "up to date"
+        shutil.copytree(src, dst, dirs_exist_ok=True, ignore=shutil.ignore_patterns(BUILD_ID))
+        # метка последней: оборванное копирование повторится при следующем старте
+        shutil.copy2(src / BUILD_ID, dst / BUILD_ID)
+        return f"published build {build_id}"
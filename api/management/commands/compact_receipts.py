@@ -0,0 +1,35 @@
+# api/management/commands/compact_receipts.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.services.receipts import merge_duplicate_receipts
+
+
+class Command(BaseCommand):
+    help = (
+        "Сливает повторные PaymentReceiptIOS с одинаковыми (original_transaction_id, "
+        "transaction_id): остаётся лучший по статусу, остальные удаляются. Пачками, "
+        "транзакция на пачку. Миграция 0016 делает то же перед уникальным ограничением."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200, help="Групп повторов на пачку")
+        parser.add_argument("--pause", type=float, default=0.05,
+                            help="Пауза между пачками, сек — окно для других записей в SQLite")
+
+    def handle(self, *args, **opts):
+        started = time.perf_counter()
+        groups = removed = batches = 0
+        for n_groups, n_removed in merge_duplicate_receipts(batch_size=opts["batch_size"]):
+            groups += n_groups
+            removed += n_removed
+            batches += 1
+            if opts["verbosity"] > 1:
+                self.stdout.write(f"batch {batches}: {n_groups} groups, {n_removed} removed")
+            time.sleep(opts["pause"])
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Merged {groups} duplicate groups, removed {removed} receipts in {batches} batches ({elapsed:.2f}s)"
+        ))
@@ -0,0 +1,69 @@
+# api/management/commands/dispatch_feedback.py
+import logging
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from api.management.loop import LoopCommand
+from api.services.feedback import dispatch_batch, get_sinks, queue_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Command(LoopCommand):
+    help = (
+        "Пересылает оценки 4+ и заявки в приёмники из FEEDBACK_SINKS (webhook, email, file). "
+        "По умолчанию — один проход по очереди; --loop — фоновый пересыльщик."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=100, help="Записей каждого вида на пачку")
+        parser.add_argument("--interval", type=float, default=10.0,
+                            help="Пауза между опросами пустой очереди, сек")
+
+    def handle(self, *args, **opts):
+        if opts["loop"]:
+            self.install_signal_handlers()
+
+        sinks = get_sinks()
+        if not sinks:
+            self.stdout.write("FEEDBACK_SINKS is empty — nothing to forward to")
+            if not opts["loop"]:
+                return
+
+        totals: Counter = Counter()
+        failures = 0
+        started = time.perf_counter()
+        while not self.stopping:
+            close_old_connections()
+            if sinks:
+                try:
+                    sent = dispatch_batch(sinks, opts["batch_size"])
+                except Exception as e:
+                    failures += 1
+                    delay = min(settings.FEEDBACK_RETRY_BACKOFF * 2 ** (failures - 1), 600)
+                    logger.warning("Feedback dispatch failed (%d in a row), retry in %.0fs: %s", failures, delay, e)
+                    if not opts["loop"]:
+                        self.stderr.write(f"Dispatch failed: {e}")
+                        break
+                    self.sleep(delay)
+                    continue
+                failures = 0
+                if any(sent.values()):
+                    totals.update(sent)
+                    if opts["verbosity"] > 1:
+                        self.stdout.write(f"forwarded {dict(sent)}; queue {queue_metrics()}")
+                    continue
+
+            if not opts["loop"]:
+                break
+            self.sleep(opts["interval"])
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Forwarded {totals['rating']} ratings, {totals['report']} reports in {elapsed:.1f}s "
+            f"to {', '.join(settings.FEEDBACK_SINKS) or 'nowhere'}; queue {queue_metrics()}"
+        ))
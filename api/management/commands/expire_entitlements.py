@@ -0,0 +1,50 @@
+# api/management/commands/expire_entitlements.py
+import time
+
+from django.db import close_old_connections
+
+from api.management.loop import LoopCommand
+from api.services.entitlements import expire_due
+
+
+class Command(LoopCommand):
+    help = (
+        "Гасит истёкшие Entitlement (is_active=False) и снимает UserProfile.has_premium "
+        "короткими пачками по частичному индексу expires_at WHERE is_active. --loop — периодически."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--pause", type=float, default=0.05,
+                            help="Пауза между пачками, сек — окно для других записей в SQLite")
+        parser.add_argument("--loop", action="store_true")
+        parser.add_argument("--interval", type=float, default=300.0, help="Период для --loop, сек")
+
+    def handle(self, *args, **opts):
+        if not opts["loop"]:
+            self.sweep(opts)
+            return
+
+        self.install_signal_handlers()
+        while not self.stopping:
+            close_old_connections()
+            self.sweep(opts)
+            self.sleep(opts["interval"])
+
+    def sweep(self, opts) -> int:
+        started = time.perf_counter()
+        expired = synced = chunks = 0
+        for n_expired, n_synced in expire_due(opts["chunk_size"]):
+            expired += n_expired
+            synced += n_synced
+            chunks += 1
+            if self.stopping:
+                break
+            self.sleep(opts["pause"])
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Expired {expired} entitlements, cleared has_premium on {synced} profiles "
+            f"in {chunks} chunks ({elapsed:.2f}s)"
+        ))
+        return expired
@@ -0,0 +1,49 @@
+# api/management/commands/load_foods.py
+import csv
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.models import FoodItem
+from api.services.nutrition import clear_match_cache, normalize_name
+
+DEFAULT_PATH = Path(__file__).resolve().parents[2] / "data" / "foods.csv"
+NUM_FIELDS = ("kcal_100g", "protein_100g", "fat_100g", "carbs_100g", "portion_g")
+
+
+class Command(BaseCommand):
+    help = "Загружает таблицу пищевой ценности (CSV, на 100 г) в FoodItem. Идемпотентно (upsert по name_key)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default=str(DEFAULT_PATH))
+        parser.add_argument("--source", default="bundled")
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **opts):
+        path = Path(opts["path"])
+        if not path.exists():
+            raise CommandError(f"File not found: {path}")
+
+        rows = {}
+        with path.open(newline="", encoding="utf-8") as fh:
+            for line_no, r in enumerate(csv.DictReader(fh), start=2):
+                key = normalize_name(r["name"])
+                if not key:
+                    continue
+                try:
+                    nums = {f: float(r[f]) for f in NUM_FIELDS if r.get(f) not in (None, "")}
+                except ValueError as e:
+                    raise CommandError(f"{path}:{line_no}: {e}")
+                rows[key] = FoodItem(name=r["name"].strip(), name_key=key, source=opts["source"], **nums)
+
+        with transaction.atomic():
+            FoodItem.objects.bulk_create(
+                rows.values(),
+                batch_size=opts["batch_size"],
+                update_conflicts=True,
+                unique_fields=["name_key"],
+                update_fields=["name", "source", *NUM_FIELDS],
+            )
+        clear_match_cache()
+        self.stdout.write(self.style.SUCCESS(f"Loaded {len(rows)} food items from {path.name}"))
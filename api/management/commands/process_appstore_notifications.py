@@ -0,0 +1,57 @@
+# api/management/commands/process_appstore_notifications.py
+import time
+from collections import Counter
+
+from django.db import close_old_connections
+from django.db.models import Min
+from django.utils import timezone
+
+from api.management.loop import LoopCommand
+from api.models import AppStoreNotification, NotificationStatus
+from api.services.appstore_notifications import apply_batch, claim_notifications
+
+
+class Command(LoopCommand):
+    help = (
+        "Применяет принятые вебхуком App Store Server Notifications к Entitlement. "
+        "По умолчанию — один проход по очереди; --loop — фоновый обработчик."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--interval", type=float, default=2.0,
+                            help="Пауза между опросами пустой очереди, сек")
+
+    def handle(self, *args, **opts):
+        if opts["loop"]:
+            self.install_signal_handlers()
+
+        totals: Counter = Counter()
+        started = time.perf_counter()
+        while not self.stopping:
+            close_old_connections()
+            rows = claim_notifications(opts["batch_size"])
+            if rows:
+                stats = apply_batch(rows)
+                totals.update(stats)
+                if opts["verbosity"] > 1:
+                    self.stdout.write(f"batch {len(rows)}: {dict(stats)}, queue lag {self._queue_lag():.0f}s")
+                continue
+
+            if not opts["loop"]:
+                break
+            self.sleep(opts["interval"])
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Applied {totals['applied']}, ignored {totals['ignored']}, retry later {totals['retry']} "
+            f"in {elapsed:.1f}s; queue lag now {self._queue_lag():.0f}s"
+        ))
+
+    @staticmethod
+    def _queue_lag() -> float:
+        oldest = (AppStoreNotification.objects
+                  .filter(status=NotificationStatus.PENDING, next_attempt_at__lte=timezone.now())
+                  .aggregate(m=Min("received_at"))["m"])
+        return (timezone.now() - oldest).total_seconds() if oldest else 0.0
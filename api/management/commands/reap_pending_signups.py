@@ -0,0 +1,78 @@
+# api/management/commands/reap_pending_signups.py
+import time
+from datetime import timedelta
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from api.management.loop import LoopCommand
+from api.models import PendingSignup
+from api.services.rate_limit import prune_idle_buckets
+
+
+class Command(LoopCommand):
+    help = (
+        "Удаляет истёкшие PendingSignup короткими пачками (индекс по expires_at), "
+        "чтобы не держать долгую блокировку записи в SQLite, и простаивающие ведра "
+        "RateLimitBucket. --loop — периодически."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument("--pause", type=float, default=0.05,
+                            help="Пауза между пачками, сек — окно для запросов регистрации")
+        parser.add_argument("--grace", type=int, default=0,
+                            help="Удалять только истёкшие больше N минут назад")
+        parser.add_argument("--loop", action="store_true")
+        parser.add_argument("--interval", type=float, default=3600.0, help="Период для --loop, сек")
+
+    def handle(self, *args, **opts):
+        if not opts["loop"]:
+            self.reap(opts)
+            self.prune_buckets(opts)
+            return
+
+        self.install_signal_handlers()
+        while not self.stopping:
+            close_old_connections()
+            self.reap(opts)
+            self.prune_buckets(opts)
+            self.sleep(opts["interval"])
+
+    def reap(self, opts) -> int:
+        cutoff = timezone.now() - timedelta(minutes=opts["grace"])
+        started = time.perf_counter()
+        removed = chunks = 0
+        while not self.stopping:
+            ids = list(PendingSignup.objects.filter(expires_at__lt=cutoff)
+                       .order_by("expires_at").values_list("pk", flat=True)[:opts["chunk_size"]])
+            if not ids:
+                break
+            # одна короткая транзакция на пачку
+            with transaction.atomic():
+                deleted, _ = PendingSignup.objects.filter(pk__in=ids, expires_at__lt=cutoff).delete()
+            removed += deleted
+            chunks += 1
+            if len(ids) < opts["chunk_size"]:
+                break
+            self.sleep(opts["pause"])
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {removed} expired pending signups in {chunks} chunks ({elapsed:.2f}s)"
+        ))
+        return removed
+
+    def prune_buckets(self, opts) -> int:
+        started = time.perf_counter()
+        removed = chunks = 0
+        for deleted in prune_idle_buckets(opts["chunk_size"]):
+            removed += deleted
+            chunks += 1
+            if self.stopping:
+                break
+            self.sleep(opts["pause"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {removed} idle rate limit buckets in {chunks} chunks ({time.perf_counter() - started:.2f}s)"
+        ))
+        return removed
@@ -0,0 +1,99 @@
+# api/management/commands/run_workers.py
+import logging
+import threading
+import time
+
+from django.core.management import call_command, load_command_class
+from django.core.management.base import CommandError
+from django.db import connections
+from django.db.migrations.executor import MigrationExecutor
+
+from api.management.loop import LoopCommand
+
+logger = logging.getLogger(__name__)
+
+# фоновые циклы: порядок — порядок запуска (OTP-письма первыми)
+JOBS = [
+    "send_emails",
+    "process_appstore_notifications",
+    "verify_receipts",
+    "dispatch_feedback",
+    "expire_entitlements",
+    "reap_pending_signups",
+]
+
+
+class Command(LoopCommand):
+    help = (
+        "Все фоновые циклы (--loop) потоками одного процесса вместо шести отдельных: "
+        "один импорт Django, одна точка для SIGTERM (останавливает все циклы), упавший "
+        "цикл перезапускается с паузой. Запускается отдельным сервисом (deploy/*: worker) "
+        "и ждёт, пока backend применит миграции."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--only", default="", help=f"Через запятую, из: {', '.join(JOBS)}")
+        parser.add_argument("--stagger", type=float, default=2.0,
+                            help="Пауза между запусками циклов, сек — не опрашивать SQLite разом")
+        parser.add_argument("--restart-delay", type=float, default=10.0,
+                            help="Пауза перед перезапуском упавшего цикла, сек (удваивается до 5 минут)")
+
+    def handle(self, *args, **opts):
+        jobs = [j.strip() for j in opts["only"].split(",") if j.strip()] or JOBS
+        unknown = [j for j in jobs if j not in JOBS]
+        if unknown:
+            raise CommandError(f"Unknown jobs: {', '.join(unknown)}")
+
+        self.install_signal_handlers()
+
+        self._wait_for_migrations()
+        threads = []
+        for name in jobs:
+            if self.stopping:
+                break
+            t = threading.Thread(target=self._supervise, args=(name, opts["restart_delay"]),
+                                 name=f"worker-{name}", daemon=True)
+            t.start()
+            threads.append(t)
+            self.sleep(opts["stagger"])
+        self.stdout.write(f"running {', '.join(t.name.removeprefix('worker-') for t in threads)}")
+
+        while not self.stopping:
+            self.sleep(1.0)
+        for t in threads:
+            t.join()
+        self.stdout.write(self.style.SUCCESS("All workers stopped"))
+
+    def _supervise(self, name: str, restart_delay: float):
+        failures = 0
+        while not self.stopping:
+            started = time.monotonic()
+            try:
+                command = load_command_class("api", name)
+                command._stop_event = self._stop_event
+                call_command(command, loop=True)
+            except Exception:
+                logger.exception("Worker %s crashed", name)
+            finally:
+                connections.close_all()
+            if self.stopping:
+                break
+            # проработал дольше паузы — считаем, что это новая, а не повторная поломка
+            failures = 1 if time.monotonic() - started > 300 else failures + 1
+            delay = min(restart_delay * 2 ** (failures - 1), 300)
+            logger.warning("Worker %s exited, restarting in %.0fs", name, delay)
+            self.sleep(delay)
+
+    def _wait_for_migrations(self):
+        # backend применяет миграции в manage.py bootstrap; до этого таблиц может не быть
+        while not self.stopping:
+            try:
+                executor = MigrationExecutor(connections["default"])
+                if not executor.migration_plan(executor.loader.graph.leaf_nodes()):
+                    return
+                self.stdout.write("waiting for migrations...")
+            except Exception as e:
+                self.stdout.write(f"waiting for the database: {e}")
+            finally:
+                connections.close_all()
+            self.sleep(5.0)
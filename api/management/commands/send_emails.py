@@ -0,0 +1,73 @@
+# api/management/commands/send_emails.py
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import close_old_connections
+
+from api.management.loop import LoopCommand
+from api.services.emailer import claim_batch, deliver, release
+
+
+class Command(LoopCommand):
+    help = (
+        "Отправляет письма из очереди OutboundEmail. По умолчанию — один проход; "
+        "--loop — фоновый отправщик: держит одно SMTP-соединение, пока есть работа, "
+        "и закрывает его после простоя."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--interval", type=float, default=settings.EMAIL_OUTBOX_POLL_INTERVAL,
+                            help="Пауза между опросами пустой очереди, сек")
+        parser.add_argument("--idle-close", type=float, default=60.0,
+                            help="Через сколько секунд простоя закрыть SMTP-соединение")
+
+    def handle(self, *args, **opts):
+        if opts["loop"]:
+            self.install_signal_handlers()
+
+        connection = None
+        last_used = 0.0
+        totals = {"sent": 0, "retry": 0, "failed": 0, "expired": 0}
+        try:
+            while not self.stopping:
+                close_old_connections()
+                rows = claim_batch(opts["batch_size"])
+                if rows:
+                    if connection is None:
+                        try:
+                            connection = get_connection()
+                            connection.open()
+                        except Exception as e:
+                            # сервер недоступен — вся пачка уходит на повтор по backoff
+                            release(rows, e)
+                            totals["retry"] += len(rows)
+                            connection = None
+                            if not opts["loop"]:
+                                break
+                            self.sleep(opts["interval"])
+                            continue
+                    stats = deliver(rows, connection)
+                    last_used = time.monotonic()
+                    for k, v in stats.items():
+                        totals[k] += v
+                    if opts["verbosity"] > 1:
+                        self.stdout.write(str(stats))
+                    continue  # очередь могла не опустеть — сразу следующая пачка
+
+                if not opts["loop"]:
+                    break
+                if connection is not None and time.monotonic() - last_used > opts["idle_close"]:
+                    connection.close()
+                    connection = None
+                self.sleep(opts["interval"])
+        finally:
+            if connection is not None:
+                connection.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {totals['sent']}, retry later {totals['retry']}, "
+            f"failed {totals['failed']}, expired {totals['expired']}"
+        ))
@@ -0,0 +1,78 @@
+# api/management/commands/verify_receipts.py
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Min
+from django.utils import timezone
+
+from api.management.loop import LoopCommand
+from api.models import PaymentReceiptIOS, ReceiptStatus
+from api.services.receipts import claim_receipts, verify_batch
+
+
+class Command(LoopCommand):
+    help = (
+        "Проверяет pending-чеки PaymentReceiptIOS через App Store Server API и обновляет "
+        "Entitlement. По умолчанию — один проход по очереди; --loop — фоновый воркер."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true")
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--concurrency", type=int, default=settings.RECEIPT_VERIFY_CONCURRENCY,
+                            help="Сколько запросов к Apple держать одновременно")
+        parser.add_argument("--interval", type=float, default=5.0,
+                            help="Пауза между опросами пустой очереди, сек")
+
+    def handle(self, *args, **opts):
+        if opts["loop"]:
+            self.install_signal_handlers()
+
+        if not (settings.APPSTORE_ROOT_CERT_PATH or settings.APPSTORE_ALLOW_UNTRUSTED_ROOT):
+            self.stderr.write("APPSTORE_ROOT_CERT_PATH is not set — receipts will stay pending until it is")
+
+        totals = {"verified": 0, "rejected": 0, "retry": 0}
+        lags: list[float] = []
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(opts["concurrency"], 1),
+                                thread_name_prefix="receipt-verify") as pool:
+            while not self.stopping:
+                close_old_connections()
+                receipts = claim_receipts(opts["batch_size"])
+                if receipts:
+                    t0 = time.perf_counter()
+                    stats = verify_batch(receipts, pool)
+                    totals["verified"] += stats.verified
+                    totals["rejected"] += stats.rejected
+                    totals["retry"] += stats.retry
+                    lags.extend(stats.lag_seconds)
+                    if opts["verbosity"] > 1:
+                        self.stdout.write(
+                            f"batch {len(receipts)}: verified {stats.verified}, rejected {stats.rejected}, "
+                            f"retry {stats.retry}, {len(receipts) / (time.perf_counter() - t0):.1f}/s, "
+                            f"queue lag {self._queue_lag():.0f}s"
+                        )
+                    continue  # очередь могла не опустеть — сразу следующая пачка
+
+                if not opts["loop"]:
+                    break
+                self.sleep(opts["interval"])
+
+        elapsed = time.perf_counter() - started
+        done = sum(totals.values())
+        avg_lag = sum(lags) / len(lags) if lags else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"Verified {totals['verified']}, rejected {totals['rejected']}, retry later {totals['retry']} "
+            f"in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.1f} receipts/s); "
+            f"avg created->decided {avg_lag:.1f}s, queue lag now {self._queue_lag():.0f}s"
+        ))
+
+    @staticmethod
+    def _queue_lag() -> float:
+        """Возраст самого старого чека, который уже пора проверить."""
+        oldest = (PaymentReceiptIOS.objects
+                  .filter(status=ReceiptStatus.PENDING, next_attempt_at__lte=timezone.now())
+                  .aggregate(m=Min("created_at"))["m"])
+        return (timezone.now() - oldest).total_seconds() if oldest else 0.0
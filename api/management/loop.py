@@ -0,0 +1,35 @@
+# api/management/loop.py
+"""
+Общая часть фоновых команд с --loop (send_emails, verify_receipts, ...).
+
+Команда останавливается по флагу-событию: его ставит SIGTERM/SIGINT, когда
+команда запущена сама по себе, или manage.py run_workers, который держит
+все циклы потоками одного процесса и передаёт им общее событие. Паузы —
+через stopping-событие, поэтому остановка не ждёт конца интервала.
+"""
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+
+class LoopCommand(BaseCommand):
+    def __init__(self, *args, stop_event: threading.Event | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stop_event = stop_event or threading.Event()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stop_event.is_set()
+
+    def install_signal_handlers(self) -> None:
+        # сигналы ставятся только из главного потока; под run_workers их ловит он сам
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self._on_signal)
+            signal.signal(signal.SIGINT, self._on_signal)
+
+    def sleep(self, seconds: float) -> None:
+        self._stop_event.wait(seconds)
+
+    def _on_signal(self, signum, frame):
+        self._stop_event.set()
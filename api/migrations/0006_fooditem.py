@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_analysisusage_dailytokenusage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128)),
+                ('name_key', models.CharField(max_length=128, unique=True)),
+                ('kcal_100g', models.FloatField(default=0)),
+                ('protein_100g', models.FloatField(default=0)),
+                ('fat_100g', models.FloatField(default=0)),
+                ('carbs_100g', models.FloatField(default=0)),
+                ('portion_g', models.FloatField(default=100)),
+                ('source', models.CharField(blank=True, default='bundled', max_length=32)),
+            ],
+        ),
+    ]
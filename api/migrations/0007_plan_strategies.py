@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# параметры, которые до этого были зашиты в utils.plan_from_profile
+MIFFLIN_V1_PARAMS = {
+    "activity_mult": {"sedentary": 1.2, "normal": 1.375, "active": 1.55},
+    "goal_offsets": {"lose": -400, "maintain": 0, "gain": 300},
+    "min_calories": 1200,
+    "macro_split": {"protein": 0.25, "fat": 0.30, "carbs": 0.45},
+}
+
+
+def seed_mifflin_v1(apps, schema_editor):
+    PlanStrategy = apps.get_model("api", "PlanStrategy")
+    PlanStrategy.objects.get_or_create(
+        name="mifflin", version=1,
+        defaults={"params": MIFFLIN_V1_PARAMS, "is_active": True, "note": "Initial hard-coded values"},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_fooditem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nutritionplan',
+            name='is_custom',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='PlanStrategy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32)),
+                ('version', models.PositiveIntegerField()),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('is_active', models.BooleanField(default=False)),
+                ('note', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('name', 'version'), name='uniq_plan_strategy_version'), models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('is_active',), name='one_active_plan_strategy')],
+            },
+        ),
+        migrations.AddField(
+            model_name='nutritionplan',
+            name='strategy',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='plans', to='api.planstrategy'),
+        ),
+        migrations.RunPython(seed_mifflin_v1, migrations.RunPython.noop),
+    ]
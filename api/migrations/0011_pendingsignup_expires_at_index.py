@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pendingsignup',
+            name='expires_at',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
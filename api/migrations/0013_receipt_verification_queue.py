@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:48
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_socialidentity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentreceiptios',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='paymentreceiptios',
+            name='claim',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='paymentreceiptios',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='paymentreceiptios',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='paymentreceiptios',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='api_payment_status_936661_idx'),
+        ),
+    ]
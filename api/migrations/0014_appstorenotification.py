@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:51
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_receipt_verification_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppStoreNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification_uuid', models.CharField(max_length=64, unique=True)),
+                ('notification_type', models.CharField(max_length=64)),
+                ('subtype', models.CharField(blank=True, default='', max_length=64)),
+                ('original_transaction_id', models.CharField(blank=True, db_index=True, default='', max_length=128)),
+                ('payload', models.JSONField()),
+                ('signed_at', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('applied', 'Applied'), ('ignored', 'Ignored')], default='pending', max_length=16)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claim', models.CharField(blank=True, default='', max_length=32)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='api_appstor_status_db075f_idx')],
+            },
+        ),
+    ]
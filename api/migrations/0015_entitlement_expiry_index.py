@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-19 05:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_appstorenotification'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='entitlement',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['expires_at'], name='entitlement_active_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:06
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+# снимок логики services.receipts.merge_duplicate_receipts на момент миграции:
+# миграция не должна меняться вместе с кодом сервиса
+STATUS_RANK = {"verified": 0, "pending": 1, "rejected": 2}
+
+
+def merge_duplicates(apps, schema_editor):
+    # иначе AddConstraint упадёт на уже накопленных повторах;
+    # на больших таблицах можно заранее прогнать manage.py compact_receipts
+    PaymentReceiptIOS = apps.get_model("api", "PaymentReceiptIOS")
+    keys_qs = (PaymentReceiptIOS.objects.values("original_transaction_id", "transaction_id")
+               .annotate(n=Count("id")).filter(n__gt=1)
+               .order_by("original_transaction_id", "transaction_id"))
+    while True:
+        keys = [(k["original_transaction_id"], k["transaction_id"]) for k in keys_qs[:200]]
+        if not keys:
+            return
+        cond = Q()
+        for otid, tid in keys:
+            cond |= Q(original_transaction_id=otid, transaction_id=tid)
+        groups = {}
+        for r in PaymentReceiptIOS.objects.filter(cond).order_by("id"):
+            groups.setdefault((r.original_transaction_id, r.transaction_id), []).append(r)
+        drop = []
+        for rows in groups.values():
+            keep = min(rows, key=lambda r: (STATUS_RANK.get(r.status, 3), r.id))
+            expires = [r.expires_at for r in rows if r.expires_at and r.status == keep.status]
+            if expires and max(expires) != keep.expires_at:
+                PaymentReceiptIOS.objects.filter(pk=keep.pk).update(expires_at=max(expires))
+            drop.extend(r.id for r in rows if r is not keep)
+        PaymentReceiptIOS.objects.filter(id__in=drop).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_entitlement_expiry_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='paymentreceiptios',
+            constraint=models.UniqueConstraint(fields=('original_transaction_id', 'transaction_id'), name='uniq_ios_receipt_transaction'),
+        ),
+    ]
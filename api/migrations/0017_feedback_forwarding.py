@@ -0,0 +1,51 @@
+# Generated by Django 5.2.6 on 2026-10-19 06:08
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_existing_forwarded(apps, schema_editor):
+    # до этой миграции оценки и заявки никуда не пересылались — старые строки
+    # не должны разом уйти в приёмники при первом запуске dispatch_feedback
+    now = timezone.now()
+    for name in ("AppRating", "Report"):
+        apps.get_model("api", name).objects.filter(forwarded_at__isnull=True).update(forwarded_at=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_unique_ios_receipt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apprating',
+            name='forwarded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='forwarded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='apprating',
+            name='forwarded_sinks',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='forwarded_sinks',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.RunPython(mark_existing_forwarded, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='apprating',
+            index=models.Index(condition=models.Q(('forwarded_at__isnull', True), ('sent_to_store', True)), fields=['id'], name='rating_forward_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(condition=models.Q(('forwarded_at__isnull', True)), fields=['id'], name='report_forward_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+from django.db import migrations
+
+
+# снимок SQL из services.report_search на момент миграции:
+# миграция не должна меняться вместе с кодом сервиса
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS api_report_fts USING fts5(
+        name, comment, content='api_report', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """
+    CREATE TRIGGER IF NOT EXISTS api_report_fts_ai AFTER INSERT ON api_report BEGIN
+        INSERT INTO api_report_fts(rowid, name, comment) VALUES (new.id, new.name, new.comment);
+    END""",
+    """
+    CREATE TRIGGER IF NOT EXISTS api_report_fts_ad AFTER DELETE ON api_report BEGIN
+        INSERT INTO api_report_fts(api_report_fts, rowid, name, comment)
+        VALUES ('delete', old.id, old.name, old.comment);
+    END""",
+    """
+    CREATE TRIGGER IF NOT EXISTS api_report_fts_au AFTER UPDATE OF name, comment ON api_report BEGIN
+        INSERT INTO api_report_fts(api_report_fts, rowid, name, comment)
+        VALUES ('delete', old.id, old.name, old.comment);
+        INSERT INTO api_report_fts(rowid, name, comment) VALUES (new.id, new.name, new.comment);
+    END""",
+    "INSERT INTO api_report_fts(api_report_fts) VALUES ('rebuild')",
+]
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS api_report_fts_ai",
+    "DROP TRIGGER IF EXISTS api_report_fts_ad",
+    "DROP TRIGGER IF EXISTS api_report_fts_au",
+    "DROP TABLE IF EXISTS api_report_fts",
+]
+POSTGRES_INSTALL = [
+    "CREATE INDEX IF NOT EXISTS report_search_gin ON api_report USING GIN (("
+    "setweight(to_tsvector('simple', name), 'A') || "
+    "setweight(to_tsvector('simple', comment), 'B')))",
+]
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS report_search_gin",
+]
+
+
+def _run(schema_editor, statements):
+    with schema_editor.connection.cursor() as cur:
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            cur.execute(sql)
+
+
+def install(apps, schema_editor):
+    _run(schema_editor, {"sqlite": SQLITE_INSTALL, "postgresql": POSTGRES_INSTALL})
+
+
+def uninstall(apps, schema_editor):
+    _run(schema_editor, {"sqlite": SQLITE_UNINSTALL, "postgresql": POSTGRES_UNINSTALL})
+
+
+class Migration(migrations.Migration):
+    # SQLite: FTS5 + триггеры, Postgres: GIN по tsvector; другие БД — без индекса
+
+    dependencies = [
+        ('api', '0017_feedback_forwarding'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
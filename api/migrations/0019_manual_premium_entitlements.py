@@ -0,0 +1,38 @@
+# Раньше премиум давал и флаг UserProfile.has_premium (его ставили вручную
+# в админке). Теперь источник — только Entitlement, а флаг — его копия, поэтому
+# таким пользователям создаём бессрочный Entitlement, иначе доступ пропадёт.
+
+from django.db import migrations
+
+MANUAL_PRODUCT_ID = "manual"
+
+
+def grant_manual_premium(apps, schema_editor):
+    Entitlement = apps.get_model("api", "Entitlement")
+    UserProfile = apps.get_model("api", "UserProfile")
+
+    user_ids = list(UserProfile.objects.filter(has_premium=True)
+                    .exclude(user_id__in=Entitlement.objects.values("user_id"))
+                    .values_list("user_id", flat=True))
+    Entitlement.objects.bulk_create(
+        [Entitlement(user_id=user_id, product_id=MANUAL_PRODUCT_ID, is_active=True, expires_at=None)
+         for user_id in user_ids],
+        batch_size=500,
+    )
+
+
+def revoke_manual_premium(apps, schema_editor):
+    Entitlement = apps.get_model("api", "Entitlement")
+    Entitlement.objects.filter(product_id=MANUAL_PRODUCT_ID, original_transaction_id="",
+                               expires_at__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_report_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(grant_manual_premium, revoke_manual_premium),
+    ]
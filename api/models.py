@@ -1,6 +1,7 @@
 from __future__ import annotations
 import uuid
 import hashlib
+import hmac
 import secrets
 import os
 from datetime import timedelta
@@ -53,6 +54,28 @@ class User(AbstractUser):
         return self.email
 
 
+class SocialProvider(models.TextChoices):
+    GOOGLE = "google", "Google"
+    APPLE = "apple", "Apple"
+
+
+class SocialIdentity(models.Model):
+    """Вход через Google/Apple: (provider, sub) -> пользователь. Один индексный поиск на логин."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="social_identities")
+    provider = models.CharField(max_length=16, choices=SocialProvider.choices)
+    sub = models.CharField(max_length=255)
+    email = models.EmailField(blank=True, default="")  # email из токена на момент привязки
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["provider", "sub"], name="uniq_social_identity"),
+        ]
+
+    def __str__(self):
+        return f"{self.provider}:{self.sub} → {self.user_id}"
+
+
 # ========= Enums =========
 
 class Gender(models.TextChoices):
@@ -105,6 +128,61 @@ class UserProfile(models.Model):
         return f"Profile({self.user.email})"
 
 
+class WeightLog(models.Model):
+    """История веса: UserProfile.weight_kg — только последнее значение."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="weight_logs")
+    weight_kg = models.FloatField(validators=[MinValueValidator(20), MaxValueValidator(500)])
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "recorded_at"])]
+
+    def __str__(self):
+        return f"WeightLog({self.user_id}, {self.weight_kg} kg @ {self.recorded_at:%Y-%m-%d})"
+
+
+class PlanStrategy(models.Model):
+    """
+    Версия параметров расчёта плана (см. services/plan_strategies.py).
+    Активна ровно одна; params поверх DEFAULT_PARAMS (вложенные словари — по
+    ключам). Версии не редактируют — заводят новую, иначе планы «этой» версии
+    перестанут ей соответствовать.
+    """
+    name = models.CharField(max_length=32)  # ключ из STRATEGIES
+    version = models.PositiveIntegerField()
+    params = models.JSONField(default=dict, blank=True)
+    is_active = models.BooleanField(default=False)
+    note = models.CharField(max_length=255, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["name", "version"], name="uniq_plan_strategy_version"),
+            models.UniqueConstraint(fields=["is_active"], condition=models.Q(is_active=True),
+                                    name="one_active_plan_strategy"),
+        ]
+
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        from .services.plan_strategies import STRATEGIES, validate_params
+
+        errors = {}
+        if self.name not in STRATEGIES:
+            errors["name"] = f"Unknown strategy, expected one of: {', '.join(STRATEGIES)}"
+        params_errors = validate_params(self.params)
+        if params_errors:
+            errors["params"] = params_errors
+        if errors:
+            raise ValidationError(errors)
+
+    @property
+    def label(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+    def __str__(self):
+        return f"{self.label}{' (active)' if self.is_active else ''}"
+
+
 class NutritionPlan(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="plan")
     calories = models.IntegerField(default=0)
@@ -113,6 +191,11 @@ class NutritionPlan(models.Model):
     carbs_g = models.IntegerField(default=0)
     generated_at = models.DateTimeField(auto_now=True)
 
+    # чем посчитан; null — старый план или заданный вручную
+    strategy = models.ForeignKey(PlanStrategy, on_delete=models.SET_NULL, null=True, blank=True, related_name="plans")
+    # пользователь задал цифры сам (PlanViewSet) — массовый пересчёт не трогает
+    is_custom = models.BooleanField(default=False)
+
     def __str__(self):
         return f"Plan({self.user.email})"
 
@@ -141,9 +224,16 @@ class AppRating(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
     stars = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
     comment = models.TextField(blank=True, default="")
-    sent_to_store = models.BooleanField(default=False)
+    sent_to_store = models.BooleanField(default=False)  # 4+ звёзд — пересылаем (manage.py dispatch_feedback)
+    forwarded_at = models.DateTimeField(null=True, blank=True)
+    forwarded_sinks = models.CharField(max_length=64, blank=True, default="")  # уже доставлено: "webhook,file"
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # очередь dispatch_feedback: только ещё не пересланные
+        indexes = [models.Index(fields=["id"], condition=models.Q(sent_to_store=True, forwarded_at__isnull=True),
+                                name="rating_forward_queue_idx")]
+
     def __str__(self):
         return f"Rating({self.stars})"
 
@@ -162,7 +252,7 @@ class PendingSignup(models.Model):
     otp_salt = models.CharField(max_length=32)
     otp_hash = models.CharField(max_length=64)
     otp_sent_at = models.DateTimeField(default=timezone.now)
-    expires_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)  # для reap_pending_signups
 
     attempts = models.PositiveIntegerField(default=0)
     resends = models.PositiveIntegerField(default=0)
@@ -172,6 +262,7 @@ class PendingSignup(models.Model):
 
     # Длина OTP по умолчанию — 4 (можно задать в .env OTP_LENGTH=4)
     OTP_LENGTH = int(os.getenv("OTP_LENGTH", 4))
+    MAX_ATTEMPTS = 5
 
     locale = models.CharField(max_length=8, default="ru")  # <-- дефолт
 
@@ -207,15 +298,96 @@ class PendingSignup(models.Model):
         obj._raw_otp = code
         return obj
     
+    @classmethod
+    def active_for(cls, email: str):
+        """Незаконченная и не истёкшая сессия для email (последняя), иначе None."""
+        return (cls.objects.filter(email=email, expires_at__gt=timezone.now())
+                .order_by("-created_at").first())
+
+    def restart(self, password_sha256: str, ttl_minutes: int = 10, locale: str = "ru") -> str:
+        """
+        Повторный /register/start/ на тот же email: та же сессия, новый код и срок.
+        attempts не сбрасываем — иначе рестарт давал бы новые попытки перебора.
+        """
+        code = self.make_otp()
+        self.password_sha256 = password_sha256
+        self.otp_salt = secrets.token_hex(8)
+        self.otp_hash = self.hash_otp(code, self.otp_salt)
+        self.otp_sent_at = timezone.now()
+        self.expires_at = self.otp_sent_at + timedelta(minutes=ttl_minutes)
+        self.locale = locale
+        self.save(update_fields=["password_sha256", "otp_salt", "otp_hash", "otp_sent_at",
+                                 "expires_at", "locale", "updated_at"])
+        self._raw_otp = code
+        return code
+
+    def take_attempt(self) -> bool:
+        """
+        Списывает попытку одним UPDATE ... attempts = attempts + 1 WHERE attempts < MAX.
+        False — попытки кончились (в т.ч. если их параллельно израсходовали другие запросы).
+        """
+        taken = (PendingSignup.objects
+                 .filter(pk=self.pk, attempts__lt=self.MAX_ATTEMPTS)
+                 .update(attempts=models.F("attempts") + 1, updated_at=timezone.now()))
+        self.attempts += 1
+        return bool(taken)
+
+    def check_otp(self, code: str) -> bool:
+        # сравнение за постоянное время
+        return hmac.compare_digest(self.hash_otp(code, self.otp_salt), self.otp_hash)
+
     def verify_and_consume(self, code: str) -> bool:
         """Проверяет код и инкрементит attempts. Возвращает True/False."""
-        self.attempts += 1
-        ok = (self.hash_otp(code, self.otp_salt) == self.otp_hash)
-        self.save(update_fields=["attempts", "updated_at"])
-        return ok
+        return self.take_attempt() and self.check_otp(code)
     
     
 
+class RateLimitBucket(models.Model):
+    """Token bucket для rate limit (общий для всех воркеров). См. services/rate_limit.py."""
+    key = models.CharField(max_length=128, primary_key=True)
+    tokens = models.FloatField()
+    refilled_at = models.FloatField(db_index=True)  # unix time последнего пересчёта; индекс — для чистки
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.2f}"
+
+
+# ========= Outbound email =========
+
+class EmailStatus(models.TextChoices):
+    PENDING = "pending", "Pending"
+    SENDING = "sending", "Sending"
+    SENT = "sent", "Sent"
+    FAILED = "failed", "Failed"
+
+
+class OutboundEmail(models.Model):
+    """Очередь писем: запрос только кладёт строку, отправляет команда send_emails."""
+    kind = models.CharField(max_length=32, default="generic")  # otp / ...
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    text_body = models.TextField()
+    html_body = models.TextField(blank=True, default="")
+
+    status = models.CharField(max_length=16, choices=EmailStatus.choices, default=EmailStatus.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # после этого момента письмо уже бессмысленно (истёкший OTP) — не шлём
+    expires_at = models.DateTimeField(null=True, blank=True)
+    claim = models.CharField(max_length=32, blank=True, default="")  # какой отправщик взял
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self):
+        return f"{self.kind} → {self.to_email} [{self.status}]"
+
+
 class ReceiptStatus(models.TextChoices):
     PENDING = "pending", "Pending"
     VERIFIED = "verified", "Verified"
@@ -251,11 +423,23 @@ class PaymentReceiptIOS(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     verified_at = models.DateTimeField(blank=True, null=True)
 
+    # очередь верификации (manage.py verify_receipts)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim = models.CharField(max_length=32, blank=True, default="")  # какой воркер взял
+    claimed_at = models.DateTimeField(blank=True, null=True)
+
     class Meta:
         indexes = [
             models.Index(fields=["user"]),
             models.Index(fields=["original_transaction_id"]),
             models.Index(fields=["transaction_id"]),
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+        constraints = [
+            # приложение шлёт тот же чек на каждом запуске/restore — храним один раз
+            models.UniqueConstraint(fields=["original_transaction_id", "transaction_id"],
+                                    name="uniq_ios_receipt_transaction"),
         ]
 
     def mark_verified(self, expires_at=None):
@@ -263,13 +447,15 @@ class PaymentReceiptIOS(models.Model):
         self.verified_at = timezone.now()
         if expires_at:
             self.expires_at = expires_at
-        self.save(update_fields=["status", "verified_at", "expires_at"])
+        self.claim = ""
+        self.save(update_fields=["status", "verified_at", "expires_at", "claim"])
 
     def mark_rejected(self, reason: str):
         self.status = ReceiptStatus.REJECTED
         self.status_reason = reason[:2000]
         self.verified_at = timezone.now()
-        self.save(update_fields=["status", "status_reason", "verified_at"])
+        self.claim = ""
+        self.save(update_fields=["status", "status_reason", "verified_at", "claim"])
 
 
 class Entitlement(models.Model):
@@ -285,8 +471,52 @@ class Entitlement(models.Model):
 
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # manage.py expire_entitlements: is_active AND expires_at <= now. Частичный индекс,
+        # а не (is_active, expires_at): на SQLite Django пишет фильтр как голое "is_active",
+        # и по составному индексу поиск не идёт (SCAN); частичный подходит обеим БД
+        indexes = [models.Index(fields=["expires_at"], condition=models.Q(is_active=True),
+                                name="entitlement_active_expiry_idx")]
+
     def __str__(self):
         return f"Entitlement({self.user.email}, active={self.is_active})"
+
+
+class NotificationStatus(models.TextChoices):
+    PENDING = "pending", "Pending"
+    APPLIED = "applied", "Applied"
+    IGNORED = "ignored", "Ignored"   # тип без влияния на доступ или неизвестная подписка
+
+
+class AppStoreNotification(models.Model):
+    """
+    Входящие App Store Server Notifications v2. Вебхук проверяет подпись,
+    кладёт строку и сразу отвечает 200; Entitlement обновляет команда
+    process_appstore_notifications. notification_uuid уникален — повторная
+    доставка от Apple не создаёт второй записи.
+    """
+    notification_uuid = models.CharField(max_length=64, unique=True)
+    notification_type = models.CharField(max_length=64)
+    subtype = models.CharField(max_length=64, blank=True, default="")
+    original_transaction_id = models.CharField(max_length=128, blank=True, default="", db_index=True)
+    payload = models.JSONField()  # проверенный decoded signedPayload
+    signed_at = models.DateTimeField(null=True, blank=True)  # signedDate от Apple
+
+    status = models.CharField(max_length=16, choices=NotificationStatus.choices, default=NotificationStatus.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim = models.CharField(max_length=32, blank=True, default="")
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"])]
+
+    def __str__(self):
+        return f"{self.notification_type}/{self.subtype or '-'} {self.original_transaction_id} [{self.status}]"
     
     
 class Report(models.Model):
@@ -306,6 +536,88 @@ class Report(models.Model):
     photo = models.ImageField(upload_to="uploads/reports/", null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    forwarded_at = models.DateTimeField(null=True, blank=True)  # manage.py dispatch_feedback
+    forwarded_sinks = models.CharField(max_length=64, blank=True, default="")  # уже доставлено: "webhook,file"
+
+    class Meta:
+        indexes = [models.Index(fields=["id"], condition=models.Q(forwarded_at__isnull=True),
+                                name="report_forward_queue_idx")]
+
+    def __str__(self):
+        return f"Report({self.name})"
+
+# ========= AI usage / budgets =========
+
+class AnalysisUsage(models.Model):
+    """
+    Один вызов vision-модели (AnalyzePhoto): токены, размер картинки, латентность.
+    Стоимость не храним — считаем в отчёте по текущим ценам из settings.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="analysis_usage")
+    meal = models.ForeignKey(Meal, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    model = models.CharField(max_length=64, blank=True, default="")
+
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    image_bytes = models.PositiveIntegerField(default=0)
+    latency_ms = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=1)  # 2 = был повторный запрос
+    ok = models.BooleanField(default=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "created_at"]),
+            models.Index(fields=["created_at"]),
+        ]
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def __str__(self):
+        return f"AnalysisUsage({self.user_id}, {self.total_tokens} tok)"
+
+
+class DailyTokenUsage(models.Model):
+    """
+    Суточный счётчик токенов на пользователя. Пишется пачками из
+    in-memory счётчика (services/usage.py), а не на каждый запрос.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="daily_token_usage")
+    day = models.DateField()
+    tokens = models.PositiveIntegerField(default=0)
+    calls = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "day"], name="uniq_daily_token_usage_user_day"),
+        ]
+
+    def __str__(self):
+        return f"DailyTokenUsage({self.user_id}, {self.day}, {self.tokens})"
+
+
+# ========= Food composition =========
+
+class FoodItem(models.Model):
+    """
+    Строка таблицы пищевой ценности (на 100 г). Грузится из api/data/foods.csv
+    командой load_foods. name_key — нормализованное имя (см. services/nutrition.py),
+    по нему идёт префиксный поиск диапазоном [q, q + U+FFFF) — это обычный
+    btree-индекс, одинаково работает на SQLite и Postgres.
+    """
+    name = models.CharField(max_length=128)
+    name_key = models.CharField(max_length=128, unique=True)
+
+    kcal_100g = models.FloatField(default=0)
+    protein_100g = models.FloatField(default=0)
+    fat_100g = models.FloatField(default=0)
+    carbs_100g = models.FloatField(default=0)
+    portion_g = models.FloatField(default=100)  # типичная порция / «1 шт.»
+
+    source = models.CharField(max_length=32, blank=True, default="bundled")
 
     def __str__(self):
-        return f"Report({self.name}, {self.phone_number})"
\ No newline at end of file
+        return self.name
@@ -2,7 +2,7 @@ from django.contrib.auth import get_user_model, authenticate
 from django.contrib.auth.password_validation import validate_password
 from rest_framework import serializers
 
-from .models import UserProfile, Meal, NutritionPlan, AppRating, PendingSignup, Report
+from .models import UserProfile, Meal, NutritionPlan, AppRating, PendingSignup, Report, WeightLog
 
 User = get_user_model()
 
@@ -26,12 +26,17 @@ class UserProfileSerializer(serializers.ModelSerializer):
             "desired_weight_kg", "allergies", "has_premium", "trial_ends_at",
             "created_at", "updated_at",
         ]
+        # премиум выдаёт сервер (чеки App Store, админка) — клиент его не пишет
+        read_only_fields = ["has_premium", "trial_ends_at"]
 
 
 class NutritionPlanSerializer(serializers.ModelSerializer):
+    strategy = serializers.CharField(source="strategy.label", read_only=True, default=None)
+
     class Meta:
         model = NutritionPlan
-        fields = ["calories", "protein_g", "fat_g", "carbs_g", "generated_at"]
+        fields = ["calories", "protein_g", "fat_g", "carbs_g", "generated_at", "strategy", "is_custom"]
+        read_only_fields = ["is_custom"]
 
 
 class MealSerializer(serializers.ModelSerializer):
@@ -44,10 +49,18 @@ class MealSerializer(serializers.ModelSerializer):
         ]
 
 
+class WeightLogSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WeightLog
+        fields = ["id", "weight_kg", "recorded_at"]
+        extra_kwargs = {"recorded_at": {"required": False}}
+
+
 class AppRatingSerializer(serializers.ModelSerializer):
     class Meta:
         model = AppRating
         fields = ["id", "stars", "comment", "sent_to_store", "created_at"]
+        read_only_fields = ["sent_to_store"]
 
 
 # ===== OTP Signup flow (email-only) =====
@@ -63,6 +76,7 @@ class StartSignupSerializer(serializers.Serializer):
         if User.objects.filter(email=email).exists():
             raise serializers.ValidationError("User with this email already exists")
         validate_password(attrs["password"])
+        attrs["email"] = email
         return attrs
 
 
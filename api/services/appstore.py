@@ -0,0 +1,227 @@
+# api/services/appstore.py
+"""
+Клиент App Store Server API и проверка подписанных (JWS) ответов Apple.
+
+    info = get_transaction("2000000123456789")   # dict из signedTransactionInfo
+
+Авторизация — ES256 JWT из ключа In-App Purchase (APPSTORE_ISSUER_ID,
+APPSTORE_KEY_ID, APPSTORE_PRIVATE_KEY_PATH), токен живёт 20 минут и
+переиспользуется. Ответ Apple — JWS с цепочкой x5c: подпись проверяется
+ключом листового сертификата, цепочка — до корня Apple (APPSTORE_ROOT_CERT_PATH;
+для локальной заглушки — её собственный корень). Базовый URL переопределяется
+APPSTORE_API_URL — так воркер можно гонять против заглушки.
+"""
+from __future__ import annotations
+
+import base64
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache
+from pathlib import Path
+
+import jwt
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from django.conf import settings
+
+from .jwks import http_session
+
+PRODUCTION_URL = "https://api.storekit.itunes.apple.com"
+SANDBOX_URL = "https://api.storekit-sandbox.itunes.apple.com"
+
+
+class AppStoreError(Exception):
+    """Временная ошибка (сеть, 429, 5xx, конфиг) — чек стоит проверить позже."""
+
+
+class TransactionNotFound(Exception):
+    """Apple не знает такой транзакции — чек отклоняем."""
+
+
+class InvalidSignedData(Exception):
+    """JWS не прошёл проверку подписи/цепочки."""
+
+
+# ---------- JWS ----------
+
+@lru_cache(maxsize=1)
+def _trusted_root() -> x509.Certificate | None:
+    path = settings.APPSTORE_ROOT_CERT_PATH
+    if not path:
+        return None
+    data = Path(path).read_bytes()
+    if b"-----BEGIN" in data:
+        return x509.load_pem_x509_certificate(data)
+    return x509.load_der_x509_certificate(data)
+
+
+# маркеры Apple, как в app-store-server-library: без них под корнем Apple
+# подписать JWS мог бы любой сертификат, ключ от которого есть у разработчиков
+# (например, сертификат обработки Apple Pay)
+LEAF_OID = x509.ObjectIdentifier("1.2.840.113635.100.6.11.1")  # подпись App Store
+INTERMEDIATE_OID = x509.ObjectIdentifier("1.2.840.113635.100.6.2.1")  # Apple WWDR CA
+
+
+def _has_extension(cert: x509.Certificate, oid: x509.ObjectIdentifier) -> bool:
+    try:
+        cert.extensions.get_extension_for_oid(oid)
+    except x509.ExtensionNotFound:
+        return False
+    return True
+
+
+def _is_ca(cert: x509.Certificate) -> bool:
+    try:
+        return cert.extensions.get_extension_for_class(x509.BasicConstraints).value.ca
+    except x509.ExtensionNotFound:
+        return False
+
+
+_chains_lock = threading.Lock()
+# x5c (как пришёл, base64) -> (ключ листа, до какого времени цепочка годна)
+_verified_chains: dict[tuple[str, ...], tuple[object, datetime]] = {}
+_MAX_CACHED_CHAINS = 64
+
+
+def _leaf_key(x5c: tuple[str, ...]):
+    """
+    Проверяет цепочку x5c (лист и промежуточный — с маркерами Apple,
+    промежуточный — CA, корень — APPSTORE_ROOT_CERT_PATH) и возвращает
+    публичный ключ листа. Apple подписывает
+    все ответы и уведомления одними и теми же сертификатами, поэтому проверенная
+    цепочка кэшируется до истечения самого раннего сертификата в ней.
+    """
+    now = datetime.now(dt_timezone.utc)
+    cached = _verified_chains.get(x5c)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+
+    try:
+        chain = [x509.load_der_x509_certificate(base64.b64decode(c)) for c in x5c]
+    except Exception as e:
+        raise InvalidSignedData(f"bad x5c: {e}")
+    if len(chain) != 3:
+        raise InvalidSignedData(f"x5c must be leaf, intermediate and root, got {len(chain)} certificates")
+    leaf, intermediate, _ = chain
+    if not _has_extension(leaf, LEAF_OID):
+        raise InvalidSignedData("leaf certificate is not an App Store signing certificate")
+    if not _has_extension(intermediate, INTERMEDIATE_OID):
+        raise InvalidSignedData("intermediate certificate is not Apple WWDR CA")
+    if not _is_ca(intermediate):
+        raise InvalidSignedData("intermediate certificate is not a CA")
+    try:
+        for cert, issuer in zip(chain, chain[1:]):
+            cert.verify_directly_issued_by(issuer)
+    except Exception as e:
+        raise InvalidSignedData(f"x5c chain does not verify: {e}")
+    for cert in chain:
+        if not (cert.not_valid_before_utc <= now <= cert.not_valid_after_utc):
+            raise InvalidSignedData(f"certificate expired: {cert.subject.rfc4514_string()}")
+
+    root = _trusted_root()
+    if root is None:
+        if not settings.APPSTORE_ALLOW_UNTRUSTED_ROOT:
+            # ошибка конфигурации, а не подписи: чек/уведомление повторим, когда корень появится
+            raise AppStoreError("APPSTORE_ROOT_CERT_PATH is not configured")
+    elif chain[-1].fingerprint(hashes.SHA256()) != root.fingerprint(hashes.SHA256()):
+        raise InvalidSignedData("x5c chain is not rooted in the trusted Apple root")
+
+    key = leaf.public_key()
+    with _chains_lock:
+        if len(_verified_chains) >= _MAX_CACHED_CHAINS:
+            _verified_chains.clear()
+        _verified_chains[x5c] = (key, min(c.not_valid_after_utc for c in chain))
+    return key
+
+
+def decode_signed(signed: str) -> dict:
+    """
+    Проверяет JWS от Apple (signedTransactionInfo, signedPayload, ...) и
+    возвращает payload. Цепочка x5c: лист <- промежуточный <- корень.
+    """
+    try:
+        header = jwt.get_unverified_header(signed)
+    except Exception as e:
+        raise InvalidSignedData(f"bad JWS header: {e}")
+    key = _leaf_key(tuple(header.get("x5c") or ()))
+    try:
+        return jwt.decode(signed, key=key, algorithms=["ES256"],
+                          options={"verify_aud": False, "verify_exp": False})
+    except jwt.PyJWTError as e:
+        raise InvalidSignedData(f"JWS signature: {e}")
+
+
+def ms_to_datetime(ms) -> datetime | None:
+    if ms in (None, ""):
+        return None
+    return datetime.fromtimestamp(int(ms) / 1000, tz=dt_timezone.utc)
+
+
+# ---------- API ----------
+
+_token_lock = threading.Lock()
+_token: tuple[float, str] | None = None
+
+
+def _auth_token() -> str:
+    global _token
+    cached = _token
+    if cached and cached[0] > time.time() + 60:
+        return cached[1]
+    with _token_lock:
+        if not (settings.APPSTORE_ISSUER_ID and settings.APPSTORE_KEY_ID and settings.APPSTORE_PRIVATE_KEY_PATH):
+            raise AppStoreError("App Store Server API key is not configured")
+        key = Path(settings.APPSTORE_PRIVATE_KEY_PATH).read_text()
+        now = int(time.time())
+        exp = now + 20 * 60  # Apple допускает не больше часа
+        token = jwt.encode(
+            {"iss": settings.APPSTORE_ISSUER_ID, "iat": now, "exp": exp,
+             "aud": "appstoreconnect-v1", "bid": settings.APPSTORE_BUNDLE_ID},
+            key, algorithm="ES256", headers={"kid": settings.APPSTORE_KEY_ID, "typ": "JWT"},
+        )
+        _token = (exp, token)
+        return token
+
+
+def _base_urls() -> list[str]:
+    if settings.APPSTORE_API_URL:
+        return [settings.APPSTORE_API_URL.rstrip("/")]
+    env = settings.APPSTORE_ENVIRONMENT
+    if env == "sandbox":
+        return [SANDBOX_URL]
+    if env == "production":
+        return [PRODUCTION_URL]
+    # auto: как советует Apple — сначала production, на 404 — sandbox (TestFlight/ревью)
+    return [PRODUCTION_URL, SANDBOX_URL]
+
+
+def get_transaction(transaction_id: str) -> dict:
+    """GET /inApps/v1/transactions/{id} -> проверенный payload транзакции."""
+    headers = {"Authorization": f"Bearer {_auth_token()}"}
+    for base in _base_urls():
+        try:
+            resp = http_session().get(f"{base}/inApps/v1/transactions/{transaction_id}",
+                                      headers=headers, timeout=settings.APPSTORE_HTTP_TIMEOUT)
+        except requests.RequestException as e:
+            raise AppStoreError(f"network: {e}")
+        if resp.status_code == 404:
+            continue
+        if resp.status_code == 401:
+            raise AppStoreError("401 from App Store Server API (check key/issuer)")
+        if resp.status_code == 429 or resp.status_code >= 500:
+            raise AppStoreError(f"{resp.status_code} from App Store Server API")
+        if resp.status_code != 200:
+            try:
+                body = resp.json()
+            except ValueError:
+                body = {}
+            # 400 с errorCode — например, некорректный id: повтор не поможет
+            raise TransactionNotFound(f"{resp.status_code}: {body.get('errorMessage') or body}")
+        try:
+            signed = resp.json()["signedTransactionInfo"]
+        except (ValueError, KeyError):
+            raise AppStoreError("malformed response: no signedTransactionInfo")
+        return decode_signed(signed)
+    raise TransactionNotFound(f"transaction {transaction_id} not found")
@@ -0,0 +1,179 @@
+# api/services/appstore_notifications.py
+"""
+App Store Server Notifications v2: приём и пакетная обработка.
+
+Вебхук вызывает ingest(signedPayload): подпись проверяется (цепочка x5c
+кэшируется в appstore.py), вложенные signedTransactionInfo/signedRenewalInfo
+раскрываются тут же, строка AppStoreNotification вставляется одним
+INSERT ... ON CONFLICT DO NOTHING по notification_uuid — повтор от Apple
+ничего не меняет. Ответ Apple — сразу.
+
+Команда process_appstore_notifications забирает пачки claim-токеном и
+apply_batch() применяет их к Entitlement: продления — одним upsert-ом
+(receipts.upsert_entitlements), истечения/отзывы — одним UPDATE.
+Подписка ищется по original_transaction_id в Entitlement и проверенных
+чеках; не нашли (уведомление пришло раньше чека) — повтор позже.
+Apple не гарантирует порядок доставки: уведомление старше (по signedDate)
+уже применённого к той же подписке пропускается — последнее применённое
+signed_at берётся из самих APPLIED-строк. Уведомления из окружения не из
+APPSTORE_NOTIFICATION_ENVIRONMENTS (sandbox на боевом сервере) не применяются.
+"""
+from __future__ import annotations
+
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from . import entitlements
+from .appstore import InvalidSignedData, decode_signed, ms_to_datetime
+from .receipts import backoff, upsert_entitlements
+
+# продлевают доступ до expiresDate
+GRANT_TYPES = {"SUBSCRIBED", "DID_RENEW", "OFFER_REDEEMED", "RENEWAL_EXTENDED", "REFUND_REVERSED"}
+# закрывают доступ
+REVOKE_TYPES = {"EXPIRED", "GRACE_PERIOD_EXPIRED", "REVOKE", "REFUND"}
+
+
+def ingest(signed_payload: str) -> str:
+    """Проверяет и сохраняет уведомление, возвращает notificationUUID."""
+    from ..models import AppStoreNotification
+
+    payload = decode_signed(signed_payload)
+    data = payload.get("data") or {}
+    if settings.APPSTORE_BUNDLE_ID and data.get("bundleId") not in (None, settings.APPSTORE_BUNDLE_ID):
+        raise InvalidSignedData(f"bundleId mismatch: {data.get('bundleId')}")
+    notification_uuid = payload.get("notificationUUID")
+    if not notification_uuid:
+        raise InvalidSignedData("notificationUUID is missing")
+
+    # вложенные JWS проверяем сейчас — при обработке они уже не нужны
+    for signed_key, key in (("signedTransactionInfo", "transactionInfo"), ("signedRenewalInfo", "renewalInfo")):
+        if data.get(signed_key):
+            data[key] = decode_signed(data.pop(signed_key))
+    info = data.get("transactionInfo") or data.get("renewalInfo") or {}
+
+    AppStoreNotification.objects.bulk_create([AppStoreNotification(
+        notification_uuid=notification_uuid,
+        notification_type=payload.get("notificationType", ""),
+        subtype=payload.get("subtype") or "",
+        original_transaction_id=str(info.get("originalTransactionId") or ""),
+        payload=payload,
+        signed_at=ms_to_datetime(payload.get("signedDate")),
+    )], ignore_conflicts=True)
+    return notification_uuid
+
+
+def claim_notifications(limit: int) -> list:
+    from ..models import AppStoreNotification, NotificationStatus
+
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.RECEIPT_CLAIM_TIMEOUT)
+    due = Q(status=NotificationStatus.PENDING) & (
+        # брошенные упавшим воркером; отпущенные на повтор (claim="") ждут next_attempt_at
+        Q(claim="", next_attempt_at__lte=now) | Q(claim__gt="", claimed_at__lt=stale)
+    )
+    ids = list(AppStoreNotification.objects.filter(due).order_by("next_attempt_at", "id")
+               .values_list("id", flat=True)[:limit])
+    if not ids:
+        return []
+    claim = uuid.uuid4().hex
+    AppStoreNotification.objects.filter(due, id__in=ids).update(claim=claim, claimed_at=now)
+    return list(AppStoreNotification.objects.filter(claim=claim))
+
+
+def _subscription_owners(otids) -> dict[str, int]:
+    from ..models import Entitlement, PaymentReceiptIOS, ReceiptStatus
+
+    owners = dict(PaymentReceiptIOS.objects
+                  .filter(original_transaction_id__in=otids, status=ReceiptStatus.VERIFIED)
+                  .values_list("original_transaction_id", "user_id"))
+    owners.update(Entitlement.objects.filter(original_transaction_id__in=otids)
+                  .values_list("original_transaction_id", "user_id"))
+    return owners
+
+
+def _last_applied(otids) -> dict[str, object]:
+    """otid -> signed_at последнего применённого уведомления (индекс по original_transaction_id)."""
+    from ..models import AppStoreNotification, NotificationStatus
+
+    return dict(AppStoreNotification.objects
+                .filter(original_transaction_id__in=otids, status=NotificationStatus.APPLIED,
+                        signed_at__isnull=False)
+                .values("original_transaction_id").annotate(last=Max("signed_at"))
+                .values_list("original_transaction_id", "last"))
+
+
+def apply_batch(rows) -> Counter:
+    from ..models import AppStoreNotification, Entitlement, NotificationStatus
+
+    stats: Counter = Counter()
+    now = timezone.now()
+    rows = sorted(rows, key=lambda n: (n.signed_at or n.received_at, n.id))
+    otids = {n.original_transaction_id for n in rows if n.original_transaction_id}
+    owners = _subscription_owners(otids)
+    # очередь разбирает один поток (run_workers), поэтому чтение вне транзакции не гонится
+    last_applied = _last_applied(otids)
+
+    applied, retry = [], []
+    ignored: dict[str, list[int]] = {}  # причина -> id
+    latest = {}  # otid -> последнее по signedDate уведомление, влияющее на доступ
+    for n in rows:
+        environment = (n.payload.get("data") or {}).get("environment")
+        last = last_applied.get(n.original_transaction_id)
+        if n.notification_type not in GRANT_TYPES | REVOKE_TYPES and not (
+                n.notification_type == "DID_FAIL_TO_RENEW" and n.subtype == "GRACE_PERIOD"):
+            # TEST, DID_CHANGE_RENEWAL_PREF, PRICE_INCREASE, ...
+            ignored.setdefault("no effect on access", []).append(n.id)
+        elif environment not in settings.APPSTORE_NOTIFICATION_ENVIRONMENTS:
+            ignored.setdefault(f"environment {environment} is not accepted", []).append(n.id)
+        elif last and n.signed_at and n.signed_at < last:
+            ignored.setdefault("older than the last applied notification", []).append(n.id)
+        elif n.original_transaction_id not in owners:
+            if n.attempts + 1 >= settings.APPSTORE_NOTIFICATION_MAX_ATTEMPTS:
+                ignored.setdefault("unknown originalTransactionId", []).append(n.id)
+            else:
+                retry.append(n)
+        else:
+            if n.original_transaction_id in latest:
+                applied.append(latest[n.original_transaction_id].id)  # перекрыто более новым
+            latest[n.original_transaction_id] = n
+
+    grants, revoked = {}, []
+    for otid, n in latest.items():
+        data = n.payload.get("data") or {}
+        tx, renewal = data.get("transactionInfo") or {}, data.get("renewalInfo") or {}
+        if n.notification_type in REVOKE_TYPES:
+            revoked.append(otid)
+        else:
+            # DID_FAIL_TO_RENEW/GRACE_PERIOD — доступ до конца льготного периода
+            expires_at = ms_to_datetime(renewal.get("gracePeriodExpiresDate") or tx.get("expiresDate"))
+            grants[owners[otid]] = (tx.get("productId", ""), otid, expires_at)
+        applied.append(n.id)
+
+    with transaction.atomic():
+        upsert_entitlements(grants)
+        if revoked:
+            # гасим только строки этих подписок; у владельца может быть другая
+            # (новая подписка, выданный вручную премиум) — её и has_premium не трогаем
+            rows = Entitlement.objects.filter(original_transaction_id__in=revoked, is_active=True)
+            users = list(rows.values_list("user_id", flat=True))
+            rows.update(is_active=False, updated_at=now)
+            entitlements.resync_profiles(users)
+
+        done = AppStoreNotification.objects.filter(claim__in={n.claim for n in rows})
+        done.filter(id__in=applied).update(status=NotificationStatus.APPLIED, processed_at=now, claim="")
+        for reason, ids in ignored.items():
+            done.filter(id__in=ids).update(status=NotificationStatus.IGNORED, processed_at=now, claim="",
+                                           last_error=reason)
+        for n in retry:
+            AppStoreNotification.objects.filter(pk=n.pk).update(
+                attempts=n.attempts + 1, next_attempt_at=now + backoff(n.attempts + 1), claim="",
+                last_error="unknown originalTransactionId")
+
+    stats.update(applied=len(applied), ignored=sum(map(len, ignored.values())), retry=len(retry))
+    return stats
@@ -1,23 +1,180 @@
-# mailer.py
-from django.core.mail import EmailMultiAlternatives
-from django.conf import settings
+# api/services/emailer.py
+"""
+Исходящая почта через таблицу-очередь OutboundEmail.
+
+Запрос только кладёт письмо (enqueue_*), отправляет команда send_emails:
+пачками, по одному постоянному SMTP-соединению, с повторами по
+экспоненциальной задержке. EMAIL_OUTBOX=False (по умолчанию для console
+backend) — письмо отправляется сразу в запросе, как раньше, но тоже
+оставляет строку со статусом.
+
+Тексты писем с секретами (SECRET_KINDS: OTP) живут в таблице только пока
+письмо может уйти: после отправки, истечения или отказа они стираются.
+"""
 import logging
+import smtplib
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import Q
+from django.utils import timezone
+
 logger = logging.getLogger(__name__)
 
-def send_otp_email_html(email: str, otp: str, ttl_minutes: int = 10) -> tuple[bool, str|None]:
+# письма с одноразовыми кодами: текст стирается, как только он больше не нужен
+SECRET_KINDS = ("otp",)
+
+
+def render_otp_email(otp: str, ttl_minutes: int = 10) -> tuple[str, str, str]:
     subject = "Ваш код подтверждения"
     text_body = f"Ваш код: {otp}. Действует {ttl_minutes} мин."
     html_body = f"Ваш код подтверждения: <b>{otp}</b><br/>Код действует {ttl_minutes} минут."
+    return subject, text_body, html_body
+
+
+def _message(row, connection=None) -> EmailMultiAlternatives:
+    msg = EmailMultiAlternatives(
+        subject=row.subject,
+        body=row.text_body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[row.to_email],
+        connection=connection,
+    )
+    if row.html_body:
+        msg.attach_alternative(row.html_body, "text/html")
+    return msg
+
+
+def enqueue_email(to_email: str, subject: str, text_body: str, html_body: str = "",
+                  kind: str = "generic", expires_at=None):
+    from ..models import OutboundEmail
+
+    row = OutboundEmail.objects.create(
+        kind=kind, to_email=to_email, subject=subject,
+        text_body=text_body, html_body=html_body, expires_at=expires_at,
+    )
+    if not settings.EMAIL_OUTBOX:
+        deliver([row])
+    return row
+
+
+def enqueue_otp_email(email: str, otp: str, ttl_minutes: int = 10):
+    subject, text_body, html_body = render_otp_email(otp, ttl_minutes)
+    return enqueue_email(email, subject, text_body, html_body, kind="otp",
+                         expires_at=timezone.now() + timedelta(minutes=ttl_minutes))
+
+
+def send_otp_email_html(email: str, otp: str, ttl_minutes: int = 10) -> tuple[bool, str | None]:
+    """Синхронная отправка мимо очереди (для shell/отладки)."""
+    subject, text_body, html_body = render_otp_email(otp, ttl_minutes)
     try:
-        msg = EmailMultiAlternatives(
-            subject=subject,
-            body=text_body,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[email],
-        )
+        msg = EmailMultiAlternatives(subject=subject, body=text_body,
+                                     from_email=settings.DEFAULT_FROM_EMAIL, to=[email])
         msg.attach_alternative(html_body, "text/html")
         sent = msg.send(fail_silently=False)  # вернёт 1 при успехе
         return (sent == 1, None)
     except Exception as e:
         logger.exception("Ошибка при отправке OTP")
         return (False, str(e))
+
+
+# ---------- отправка очереди ----------
+
+def backoff(attempts: int) -> timedelta:
+    delay = settings.EMAIL_OUTBOX_BACKOFF * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(delay, 3600))
+
+
+def claim_batch(limit: int) -> list:
+    """
+    Забирает до limit писем, которые пора слать. claim-токен в UPDATE
+    гарантирует, что два отправщика не возьмут одно письмо; «зависшие»
+    в sending дольше EMAIL_OUTBOX_LOCK_TIMEOUT (упавший процесс) берутся снова.
+    """
+    from ..models import EmailStatus, OutboundEmail
+
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.EMAIL_OUTBOX_LOCK_TIMEOUT)
+    due = (Q(status=EmailStatus.PENDING, next_attempt_at__lte=now)
+           | Q(status=EmailStatus.SENDING, locked_at__lt=stale))
+    ids = list(OutboundEmail.objects.filter(due).order_by("next_attempt_at", "id")
+               .values_list("id", flat=True)[:limit])
+    if not ids:
+        return []
+    claim = uuid.uuid4().hex
+    OutboundEmail.objects.filter(due, id__in=ids).update(
+        status=EmailStatus.SENDING, claim=claim, locked_at=now)
+    return list(OutboundEmail.objects.filter(claim=claim, status=EmailStatus.SENDING).order_by("id"))
+
+
+def _retry_later(row, error: Exception) -> bool:
+    """Записывает неудачную попытку. True — будет ещё попытка, False — сдались."""
+    from ..models import EmailStatus, OutboundEmail
+
+    attempts = row.attempts + 1
+    give_up = attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS
+    OutboundEmail.objects.filter(pk=row.pk).update(
+        status=EmailStatus.FAILED if give_up else EmailStatus.PENDING,
+        attempts=attempts,
+        next_attempt_at=timezone.now() + backoff(attempts),
+        last_error=f"{type(error).__name__}: {error}"[:2000],
+        claim="",
+    )
+    logger.warning("Email %s to %s failed (attempt %d): %s", row.pk, row.to_email, attempts, error)
+    return not give_up
+
+
+def release(rows, error: Exception) -> None:
+    """Вернуть взятую пачку в очередь (например, SMTP-сервер недоступен)."""
+    for row in rows:
+        _retry_later(row, error)
+
+
+def deliver(rows, connection=None) -> dict:
+    """
+    Отправляет уже взятые письма по одному соединению и пишет статусы.
+    -> {"sent": n, "retry": n, "failed": n, "expired": n}
+    """
+    from ..models import EmailStatus, OutboundEmail
+
+    stats = {"sent": 0, "retry": 0, "failed": 0, "expired": 0}
+    if not rows:
+        return stats
+    own = connection is None
+    connection = connection or get_connection()
+    sent_ids = []
+    try:
+        for row in rows:
+            now = timezone.now()
+            if row.expires_at and row.expires_at <= now:
+                OutboundEmail.objects.filter(pk=row.pk).update(
+                    status=EmailStatus.FAILED, last_error="expired before delivery")
+                stats["expired"] += 1
+                continue
+            try:
+                try:
+                    _message(row, connection).send(fail_silently=False)
+                except smtplib.SMTPServerDisconnected:
+                    # сервер закрыл простаивающее соединение — переоткрываем один раз
+                    connection.close()
+                    connection.open()
+                    _message(row, connection).send(fail_silently=False)
+            except Exception as e:
+                stats["retry" if _retry_later(row, e) else "failed"] += 1
+                continue
+            sent_ids.append(row.pk)
+    finally:
+        if sent_ids:
+            OutboundEmail.objects.filter(pk__in=sent_ids).update(
+                status=EmailStatus.SENT, sent_at=timezone.now(), claim="", last_error="")
+        stats["sent"] = len(sent_ids)
+        # отправлено, истекло или сдались — код в открытом виде больше не храним
+        OutboundEmail.objects.filter(
+            pk__in=[row.pk for row in rows], kind__in=SECRET_KINDS,
+            status__in=[EmailStatus.SENT, EmailStatus.FAILED],
+        ).update(text_body="", html_body="")
+        if own:
+            connection.close()
+    return stats
@@ -0,0 +1,183 @@
+# api/services/entitlements.py
+"""
+Есть ли у пользователя премиум — одна точка вместо трёх полей.
+
+    if is_premium(request.user.id): ...
+
+Премиум даёт любое из:
+- Entitlement.is_active и expires_at ещё не наступил (без срока — выдан вручную:
+  в админке Entitlement с product_id="manual" и пустым expires_at);
+- UserProfile.trial_ends_at в будущем.
+
+UserProfile.has_premium — только копия Entitlement для клиента (её держат
+в актуальном состоянии upsert_entitlements, вебхук и expire_entitlements),
+поэтому здесь не читается: между истечением и sweep-ом она ещё True.
+
+Результат кэшируется в памяти процесса по user_id. Положительный — до
+ближайшего срока, на котором он может смениться (expires_at / trial_ends_at),
+но не дольше ENTITLEMENT_CACHE_TTL; отрицательный — ENTITLEMENT_CACHE_NEGATIVE_TTL
+(обычно короче: только что купивший не должен долго ждать). Повторный запрос
+того же пользователя не делает ни одного SELECT.
+
+Сброс — invalidate(user_ids): сигналы Entitlement/UserProfile и
+receipts.upsert_entitlements (bulk_create сигналов не шлёт). Кэш у каждого
+процесса свой: воркер verify_receipts чистит только свой, а воркеры
+gunicorn увидят изменение не позже чем через TTL.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+
+
+@dataclass(frozen=True)
+class PremiumStatus:
+    active: bool
+    source: str = ""                   # entitlement | trial
+    until: datetime | None = None      # None — бессрочно (или неактивен)
+
+
+def resolve(user_id: int) -> PremiumStatus:
+    """Один запрос: профиль и Entitlement через LEFT JOIN от пользователя."""
+    row = (get_user_model().objects.filter(pk=user_id)
+           .values("profile__trial_ends_at",
+                   "entitlement__is_active", "entitlement__expires_at")
+           .first())
+    if row is None:
+        return PremiumStatus(False)
+    now = timezone.now()
+    expires_at = row["entitlement__expires_at"]
+    if row["entitlement__is_active"] and (expires_at is None or expires_at > now):
+        return PremiumStatus(True, "entitlement", expires_at)
+    trial_ends_at = row["profile__trial_ends_at"]
+    if trial_ends_at and trial_ends_at > now:
+        return PremiumStatus(True, "trial", trial_ends_at)
+    return PremiumStatus(False)
+
+
+class EntitlementCache:
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        # user_id -> (status, cached_until unix time)
+        self._items: OrderedDict[int, tuple[PremiumStatus, float]] = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, user_id: int) -> PremiumStatus:
+        now = time.time()
+        with self._lock:
+            item = self._items.get(user_id)
+            if item is not None and item[1] > now:
+                self._items.move_to_end(user_id)
+                self.hits += 1
+                return item[0]
+            self.misses += 1
+
+        status = resolve(user_id)
+        if self.max_size <= 0:
+            return status
+        cached_until = now + (self.ttl if status.active else self.negative_ttl)
+        if status.until is not None:
+            cached_until = min(cached_until, status.until.timestamp())
+        with self._lock:
+            self._items[user_id] = (status, cached_until)
+            self._items.move_to_end(user_id)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return status
+
+    def invalidate(self, user_ids) -> None:
+        with self._lock:
+            for user_id in user_ids:
+                self._items.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+premium_cache = EntitlementCache(
+    settings.ENTITLEMENT_CACHE_SIZE, settings.ENTITLEMENT_CACHE_TTL, settings.ENTITLEMENT_CACHE_NEGATIVE_TTL,
+)
+
+
+def premium_status(user_id: int) -> PremiumStatus:
+    return premium_cache.get(user_id)
+
+
+def is_premium(user_id: int) -> bool:
+    return premium_cache.get(user_id).active
+
+
+def invalidate(user_ids) -> None:
+    premium_cache.invalidate(user_ids)
+
+
+def sync_profiles(user_ids, has_premium: bool) -> int:
+    """Копирует состояние Entitlement в UserProfile.has_premium (одним UPDATE)."""
+    from ..models import UserProfile
+
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+    invalidate(user_ids)
+    return (UserProfile.objects.filter(user_id__in=user_ids)
+            .exclude(has_premium=has_premium).update(has_premium=has_premium))
+
+
+def resync_profiles(user_ids) -> None:
+    """has_premium заново по строкам Entitlement: активна и срок не наступил (или бессрочна)."""
+    from django.db.models import Q
+
+    from ..models import Entitlement
+
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    active = set(Entitlement.objects
+                 .filter(Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now()),
+                         user_id__in=user_ids, is_active=True)
+                 .values_list("user_id", flat=True))
+    sync_profiles(active, True)
+    sync_profiles(user_ids - active, False)
+
+
+def expire_due(batch_size: int = 1000, now: datetime | None = None):
+    """
+    Гасит истёкшие Entitlement пачками по batch_size: SELECT по частичному
+    индексу entitlement_active_expiry_idx (expires_at WHERE is_active),
+    UPDATE по id и has_premium=False у тех же пользователей — в одной
+    транзакции на пачку. Итерирует (expired, synced).
+    """
+    from django.db import transaction
+
+    from ..models import Entitlement, UserProfile
+
+    now = now or timezone.now()
+    while True:
+        with transaction.atomic():
+            rows = list(Entitlement.objects.filter(is_active=True, expires_at__lte=now)
+                        .order_by("expires_at").values_list("id", "user_id")[:batch_size])
+            if not rows:
+                return
+            ids = [r[0] for r in rows]
+            # expires_at__lte ещё раз: вебхук мог продлить подписку между SELECT и UPDATE
+            expired = Entitlement.objects.filter(id__in=ids, expires_at__lte=now).update(
+                is_active=False, updated_at=timezone.now())
+            invalidate([r[1] for r in rows])
+            synced = (UserProfile.objects
+                      .filter(has_premium=True, user_id__in=Entitlement.objects
+                              .filter(id__in=ids, is_active=False).values("user_id"))
+                      .update(has_premium=False))
+        yield expired, synced
+        if len(rows) < batch_size:
+            return
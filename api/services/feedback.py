@@ -0,0 +1,186 @@
+# api/services/feedback.py
+"""
+Пересылка оценок (4+ звёзд) и заявок из приложения во внешние приёмники.
+
+Запрос пишет только свою строку (AppRating / Report) — она же и есть
+очередь: forwarded_at IS NULL, частичный индекс по таким строкам.
+manage.py dispatch_feedback забирает пачку и отдаёт каждому приёмнику из
+FEEDBACK_SINKS то, что он ещё не получил: доставленные приёмники строки
+копятся в forwarded_sinks, forwarded_at ставится, когда доставлено во все.
+Упал один приёмник — остальные свою часть получают, а повтор уходит только
+в упавший (at-least-once лишь в пределах одного приёмника).
+
+Приёмники:
+- webhook — POST JSON {"items": [...]} на FEEDBACK_WEBHOOK_URL;
+- email   — одно письмо-дайджест на пачку в FEEDBACK_DIGEST_EMAIL (через очередь писем);
+- file    — строки JSON в FEEDBACK_FILE_PATH.
+"""
+from __future__ import annotations
+
+import json
+import threading
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .emailer import enqueue_email
+from .jwks import http_session
+
+
+def _queues():
+    from ..models import AppRating, Report
+
+    return {
+        "rating": (AppRating, Q(sent_to_store=True, forwarded_at__isnull=True)),
+        "report": (Report, Q(forwarded_at__isnull=True)),
+    }
+
+
+def _iso(dt: datetime | None) -> str | None:
+    return dt.isoformat() if dt else None
+
+
+def pending_items(kind: str, limit: int) -> list[dict]:
+    model, cond = _queues()[kind]
+    if kind == "rating":
+        rows = model.objects.filter(cond).order_by("id").values(
+            "id", "stars", "comment", "created_at", "user__email", "forwarded_sinks")[:limit]
+        return [{"kind": kind, "id": r["id"], "stars": r["stars"], "comment": r["comment"],
+                 "user_email": r["user__email"], "created_at": _iso(r["created_at"]),
+                 "_sinks": _sink_set(r["forwarded_sinks"])} for r in rows]
+    rows = model.objects.filter(cond).order_by("id").values(
+        "id", "name", "comment", "photo", "created_at", "user__email", "forwarded_sinks")[:limit]
+    return [{"kind": kind, "id": r["id"], "name": r["name"], "comment": r["comment"],
+             "photo_url": f"{settings.MEDIA_URL}{r['photo']}" if r["photo"] else None,
+             "user_email": r["user__email"], "created_at": _iso(r["created_at"]),
+             "_sinks": _sink_set(r["forwarded_sinks"])} for r in rows]
+
+
+def _sink_set(value: str) -> set[str]:
+    return set(filter(None, value.split(",")))
+
+
+def _public(it: dict) -> dict:
+    return {k: v for k, v in it.items() if not k.startswith("_")}
+
+
+# ---------- приёмники ----------
+
+class WebhookSink:
+    name = "webhook"
+
+    def __init__(self):
+        if not settings.FEEDBACK_WEBHOOK_URL:
+            raise ImproperlyConfigured("FEEDBACK_WEBHOOK_URL is required for the webhook sink")
+
+    def send(self, items: list[dict]) -> None:
+        resp = http_session().post(settings.FEEDBACK_WEBHOOK_URL, json={"items": items},
+                                   timeout=settings.FEEDBACK_WEBHOOK_TIMEOUT)
+        resp.raise_for_status()
+
+
+class EmailDigestSink:
+    name = "email"
+
+    def __init__(self):
+        if not settings.FEEDBACK_DIGEST_EMAIL:
+            raise ImproperlyConfigured("FEEDBACK_DIGEST_EMAIL is required for the email sink")
+
+    def send(self, items: list[dict]) -> None:
+        lines = []
+        for it in items:
+            who = it["user_email"] or "anonymous"
+            if it["kind"] == "rating":
+                lines.append(f"★{it['stars']} from {who}: {it['comment'] or '—'}")
+            else:
+                photo = f" [{it['photo_url']}]" if it["photo_url"] else ""
+                lines.append(f"Report #{it['id']} «{it['name']}» from {who}: {it['comment'] or '—'}{photo}")
+        ratings = sum(1 for it in items if it["kind"] == "rating")
+        enqueue_email(
+            settings.FEEDBACK_DIGEST_EMAIL,
+            f"SnapAI feedback: {ratings} ratings, {len(items) - ratings} reports",
+            "\n".join(lines),
+            kind="feedback",
+        )
+
+
+class FileSink:
+    name = "file"
+    _lock = threading.Lock()
+
+    def send(self, items: list[dict]) -> None:
+        with self._lock, open(settings.FEEDBACK_FILE_PATH, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(it, ensure_ascii=False) + "\n" for it in items)
+
+
+SINKS = {cls.name: cls for cls in (WebhookSink, EmailDigestSink, FileSink)}
+
+
+def get_sinks() -> list:
+    unknown = [name for name in settings.FEEDBACK_SINKS if name not in SINKS]
+    if unknown:
+        raise ImproperlyConfigured(f"Unknown FEEDBACK_SINKS: {', '.join(unknown)}")
+    return [SINKS[name]() for name in settings.FEEDBACK_SINKS]
+
+
+# ---------- пересылка ----------
+
+def dispatch_batch(sinks: list, batch_size: int) -> dict[str, int]:
+    """
+    Одна пачка во все приёмники, каждому — только то, что он ещё не получил.
+    Ошибка приёмника не мешает остальным; после сохранения прогресса первая
+    ошибка пробрасывается — команда повторит пачку с паузой.
+    """
+    queues = _queues()
+    items = {kind: pending_items(kind, batch_size) for kind in queues}
+    batch = [it for kind_items in items.values() for it in kind_items]
+    if not batch:
+        return {kind: 0 for kind in queues}
+
+    error = None
+    for sink in sinks:
+        todo = [it for it in batch if sink.name not in it["_sinks"]]
+        if not todo:
+            continue
+        try:
+            sink.send([_public(it) for it in todo])
+        except Exception as e:
+            error = error or e
+            continue
+        for it in todo:
+            it["_sinks"].add(sink.name)
+
+    now = timezone.now()
+    names = {sink.name for sink in sinks}
+    forwarded = {}
+    for kind, (model, _) in queues.items():
+        done = [it["id"] for it in items[kind] if names <= it["_sinks"]]
+        if done:
+            model.objects.filter(id__in=done).update(forwarded_at=now)
+        # недоставленные хотя бы в один приёмник — запоминаем, куда уже ушли (по группам)
+        partial: dict[str, list[int]] = {}
+        for it in items[kind]:
+            if not names <= it["_sinks"]:
+                partial.setdefault(",".join(sorted(it["_sinks"])), []).append(it["id"])
+        for value, ids in partial.items():
+            model.objects.filter(id__in=ids).update(forwarded_sinks=value)
+        forwarded[kind] = len(done)
+    if error is not None:
+        raise error
+    return forwarded
+
+
+def queue_metrics() -> dict:
+    """Сколько ждёт пересылки и возраст самой старой записи — по частичным индексам."""
+    now = timezone.now()
+    out = {"sinks": settings.FEEDBACK_SINKS}
+    for kind, (model, cond) in _queues().items():
+        agg = model.objects.filter(cond).aggregate(pending=Count("id"), oldest=Min("created_at"))
+        out[kind] = {
+            "pending": agg["pending"],
+            "oldest_age_s": int((now - agg["oldest"]).total_seconds()) if agg["oldest"] else 0,
+        }
+    return out
@@ -0,0 +1,221 @@
+# api/services/ingredient_index.py
+"""
+In-memory индекс названий ингредиентов для автодополнения.
+
+Источники: таблица FoodItem + названия из Meal.ingredients (вес = сколько
+раз встречалось). Две структуры:
+  - префиксное дерево по началу КАЖДОГО слова ("bre" -> "chicken breast"),
+    в каждом узле лежит готовый top-K по весу — поиск O(len(q));
+  - инвертированный индекс триграмм — добирает результаты с опечатками
+    ("chiken"), если префиксных не хватило.
+
+Индекс строится лениво при первом запросе в процессе, дальше обновляется
+инкрементально: новые Meal подтягиваются по водяному знаку id раз в
+INGREDIENT_INDEX_REFRESH секунд, правки существующих — сигналом post_save.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+from .nutrition import parse_ingredient
+
+logger = logging.getLogger(__name__)
+
+TOP_K = 16
+MAX_NAME_LEN = 64
+_SPACE_RE = re.compile(r"\s+")
+
+
+def _key(name: str) -> str:
+    return _SPACE_RE.sub(" ", name.strip().lower())[:MAX_NAME_LEN]
+
+
+def _trigrams(key: str) -> set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def ingredient_names(ingredients) -> list[str]:
+    """Названия из Meal.ingredients (строки "200 g rice" или dict с name)."""
+    names = []
+    for item in ingredients or ():
+        if isinstance(item, dict):
+            name = str(item.get("name") or "")
+        else:
+            name = parse_ingredient(str(item))[0]
+        key = _key(name)
+        if len(key) >= 2:
+            names.append(key)
+    return names
+
+
+class _Node:
+    __slots__ = ("children", "top")
+
+    def __init__(self):
+        self.children: dict[str, _Node] = {}
+        self.top: list[int] = []
+
+
+class IngredientIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names: list[str] = []
+        self._ids: dict[str, int] = {}
+        self._weight: list[int] = []
+        self._root = _Node()
+        self._grams: dict[str, set[int]] = defaultdict(set)
+        self.watermark = 0          # max Meal.id, уже учтённый в индексе
+        self.refreshed_at = 0.0
+
+    def __len__(self):
+        return len(self._names)
+
+    # ---- запись ----
+    def _rank(self, nid: int) -> tuple[int, int]:
+        # чаще встречается — выше; при равенстве короче — выше
+        return -self._weight[nid], len(self._names[nid])
+
+    def _push_top(self, node: _Node, nid: int) -> None:
+        top = node.top
+        if nid not in top:
+            if len(top) < TOP_K:
+                top.append(nid)
+            elif self._rank(nid) < self._rank(top[-1]):
+                top[-1] = nid
+            else:
+                return
+        top.sort(key=self._rank)
+
+    def _add_locked(self, key: str, weight: int) -> None:
+        nid = self._ids.get(key)
+        if nid is None:
+            nid = len(self._names)
+            self._ids[key] = nid
+            self._names.append(key)
+            self._weight.append(weight)
+            for g in _trigrams(key):
+                self._grams[g].add(nid)
+        else:
+            self._weight[nid] += weight
+
+        # путь от начала каждого слова
+        starts = [0] + [m.end() for m in re.finditer(" ", key)]
+        for start in starts:
+            node = self._root
+            for ch in key[start:]:
+                node = node.children.setdefault(ch, _Node())
+                self._push_top(node, nid)
+
+    def add(self, names, weight: int = 1) -> None:
+        with self._lock:
+            for key in names:
+                self._add_locked(key, weight)
+
+    # ---- загрузка ----
+    def build(self) -> None:
+        from ..models import FoodItem, Meal
+
+        started = time.perf_counter()
+        with self._lock:
+            for name in FoodItem.objects.values_list("name", flat=True).iterator():
+                self._add_locked(_key(name), 1)
+            counts: Counter = Counter()
+            watermark = 0
+            for meal_id, ingredients in Meal.objects.values_list("id", "ingredients").iterator(chunk_size=2000):
+                counts.update(ingredient_names(ingredients))
+                watermark = max(watermark, meal_id)
+            for key, n in counts.items():
+                self._add_locked(key, n)
+            self.watermark = watermark
+            self.refreshed_at = time.monotonic()
+        logger.info("Ingredient index built: %d names in %.0f ms",
+                    len(self), (time.perf_counter() - started) * 1000)
+
+    def refresh(self) -> int:
+        """Подтягивает Meal с id > watermark. Возвращает число новых блюд."""
+        from ..models import Meal
+
+        if not self._lock.acquire(blocking=False):
+            return 0  # уже обновляет другой поток
+        try:
+            self.refreshed_at = time.monotonic()
+            rows = list(Meal.objects.filter(id__gt=self.watermark)
+                        .order_by("id").values_list("id", "ingredients")[:5000])
+            for meal_id, ingredients in rows:
+                for key in ingredient_names(ingredients):
+                    self._add_locked(key, 1)
+                self.watermark = meal_id
+            return len(rows)
+        finally:
+            self._lock.release()
+
+    # ---- чтение ----
+    def suggest(self, q: str, limit: int = 10) -> list[dict]:
+        key = _key(q)
+        if not key:
+            return []
+
+        results: list[dict] = []
+        seen: set[int] = set()
+
+        node = self._root
+        for ch in key:
+            node = node.children.get(ch)
+            if node is None:
+                break
+        else:
+            for nid in node.top[:limit]:
+                seen.add(nid)
+                results.append({"name": self._names[nid], "count": self._weight[nid], "match": "prefix"})
+
+        if len(results) < limit and len(key) >= 3:
+            qgrams = _trigrams(key)
+            hits: Counter = Counter()
+            for g in qgrams:
+                hits.update(self._grams.get(g, ()))
+            scored = []
+            for nid, common in hits.items():
+                if nid in seen:
+                    continue
+                # len(name) + 1 — число триграмм имени с учётом паддинга
+                dice = 2 * common / (len(qgrams) + len(self._names[nid]) + 1)
+                if dice >= 0.45:
+                    scored.append((dice, self._weight[nid], nid))
+            scored.sort(reverse=True)
+            for dice, weight, nid in scored[:limit - len(results)]:
+                results.append({"name": self._names[nid], "count": weight, "match": "fuzzy"})
+
+        return results
+
+
+_index: IngredientIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> IngredientIndex:
+    """Индекс процесса: строится при первом обращении, дальше — инкрементально."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                idx = IngredientIndex()
+                idx.build()
+                _index = idx
+    elif time.monotonic() - _index.refreshed_at >= settings.INGREDIENT_INDEX_REFRESH:
+        try:
+            _index.refresh()
+        except Exception:
+            logger.exception("Ingredient index refresh failed")
+    return _index
+
+
+def loaded_index() -> IngredientIndex | None:
+    """Индекс, только если он уже построен (для сигналов — не строим его зря)."""
+    return _index
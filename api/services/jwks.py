@@ -0,0 +1,198 @@
+# api/services/jwks.py
+"""
+Кэш публичных ключей (JWKS) провайдеров входа — Apple и Google.
+
+    key = apple_keys().get_signing_key(kid)
+
+- TTL — из Cache-Control: max-age (минус Age), в пределах JWKS_MIN_TTL..JWKS_MAX_TTL;
+- после JWKS_REFRESH_AHEAD доли TTL ключи обновляются фоновым потоком,
+  запрос продолжает работать со старыми;
+- если обновить не удалось — отдаём прежние ключи ещё JWKS_STALE_TTL
+  секунд после истечения (stale-while-revalidate / stale-if-error);
+- неизвестный kid (ротация у провайдера) — синхронное обновление, но не
+  чаще раза в JWKS_UNKNOWN_KID_COOLDOWN секунд, чтобы мусорные токены
+  не превращались в запросы к провайдеру;
+- все запросы идут через одну requests.Session с пулом соединений
+  (keep-alive, без нового TLS-рукопожатия на каждый логин).
+
+URL берутся из настроек — в тестах их можно направить на локальную заглушку.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+import requests
+from django.conf import settings
+from jwt import PyJWK
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+
+def http_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                _session = s
+    return _session
+
+
+def ttl_from_headers(headers, default: float) -> float:
+    m = _MAX_AGE_RE.search(headers.get("Cache-Control", ""))
+    if not m:
+        return default
+    try:
+        age = int(headers.get("Age", 0))
+    except ValueError:
+        age = 0
+    return float(int(m.group(1)) - age)
+
+
+class KeySet:
+    def __init__(self, name: str, url: str, session: requests.Session | None = None):
+        self.name = name
+        self.url = url
+        self.session = session
+        self.stats: Counter = Counter()
+        self._keys: dict[str, PyJWK] = {}
+        self._fetched_at = 0.0
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._last_forced = 0.0
+        self._lock = threading.Lock()            # защищает состояние
+        self._refresh_lock = threading.Lock()    # одно обновление за раз
+        self._refreshing = False
+
+    # ---- загрузка ----
+    def _fetch(self) -> tuple[dict[str, PyJWK], float]:
+        resp = (self.session or http_session()).get(self.url, timeout=settings.JWKS_HTTP_TIMEOUT)
+        resp.raise_for_status()
+        keys = {}
+        for jwk in resp.json().get("keys", []):
+            if jwk.get("use", "sig") != "sig" or "kid" not in jwk:
+                continue
+            try:
+                keys[jwk["kid"]] = PyJWK(jwk)
+            except Exception as e:  # неподдерживаемый alg/kty — пропускаем ключ, не весь набор
+                logger.warning("%s JWKS: skip key %s: %s", self.name, jwk.get("kid"), e)
+        if not keys:
+            raise ValueError(f"{self.name} JWKS: no usable keys")
+        ttl = ttl_from_headers(resp.headers, settings.JWKS_DEFAULT_TTL)
+        return keys, min(max(ttl, settings.JWKS_MIN_TTL), settings.JWKS_MAX_TTL)
+
+    def refresh(self, unless_fetched_after: float | None = None) -> bool:
+        """
+        Синхронно перечитать ключи. False — не вышло (старые ключи остаются).
+        unless_fetched_after — пока ждали замок, ключи мог обновить другой поток.
+        """
+        with self._refresh_lock:
+            if unless_fetched_after is not None and self._fetched_at > unless_fetched_after:
+                return True
+            started = time.perf_counter()
+            try:
+                keys, ttl = self._fetch()
+            except Exception as e:
+                self.stats["refresh_errors"] += 1
+                logger.warning("%s JWKS refresh failed: %s", self.name, e)
+                return False
+            now = time.monotonic()
+            with self._lock:
+                self._keys = keys
+                self._fetched_at = now
+                self._expires_at = now + ttl
+                self._refresh_at = now + ttl * settings.JWKS_REFRESH_AHEAD
+            self.stats["refreshes"] += 1
+            self.stats["last_refresh_ms"] = int((time.perf_counter() - started) * 1000)
+            logger.info("%s JWKS refreshed: %d keys, ttl %ds", self.name, len(keys), ttl)
+            return True
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name=f"jwks-{self.name}", daemon=True).start()
+
+    # ---- чтение ----
+    def get_signing_key(self, kid: str) -> PyJWK:
+        now = time.monotonic()
+        if not self._keys or now >= self._expires_at + settings.JWKS_STALE_TTL:
+            # ключей нет или они слишком старые — ждём обновления
+            self.stats["misses"] += 1
+            if not self.refresh(unless_fetched_after=now):
+                raise ValueError(f"{self.name} JWKS unavailable")
+        elif now >= self._expires_at:
+            self.stats["stale_served"] += 1
+            self._refresh_in_background()
+        elif now >= self._refresh_at:
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is None and time.monotonic() - self._last_forced >= settings.JWKS_UNKNOWN_KID_COOLDOWN:
+            # провайдер мог выпустить новый ключ раньше, чем истёк наш TTL
+            forced_at = self._last_forced = time.monotonic()
+            self.stats["unknown_kid_refreshes"] += 1
+            self.refresh(unless_fetched_after=forced_at)
+            key = self._keys.get(kid)
+        if key is None:
+            raise ValueError(f"{self.name} JWKS: unknown kid {kid}")
+        self.stats["hits"] += 1
+        return key
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            "url": self.url,
+            "keys": sorted(self._keys),
+            "age_s": int(now - self._fetched_at) if self._fetched_at else None,
+            "expires_in_s": int(self._expires_at - now) if self._fetched_at else None,
+            **self.stats,
+        }
+
+
+_keysets: dict[str, KeySet] = {}
+_keysets_lock = threading.Lock()
+
+
+def _keyset(name: str, url: str) -> KeySet:
+    ks = _keysets.get(name)
+    if ks is None or ks.url != url:
+        with _keysets_lock:
+            ks = _keysets.get(name)
+            if ks is None or ks.url != url:
+                ks = _keysets[name] = KeySet(name, url)
+    return ks
+
+
+def apple_keys() -> KeySet:
+    return _keyset("apple", settings.APPLE_JWKS_URL)
+
+
+def google_keys() -> KeySet:
+    return _keyset("google", settings.GOOGLE_JWKS_URL)
+
+
+def keysets_snapshot() -> dict:
+    return {name: ks.snapshot() for name, ks in _keysets.items()}
@@ -0,0 +1,218 @@
+# api/services/nutrition.py
+"""
+Подсчёт КБЖУ по списку ингредиентов без модели — по локальной таблице FoodItem.
+
+    price_ingredients(["200 g chicken breast", "rice", "2 eggs"])
+
+Строка разбирается на количество/единицу/название, название нормализуется
+(регистр, пунктуация, простое мн. число) и сопоставляется с FoodItem:
+точное совпадение name_key, иначе кандидаты по префиксам слов (индексный
+диапазонный запрос) и ранжирование по покрытию слов + difflib.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import asdict, dataclass
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Iterable
+
+from django.db.models import Q
+
+MACRO_FIELDS = ("calories", "protein_g", "fat_g", "carbs_g")
+MATCH_THRESHOLD = 0.6
+MAX_CANDIDATES = 60
+
+# грамм в единице; None — «штуки», берём portion_g продукта
+UNITS = {
+    "g": 1, "gr": 1, "gram": 1, "grams": 1, "г": 1, "гр": 1,
+    "kg": 1000, "кг": 1000,
+    "ml": 1, "мл": 1, "l": 1000, "л": 1000,
+    "oz": 28.35, "lb": 453.6,
+    "tbsp": 15, "tsp": 5, "cup": 240, "cups": 240,
+    "pc": None, "pcs": None, "piece": None, "pieces": None, "x": None, "шт": None,
+    "slice": None, "slices": None, "serving": None, "servings": None, "portion": None,
+}
+
+_QTY = r"(?P<qty>\d+(?:[.,]\d+)?|\d+/\d+)"
+_UNIT = r"(?P<unit>[a-zа-я]+)?\.?"
+_LEADING_RE = re.compile(rf"^{_QTY}\s*{_UNIT}\s+(?:of\s+)?(?P<name>.+)$", re.I)
+_TRAILING_RE = re.compile(rf"^(?P<name>.+?)[\s,:-]+{_QTY}\s*{_UNIT}$", re.I)
+_NON_WORD_RE = re.compile(r"[^\w\s]+", re.U)
+
+
+def _singular(word: str) -> str:
+    if len(word) <= 3:
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("oes"):
+        return word[:-2]
+    if word.endswith(("ses", "xes", "ches", "shes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def normalize_name(name: str) -> str:
+    words = _NON_WORD_RE.sub(" ", name.lower()).split()
+    return " ".join(_singular(w) for w in words if not w.isdigit())
+
+
+def _to_float(qty: str) -> float:
+    if "/" in qty:
+        num, den = qty.split("/", 1)
+        return float(num) / float(den) if float(den) else 0.0
+    return float(qty.replace(",", "."))
+
+
+def parse_ingredient(text: str) -> tuple[str, float | None, float | None]:
+    """
+    "200 g chicken" / "chicken 200g" / "2 eggs" -> (name, grams, count).
+    grams и count взаимоисключающие; оба None — количество не указано.
+    """
+    text = text.strip()
+    m = _LEADING_RE.match(text) or _TRAILING_RE.match(text)
+    if not m:
+        return text, None, None
+
+    qty = _to_float(m.group("qty"))
+    unit = (m.group("unit") or "").lower()
+    name = m.group("name").strip()
+    if unit and unit not in UNITS:
+        # не единица, а часть названия: "2 eggs" -> unit="eggs"
+        name = f"{m.group('unit')} {name}" if m.re is _LEADING_RE else f"{name} {m.group('unit')}"
+        unit = ""
+    factor = UNITS.get(unit) if unit else None
+    if factor is None:
+        return name, None, qty
+    return name, qty * factor, None
+
+
+@dataclass(frozen=True)
+class FoodRef:
+    name: str
+    kcal_100g: float
+    protein_100g: float
+    fat_100g: float
+    carbs_100g: float
+    portion_g: float
+    score: float
+
+
+def _score(query: str, candidate: str) -> float:
+    # главное — все слова продукта есть в запросе ("grilled salmon" -> "salmon"),
+    # затем — насколько запрос покрыт продуктом, затем посимвольная близость
+    q, c = set(query.split()), set(candidate.split())
+    if not q or not c:
+        return 0.0
+    common = len(q & c)
+    return (0.45 * common / len(c)
+            + 0.25 * common / len(q)
+            + 0.3 * SequenceMatcher(None, query, candidate).ratio())
+
+
+class _NoMatch(LookupError):
+    pass
+
+
+def match_food(name_key: str) -> FoodRef | None:
+    """
+    Лучшее совпадение по нормализованному имени (или None). Кэшируются только
+    найденные продукты: промах — не повод помнить None, пока таблицу не
+    дополнят (lru_cache не кэширует исключения).
+    """
+    if not name_key:
+        return None
+    try:
+        return _match_food(name_key)
+    except _NoMatch:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def _match_food(name_key: str) -> FoodRef:
+    from ..models import FoodItem
+
+    fields = ("name", "name_key", "kcal_100g", "protein_100g", "fat_100g", "carbs_100g", "portion_g")
+    exact = FoodItem.objects.filter(name_key=name_key).values_list(*fields).first()
+    if exact:
+        return FoodRef(exact[0], *exact[2:], score=1.0)
+
+    prefixes = {name_key} | {w for w in name_key.split() if len(w) >= 3}
+    cond = Q()
+    for p in prefixes:
+        cond |= Q(name_key__gte=p, name_key__lt=p + "\uffff")
+    best, best_score = None, 0.0
+    # порядок по уникальному name_key (по индексу): одни и те же кандидаты при любом плане запроса
+    for row in FoodItem.objects.filter(cond).order_by("name_key").values_list(*fields)[:MAX_CANDIDATES]:
+        s = _score(name_key, row[1])
+        if s > best_score:
+            best, best_score = row, s
+    if best is None or best_score < MATCH_THRESHOLD:
+        raise _NoMatch(name_key)
+    return FoodRef(best[0], *best[2:], score=round(best_score, 3))
+
+
+def clear_match_cache() -> None:
+    """После перезагрузки таблицы продуктов (load_foods)."""
+    _match_food.cache_clear()
+
+
+@dataclass
+class PricedIngredient:
+    text: str
+    food: str | None
+    grams: float
+    calories: float = 0
+    protein_g: float = 0
+    fat_g: float = 0
+    carbs_g: float = 0
+
+
+def price_ingredient(item: str | dict) -> PricedIngredient:
+    if isinstance(item, dict):
+        text = str(item.get("name", "")).strip()
+        name, grams, count = text, item.get("grams"), item.get("count")
+        grams = float(grams) if grams not in (None, "") else None
+        count = float(count) if count not in (None, "") else None
+    else:
+        text = str(item).strip()
+        name, grams, count = parse_ingredient(text)
+
+    food = match_food(normalize_name(name))
+    if food is None:
+        return PricedIngredient(text=text, food=None, grams=grams or 0)
+
+    if grams is None:
+        grams = (count or 1) * food.portion_g
+    k = grams / 100.0
+    return PricedIngredient(
+        text=text,
+        food=food.name,
+        grams=round(grams, 1),
+        calories=food.kcal_100g * k,
+        protein_g=food.protein_100g * k,
+        fat_g=food.fat_100g * k,
+        carbs_g=food.carbs_100g * k,
+    )
+
+
+def price_ingredients(items: Iterable[str | dict]) -> dict:
+    """
+    Итоги КБЖУ (int) + разбор по ингредиентам. Несопоставленные
+    ингредиенты в итог не входят и перечислены в "unmatched".
+    """
+    priced = [price_ingredient(i) for i in items]
+    matched = [p for p in priced if p.food]
+    totals = {f: int(round(sum(getattr(p, f) for p in matched))) for f in MACRO_FIELDS}
+    return {
+        **totals,
+        "matched": len(matched),
+        "unmatched": [p.text for p in priced if not p.food],
+        "ingredients": [
+            {**asdict(p), **{f: int(round(getattr(p, f))) for f in MACRO_FIELDS}}
+            for p in priced
+        ],
+    }
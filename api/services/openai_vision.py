@@ -1,12 +1,98 @@
 import os
+import time
 import base64
-import json
+import logging
+from dataclasses import dataclass
 from openai import OpenAI
 from mimetypes import guess_type
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from django.conf import settings
 
-def analyze_image(image_field):
+from .vision_schema import parse_analysis, ValidationError
+from .usage import CallStats
+
+logger = logging.getLogger(__name__)
+
+client = OpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    timeout=settings.VISION_TIMEOUT,
+    max_retries=settings.VISION_MAX_RETRIES,
+)
+
+SYSTEM_PROMPT = (
+    "Ты нутрициолог. ВСЕГДА отвечай строго JSON-объектом. На английском только\n"
+    "Формат:\n"
+    "{\n"
+    '  "title": str,\n'
+    '  "calories": int,\n'
+    '  "protein_g": int,\n'
+    '  "fat_g": int,\n'
+    '  "carbs_g": int,\n'
+    '  "ingredients": [ {"name": str, "calories": int, "protein_g": int, "fat_g": int, "carbs_g": int} ],\n'
+    '  "meta": { "health_score": int, "labels": [str] }\n'
+    "}"
+)
+
+# Короткие ключи и ингредиенты кортежами: ответ в 2-3 раза короче по токенам,
+# а выходные токены и определяют латентность. Раскрывается в vision_schema.
+COMPACT_PROMPT = (
+    "Nutritionist. Reply with ONE minified JSON object in English, no prose:\n"
+    '{"t":title,"k":kcal,"p":protein_g,"f":fat_g,"c":carbs_g,'
+    '"i":[[name,kcal,protein_g,fat_g,carbs_g],...],"h":health_score_0_10,"l":[label,...]}\n'
+    "All numbers are integers for the whole portion."
+)
+
+
+@dataclass(frozen=True)
+class PromptVariant:
+    name: str
+    system: str
+    user_text: str
+    max_tokens: int
+
+
+PROMPT_VARIANTS = {
+    "verbose": PromptVariant("verbose", SYSTEM_PROMPT, "Проанализируй это фото еды и верни JSON.", 800),
+    "compact": PromptVariant("compact", COMPACT_PROMPT, "Analyze this meal photo.", 350),
+}
+
+
+def get_variant(name: str | None = None) -> PromptVariant:
+    return PROMPT_VARIANTS.get(name or settings.VISION_PROMPT, PROMPT_VARIANTS["compact"])
+
+
+def _complete(messages, stats: CallStats, max_tokens: int):
+    started = time.perf_counter()
+    resp = client.chat.completions.create(
+        model=settings.VISION_MODEL,
+        messages=messages,
+        max_tokens=max_tokens,
+        response_format={"type": "json_object"},  # 👈 жёстко заставляем JSON
+    )
+    stats.add_response(resp, time.perf_counter() - started)
+    return resp.choices[0].message.content or ""
+
+
+def _short_errors(exc: ValidationError, limit: int = 5) -> str:
+    parts = []
+    for err in exc.errors()[:limit]:
+        loc = ".".join(str(x) for x in err.get("loc", ())) or "root"
+        parts.append(f"{loc}: {err.get('msg')}")
+    return "; ".join(parts)
+
+
+def analyze_image(image_field, stats: CallStats | None = None,
+                  variant: str | None = None, detail: str | None = None):
+    """
+    Возвращает dict с полями Meal (title, calories, protein_g, fat_g, carbs_g,
+    ingredients, meta) — уже провалидированный и починенный, либо None.
+    Поправимые ошибки чинятся без модели; повторный запрос — максимум один.
+    Если передан stats, туда пишутся токены/латентность/размер картинки.
+    variant/detail по умолчанию берутся из settings (VISION_PROMPT, VISION_IMAGE_DETAIL).
+    """
+    stats = stats if stats is not None else CallStats()
+    prompt = get_variant(variant)
+    max_tokens = settings.VISION_MAX_TOKENS or prompt.max_tokens
     try:
         image_field.seek(0)
         mime_type, _ = guess_type(image_field.name)
@@ -14,47 +100,50 @@ def analyze_image(image_field):
             mime_type = "image/jpeg"
 
         image_bytes = image_field.read()
-        print("Image size:", len(image_bytes))  # debug
+        stats.image_bytes = len(image_bytes)
+        logger.debug("Image size: %d", len(image_bytes))
 
         image_b64 = base64.b64encode(image_bytes).decode("utf-8")
         data_url = f"data:{mime_type};base64,{image_b64}"
 
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "Ты нутрициолог. ВСЕГДА отвечай строго JSON-объектом. На английском только\n"
-                        "Формат:\n"
-                        "{\n"
-                        '  "title": str,\n'
-                        '  "calories": int,\n'
-                        '  "protein_g": int,\n'
-                        '  "fat_g": int,\n'
-                        '  "carbs_g": int,\n'
-                        '  "ingredients": [ {"name": str, "calories": int, "protein_g": int, "fat_g": int, "carbs_g": int} ],\n'
-                        '  "meta": { "health_score": int, "labels": [str] }\n'
-                        "}"
-                    ),
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "Проанализируй это фото еды и верни JSON."},
-                        {"type": "image_url", "image_url": {"url": data_url}},
-                    ],
-                },
-            ],
-            max_tokens=800,
-            response_format={"type": "json_object"},  # 👈 жёстко заставляем JSON
-        )
-
-        text = resp.choices[0].message.content
-        print("AI raw response:", text[:200])  # debug
-
-        return json.loads(text)
+        messages = [
+            {"role": "system", "content": prompt.system},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt.user_text},
+                    {"type": "image_url", "image_url": {
+                        "url": data_url,
+                        "detail": detail or settings.VISION_IMAGE_DETAIL,
+                    }},
+                ],
+            },
+        ]
+
+        text = _complete(messages, stats, max_tokens)
+        logger.debug("AI raw response: %s", text[:200])
+
+        try:
+            return parse_analysis(text).to_meal_fields()
+        except ValidationError as e:
+            errors = _short_errors(e)
+            logger.debug("AI response invalid, re-asking: %s", errors)
+
+        # один точечный повтор: показываем модели её ответ и ошибки
+        messages += [
+            {"role": "assistant", "content": text},
+            {
+                "role": "user",
+                "content": (
+                    f"Ответ не прошёл проверку: {errors}. "
+                    "Верни исправленный JSON строго по формату, без пояснений."
+                ),
+            },
+        ]
+        text = _complete(messages, stats, max_tokens)
+        logger.debug("AI raw response (retry): %s", text[:200])
+        return parse_analysis(text).to_meal_fields()
 
     except Exception as e:
-        print("OpenAI Vision error:", e)
-        return None
\ No newline at end of file
+        logger.warning("OpenAI Vision error: %s", e)
+        return None
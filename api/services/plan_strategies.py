@@ -0,0 +1,236 @@
+# api/services/plan_strategies.py
+"""
+Стратегии расчёта плана питания.
+
+Стратегия = формула BMR + способ поправки на цель. Параметры (множители
+активности, смещения по цели, нижний порог, сплит БЖУ, темп) версионируются
+в таблице PlanStrategy; активная версия кэшируется в процессе на
+PLAN_STRATEGY_CACHE_TTL секунд и сбрасывается сигналом при её изменении.
+Каждый NutritionPlan помнит, какой версией он посчитан, — поэтому
+regenerate_plans трогает только устаревшие планы.
+
+Новая стратегия:
+
+    @register("my_formula")
+    def my_formula(inp: PlanInput, params: dict) -> dict | None: ...
+"""
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+from django.conf import settings
+
+# то же, что было зашито в utils.plan_from_profile
+DEFAULT_PARAMS = {
+    "activity_mult": {"sedentary": 1.2, "normal": 1.375, "active": 1.55},
+    "goal_offsets": {"lose": -400, "maintain": 0, "gain": 300},
+    "min_calories": 1200,
+    "macro_split": {"protein": 0.25, "fat": 0.30, "carbs": 0.45},
+    # только для goal_pace
+    "bmr": "mifflin",
+    "pace_kg_per_week": 0.5,
+    "kcal_per_kg": 7700,
+    "max_daily_offset": 1000,
+}
+
+
+def merge_params(overrides: dict | None) -> dict:
+    """
+    DEFAULT_PARAMS, поверх — overrides. Вложенные словари сливаются по ключам:
+    {"activity_mult": {"active": 1.6}} меняет один множитель, остальные — по умолчанию.
+    """
+    merged = {}
+    for key, default in DEFAULT_PARAMS.items():
+        value = (overrides or {}).get(key, default)
+        merged[key] = {**default, **value} if isinstance(default, dict) and isinstance(value, dict) else value
+    for key, value in (overrides or {}).items():
+        merged.setdefault(key, value)
+    return merged
+
+
+def validate_params(overrides: dict | None) -> list[str]:
+    """Ошибки в overrides: неизвестные ключи, словарь вместо числа и наоборот, сплит БЖУ не в сумме 1."""
+    if not isinstance(overrides, dict):
+        return ["params must be an object"]
+    errors = []
+    for key, value in overrides.items():
+        if key not in DEFAULT_PARAMS:
+            errors.append(f"unknown key {key!r}")
+            continue
+        default = DEFAULT_PARAMS[key]
+        if isinstance(default, dict):
+            if not isinstance(value, dict):
+                errors.append(f"{key} must be an object")
+                continue
+            unknown = sorted(set(value) - set(default))
+            if unknown:
+                errors.append(f"{key}: unknown keys {', '.join(unknown)}")
+            if any(not isinstance(v, (int, float)) for v in value.values()):
+                errors.append(f"{key}: values must be numbers")
+        elif not isinstance(value, type(default)) and not (
+                isinstance(default, (int, float)) and isinstance(value, (int, float))):
+            errors.append(f"{key} must be {type(default).__name__}")
+    if not errors:
+        split = merge_params(overrides)["macro_split"]
+        if abs(sum(split.values()) - 1) > 0.01:
+            errors.append("macro_split must sum to 1")
+    return errors
+
+
+@dataclass(frozen=True)
+class PlanInput:
+    gender: str
+    age: int
+    weight_kg: float | None
+    height_cm: float | None
+    activity: str
+    goal: str
+    desired_weight_kg: float | None = None
+
+
+# ---------- BMR ----------
+
+def bmr_mifflin(inp: PlanInput) -> int | None:
+    if not (inp.weight_kg and inp.height_cm and inp.age):
+        return None
+    s = 5 if inp.gender == "male" else -161
+    return int(10 * inp.weight_kg + 6.25 * inp.height_cm - 5 * inp.age + s)
+
+
+def bmr_harris_benedict(inp: PlanInput) -> int | None:
+    # пересмотренная формула (Roza & Shizgal, 1984)
+    if not (inp.weight_kg and inp.height_cm and inp.age):
+        return None
+    w, h, a = inp.weight_kg, inp.height_cm, inp.age
+    if inp.gender == "male":
+        return int(88.362 + 13.397 * w + 4.799 * h - 5.677 * a)
+    return int(447.593 + 9.247 * w + 3.098 * h - 4.330 * a)
+
+
+def bmr_katch_mcardle(inp: PlanInput) -> int | None:
+    # % жира не храним — сухую массу оцениваем по формуле Boer
+    if not (inp.weight_kg and inp.height_cm):
+        return None
+    w, h = inp.weight_kg, inp.height_cm
+    lbm = 0.407 * w + 0.267 * h - 19.2 if inp.gender == "male" else 0.252 * w + 0.473 * h - 48.3
+    return int(370 + 21.6 * lbm)
+
+
+BMR_FORMULAS: dict[str, Callable[[PlanInput], int | None]] = {
+    "mifflin": bmr_mifflin,
+    "harris_benedict": bmr_harris_benedict,
+    "katch_mcardle": bmr_katch_mcardle,
+}
+
+
+# ---------- pipeline ----------
+
+def _fixed_offset(inp: PlanInput, params: dict) -> int:
+    return int(params["goal_offsets"].get(inp.goal, 0))
+
+
+def _pace_offset(inp: PlanInput, params: dict) -> int:
+    daily = params["pace_kg_per_week"] * params["kcal_per_kg"] / 7
+    if inp.desired_weight_kg and inp.weight_kg:
+        diff = inp.desired_weight_kg - inp.weight_kg
+        direction = 0 if abs(diff) < 0.5 else (1 if diff > 0 else -1)
+    else:
+        direction = {"lose": -1, "gain": 1}.get(inp.goal, 0)
+    return int(direction * min(daily, params["max_daily_offset"]))
+
+
+def _plan(bmr: int | None, inp: PlanInput, params: dict, offset: int) -> dict | None:
+    if bmr is None:
+        return None
+    tdee = int(bmr * params["activity_mult"].get(inp.activity, 1.375))
+    calories = tdee + offset
+
+    split = params["macro_split"]
+    return {
+        "calories": max(calories, params["min_calories"]),  # нижний порог
+        "protein_g": int((calories * split["protein"]) / 4),
+        "fat_g": int((calories * split["fat"]) / 9),
+        "carbs_g": int((calories * split["carbs"]) / 4),
+    }
+
+
+STRATEGIES: dict[str, Callable[[PlanInput, dict], dict | None]] = {}
+
+
+def register(name: str):
+    def deco(fn):
+        STRATEGIES[name] = fn
+        return fn
+    return deco
+
+
+@register("mifflin")
+def mifflin(inp, params):
+    return _plan(bmr_mifflin(inp), inp, params, _fixed_offset(inp, params))
+
+
+@register("harris_benedict")
+def harris_benedict(inp, params):
+    return _plan(bmr_harris_benedict(inp), inp, params, _fixed_offset(inp, params))
+
+
+@register("katch_mcardle")
+def katch_mcardle(inp, params):
+    return _plan(bmr_katch_mcardle(inp), inp, params, _fixed_offset(inp, params))
+
+
+@register("goal_pace")
+def goal_pace(inp, params):
+    bmr = BMR_FORMULAS.get(params["bmr"], bmr_mifflin)(inp)
+    return _plan(bmr, inp, params, _pace_offset(inp, params))
+
+
+# ---------- active strategy ----------
+
+@dataclass(frozen=True)
+class Strategy:
+    id: int | None
+    name: str
+    version: int
+    params: dict = field(default_factory=dict)
+
+    @property
+    def label(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+    def compute(self, inp: PlanInput) -> dict | None:
+        return STRATEGIES[self.name](inp, self.params)
+
+    @classmethod
+    def from_row(cls, row) -> "Strategy":
+        return cls(row.id, row.name, row.version, merge_params(row.params))
+
+
+BUILTIN = Strategy(None, "mifflin", 0, dict(DEFAULT_PARAMS))
+
+_cache_lock = threading.Lock()
+_cached: tuple[float, Strategy] | None = None
+
+
+def get_active_strategy() -> Strategy:
+    """Активная версия из БД (кэш в процессе), иначе встроенный mifflin@v0."""
+    global _cached
+    cached = _cached
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    from ..models import PlanStrategy
+
+    with _cache_lock:
+        row = PlanStrategy.objects.filter(is_active=True).first()
+        strategy = Strategy.from_row(row) if row and row.name in STRATEGIES else BUILTIN
+        _cached = (time.monotonic() + settings.PLAN_STRATEGY_CACHE_TTL, strategy)
+    return strategy
+
+
+def invalidate_cache() -> None:
+    global _cached
+    _cached = None
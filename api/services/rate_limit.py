@@ -0,0 +1,182 @@
+# api/services/rate_limit.py
+"""
+Token bucket для анонимных эндпоинтов (регистрация по OTP).
+
+    limiter = get_limiter()
+    ok, retry_after = limiter.take("signup:ip:1.2.3.4", "20/h")
+
+Лимит "N/период" = ведро на N токенов, которое равномерно доливается
+N токенов за период: можно сделать N запросов разом, дальше — не чаще
+одного раза в период/N. Хранилище выбирается RATE_LIMIT_STORE:
+  - memory — словарь в процессе (каждый воркер считает сам, без запросов в БД);
+  - db     — таблица RateLimitBucket, строка на ключ под select_for_update
+             (лимит общий для всех воркеров и переживает рестарт). Ключи
+             содержат IP, поэтому строки простаивающих ведер удаляет
+             prune_idle_buckets (manage.py reap_pending_signups).
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+@dataclass(frozen=True)
+class Rate:
+    capacity: float
+    per_second: float
+
+    @classmethod
+    def parse(cls, spec: str) -> "Rate":
+        """"20/h", "5/10m", "1/s" -> Rate."""
+        count, _, period = spec.strip().partition("/")
+        period = period or "s"
+        mult = int(period[:-1]) if period[:-1] else 1
+        seconds = mult * PERIODS[period[-1]]
+        return cls(float(count), float(count) / seconds)
+
+
+def _refill(tokens: float, last: float, now: float, rate: Rate) -> float:
+    return min(rate.capacity, tokens + (now - last) * rate.per_second)
+
+
+def _consume(tokens: float, cost: float, rate: Rate) -> tuple[bool, float, int]:
+    """-> (allowed, tokens после списания, retry_after сек)."""
+    if tokens >= cost:
+        return True, tokens - cost, 0
+    return False, tokens, int((cost - tokens) / rate.per_second) + 1
+
+
+class MemoryStore:
+    MAX_KEYS = 50_000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    def take(self, key: str, rate: Rate, cost: float = 1) -> tuple[bool, int]:
+        now = time.time()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (rate.capacity, now))
+            allowed, tokens, retry_after = _consume(_refill(tokens, last, now, rate), cost, rate)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.MAX_KEYS:
+                self._evict(now)
+        return allowed, retry_after
+
+    def _evict(self, now: float) -> None:
+        # ведро, не тронутое RATE_LIMIT_IDLE_TTL, уже полное — оно не отличается от отсутствующего
+        for key, (tokens, last) in list(self._buckets.items()):
+            if now - last > settings.RATE_LIMIT_IDLE_TTL:
+                del self._buckets[key]
+        while len(self._buckets) > self.MAX_KEYS:
+            self._buckets.pop(next(iter(self._buckets)))
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._buckets.pop(key, None)
+
+
+class DbStore:
+    def take(self, key: str, rate: Rate, cost: float = 1) -> tuple[bool, int]:
+        from ..models import RateLimitBucket
+
+        now = time.time()
+        with transaction.atomic():
+            bucket, created = (RateLimitBucket.objects.select_for_update()
+                               .get_or_create(key=key, defaults={"tokens": rate.capacity, "refilled_at": now}))
+            tokens = rate.capacity if created else _refill(bucket.tokens, bucket.refilled_at, now, rate)
+            allowed, tokens, retry_after = _consume(tokens, cost, rate)
+            RateLimitBucket.objects.filter(key=key).update(tokens=tokens, refilled_at=now)
+        return allowed, retry_after
+
+    def reset(self, key: str) -> None:
+        from ..models import RateLimitBucket
+
+        RateLimitBucket.objects.filter(key=key).delete()
+
+
+def prune_idle_buckets(chunk_size: int = 500, now: float | None = None):
+    """
+    Удаляет строки RateLimitBucket, не тронутые RATE_LIMIT_IDLE_TTL (индекс по
+    refilled_at), пачками по chunk_size. Итерирует число удалённых в пачке.
+    """
+    from ..models import RateLimitBucket
+
+    cutoff = (now or time.time()) - settings.RATE_LIMIT_IDLE_TTL
+    while True:
+        keys = list(RateLimitBucket.objects.filter(refilled_at__lt=cutoff)
+                    .order_by("refilled_at").values_list("key", flat=True)[:chunk_size])
+        if not keys:
+            return
+        deleted, _ = RateLimitBucket.objects.filter(key__in=keys, refilled_at__lt=cutoff).delete()
+        yield deleted
+        if len(keys) < chunk_size:
+            return
+
+
+class RateLimiter:
+    def __init__(self, store):
+        self.store = store
+        self._rates: dict[str, Rate] = {}
+
+    def rate(self, spec: str) -> Rate:
+        if spec not in self._rates:
+            self._rates[spec] = Rate.parse(spec)
+        return self._rates[spec]
+
+    def take(self, key: str, spec: str, cost: float = 1) -> tuple[bool, int]:
+        if not settings.RATE_LIMIT_ENABLED or not spec:
+            return True, 0
+        return self.store.take(key, self.rate(spec), cost)
+
+    def check(self, limits: list[tuple[str, str]]) -> int:
+        """
+        [(key, "N/период"), ...] -> 0 если всё разрешено, иначе Retry-After (сек).
+        Проверяет все ключи, чтобы каждый запрос списывался со всех ведер.
+        """
+        retry_after = 0
+        for key, spec in limits:
+            allowed, wait = self.take(key, spec)
+            if not allowed:
+                retry_after = max(retry_after, wait)
+        return retry_after
+
+
+def email_key(email: str) -> str:
+    # в таблицу лимитов не кладём сам адрес
+    return hashlib.sha256(email.lower().encode("utf-8")).hexdigest()[:32]
+
+
+def client_ip(request) -> str:
+    # за nginx REMOTE_ADDR — адрес самого nginx, настоящий клиент — в заголовке,
+    # который nginx перезаписывает (X-Real-IP $remote_addr)
+    header = settings.RATE_LIMIT_CLIENT_IP_HEADER
+    if header:
+        value = request.META.get("HTTP_" + header.upper().replace("-", "_"), "").strip()
+        if value:
+            return value
+    if settings.RATE_LIMIT_TRUST_X_FORWARDED_FOR:
+        forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+        if forwarded:
+            # $proxy_add_x_forwarded_for дописывает адрес клиента в конец;
+            # всё, что левее, клиент мог прислать сам
+            return forwarded.split(",")[-1].strip()
+    return request.META.get("REMOTE_ADDR", "") or "unknown"
+
+
+_limiter: RateLimiter | None = None
+
+
+def get_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        store = DbStore() if settings.RATE_LIMIT_STORE == "db" else MemoryStore()
+        _limiter = RateLimiter(store)
+    return _limiter
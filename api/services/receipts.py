@@ -0,0 +1,211 @@
+# api/services/receipts.py
+"""
+Очередь верификации PaymentReceiptIOS и обновление Entitlement.
+
+claim_receipts() забирает пачку pending-чеков claim-токеном (как очередь
+писем в emailer.py), verify_batch() параллельно спрашивает App Store
+Server API (сетевое ожидание — в потоках, запись в БД — в вызывающем),
+помечает чеки mark_verified/mark_rejected и одним upsert-ом обновляет
+Entitlement пользователей.
+"""
+from __future__ import annotations
+
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import entitlements
+from .appstore import AppStoreError, InvalidSignedData, TransactionNotFound, get_transaction, ms_to_datetime
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Outcome:
+    receipt_id: int
+    verified: bool = False
+    retry: bool = False
+    reason: str = ""
+    expires_at: datetime | None = None
+    product_id: str = ""
+
+
+@dataclass
+class BatchStats:
+    verified: int = 0
+    rejected: int = 0
+    retry: int = 0
+    lag_seconds: list[float] = field(default_factory=list)  # created_at -> решение
+
+
+def claim_receipts(limit: int) -> list:
+    from ..models import PaymentReceiptIOS, ReceiptStatus
+
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.RECEIPT_CLAIM_TIMEOUT)
+    due = Q(status=ReceiptStatus.PENDING) & (
+        # брошенные упавшим воркером; отпущенные на повтор (claim="") ждут next_attempt_at
+        Q(claim="", next_attempt_at__lte=now) | Q(claim__gt="", claimed_at__lt=stale)
+    )
+    ids = list(PaymentReceiptIOS.objects.filter(due).order_by("next_attempt_at", "id")
+               .values_list("id", flat=True)[:limit])
+    if not ids:
+        return []
+    claim = uuid.uuid4().hex
+    PaymentReceiptIOS.objects.filter(due, id__in=ids).update(claim=claim, claimed_at=now)
+    return list(PaymentReceiptIOS.objects.filter(claim=claim).select_related("user").order_by("id"))
+
+
+def check_transaction(receipt, info: dict) -> Outcome:
+    """Сверяет ответ Apple с тем, что прислал клиент."""
+    out = Outcome(receipt.id)
+    if settings.APPSTORE_BUNDLE_ID and info.get("bundleId") != settings.APPSTORE_BUNDLE_ID:
+        out.reason = f"bundleId mismatch: {info.get('bundleId')}"
+    elif str(info.get("originalTransactionId")) != receipt.original_transaction_id:
+        out.reason = f"originalTransactionId mismatch: {info.get('originalTransactionId')}"
+    elif info.get("productId") != receipt.product_id:
+        out.reason = f"productId mismatch: {info.get('productId')}"
+    elif receipt.app_account_token and info.get("appAccountToken") and \
+            info["appAccountToken"].lower() != receipt.app_account_token.lower():
+        out.reason = "appAccountToken mismatch"
+    elif info.get("revocationDate"):
+        out.reason = f"revoked: {info.get('revocationReason', '')}"
+    else:
+        out.verified = True
+        out.expires_at = ms_to_datetime(info.get("expiresDate"))
+        out.product_id = info.get("productId", "")
+    return out
+
+
+def _verify_one(receipt) -> Outcome:
+    try:
+        info = get_transaction(receipt.transaction_id or receipt.original_transaction_id)
+    except TransactionNotFound as e:
+        return Outcome(receipt.id, reason=str(e))
+    except InvalidSignedData as e:
+        return Outcome(receipt.id, reason=f"invalid signed data: {e}")
+    except AppStoreError as e:
+        return Outcome(receipt.id, retry=True, reason=str(e))
+    except Exception as e:
+        logger.exception("Receipt %s verification crashed", receipt.id)
+        return Outcome(receipt.id, retry=True, reason=f"{type(e).__name__}: {e}")
+    finally:
+        close_old_connections()
+    return check_transaction(receipt, info)
+
+
+def backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(settings.RECEIPT_RETRY_BACKOFF * 2 ** max(attempts - 1, 0), 3600))
+
+
+def upsert_entitlements(grants: dict[int, tuple[str, str, datetime | None]]) -> None:
+    """
+    grants: user_id -> (product_id, original_transaction_id, expires_at).
+    Не укорачивает уже выданный доступ: более поздний expires_at остаётся,
+    бессрочный (expires_at IS NULL — выданный вручную, миграция 0019) не трогается.
+    """
+    from ..models import Entitlement
+
+    if not grants:
+        return
+    now = timezone.now()
+    current = Entitlement.objects.in_bulk(list(grants), field_name="user_id")
+    rows = []
+    for user_id, (product_id, otid, expires_at) in grants.items():
+        ent = current.get(user_id)
+        if ent and ent.is_active and (ent.expires_at is None or (expires_at and ent.expires_at > expires_at)):
+            continue
+        rows.append(Entitlement(
+            user_id=user_id, product_id=product_id, original_transaction_id=otid,
+            expires_at=expires_at, is_active=expires_at is None or expires_at > now, updated_at=now,
+        ))
+    Entitlement.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["user"],
+        update_fields=["product_id", "original_transaction_id", "expires_at", "is_active", "updated_at"],
+    )
+    entitlements.invalidate(grants)
+    entitlements.sync_profiles([r.user_id for r in rows if r.is_active], True)
+    entitlements.sync_profiles([r.user_id for r in rows if not r.is_active], False)
+
+
+def verify_batch(receipts, pool: ThreadPoolExecutor) -> BatchStats:
+    from ..models import PaymentReceiptIOS
+
+    stats = BatchStats()
+    by_id = {r.id: r for r in receipts}
+    outcomes = list(pool.map(_verify_one, receipts))
+    now = timezone.now()
+    grants: dict[int, tuple[str, str, datetime | None]] = {}
+
+    with transaction.atomic():
+        for out in outcomes:
+            receipt = by_id[out.receipt_id]
+            if out.retry and receipt.attempts + 1 >= settings.RECEIPT_MAX_ATTEMPTS:
+                out = Outcome(receipt.id, reason=f"gave up after {receipt.attempts + 1} attempts: {out.reason}")
+            if out.retry:
+                attempts = receipt.attempts + 1
+                PaymentReceiptIOS.objects.filter(pk=receipt.pk).update(
+                    attempts=attempts, next_attempt_at=now + backoff(attempts),
+                    status_reason=out.reason[:2000], claim="",
+                )
+                stats.retry += 1
+                continue
+            stats.lag_seconds.append((now - receipt.created_at).total_seconds())
+            if out.verified:
+                receipt.mark_verified(expires_at=out.expires_at)
+                stats.verified += 1
+                prev = grants.get(receipt.user_id)
+                if prev is None or (prev[2] and (out.expires_at is None or out.expires_at > prev[2])):
+                    grants[receipt.user_id] = (out.product_id, receipt.original_transaction_id, out.expires_at)
+            else:
+                receipt.mark_rejected(out.reason)
+                stats.rejected += 1
+        upsert_entitlements(grants)
+    return stats
+
+
+def merge_duplicate_receipts(batch_size: int = 200):
+    """
+    Сливает повторы PaymentReceiptIOS с одинаковыми (original_transaction_id,
+    transaction_id) — до уникального ограничения клиент слал один и тот же чек
+    на каждом запуске. Из группы остаётся лучший (verified > pending > rejected,
+    при равенстве — самый ранний) с наибольшим expires_at, остальные удаляются.
+    Пачками по batch_size групп, транзакция на пачку; итерирует (групп, удалено).
+    Миграция 0016 делает то же своей копией кода.
+    """
+    from ..models import PaymentReceiptIOS, ReceiptStatus
+
+    rank = {ReceiptStatus.VERIFIED: 0, ReceiptStatus.PENDING: 1, ReceiptStatus.REJECTED: 2}
+    keys_qs = (PaymentReceiptIOS.objects.values("original_transaction_id", "transaction_id")
+               .annotate(n=Count("id")).filter(n__gt=1)
+               .order_by("original_transaction_id", "transaction_id"))
+    while True:
+        # слитые группы из выборки пропадают — каждый раз берём первые batch_size
+        keys = [(k["original_transaction_id"], k["transaction_id"]) for k in keys_qs[:batch_size]]
+        if not keys:
+            return
+        cond = Q()
+        for otid, tid in keys:
+            cond |= Q(original_transaction_id=otid, transaction_id=tid)
+        with transaction.atomic():
+            groups: dict[tuple[str, str], list] = {}
+            for r in PaymentReceiptIOS.objects.filter(cond).order_by("id"):
+                groups.setdefault((r.original_transaction_id, r.transaction_id), []).append(r)
+            drop = []
+            for rows in groups.values():
+                keep = min(rows, key=lambda r: (rank.get(r.status, 3), r.id))
+                expires = [r.expires_at for r in rows if r.expires_at and r.status == keep.status]
+                if expires and max(expires) != keep.expires_at:
+                    PaymentReceiptIOS.objects.filter(pk=keep.pk).update(expires_at=max(expires))
+                drop.extend(r.id for r in rows if r is not keep)
+            removed, _ = PaymentReceiptIOS.objects.filter(id__in=drop).delete()
+        yield len(keys), removed
@@ -0,0 +1,196 @@
+# api/services/report_search.py
+"""
+Полнотекстовый поиск по заявкам (Report.name + Report.comment).
+
+- SQLite: FTS5-таблица api_report_fts (external content, без копии текста),
+  синхронизируется триггерами на api_report; ранжирование — bm25,
+  название весит больше комментария.
+- Postgres: GIN-индекс по выражению tsvector (название — вес A, комментарий — B),
+  запрос использует то же выражение, ранжирование — ts_rank.
+- Другие БД — icontains, как было.
+
+Каждое слово запроса ищется как префикс («chi» найдёт «chicken») — поиск
+идёт на каждое нажатие клавиши в админке.
+
+Таблицу и триггеры создаёт миграция 0018 (со своим снимком того же SQL);
+install() идемпотентен и вызывается ещё на post_migrate: SQLite-миграции
+Django пересоздают таблицу при многих AlterField — и триггеры на старой
+таблице пропадают молча; если чего-то не хватало, индекс перестраивается
+целиком.
+"""
+from __future__ import annotations
+
+import re
+
+from django.conf import settings
+from django.db import connection as default_connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = "api_report_fts"
+PG_INDEX = "report_search_gin"
+PG_VECTOR = ("setweight(to_tsvector('simple', name), 'A') || "
+             "setweight(to_tsvector('simple', comment), 'B')")
+
+_SQLITE_TRIGGERS = {
+    "api_report_fts_ai": """
+        CREATE TRIGGER IF NOT EXISTS api_report_fts_ai AFTER INSERT ON api_report BEGIN
+            INSERT INTO api_report_fts(rowid, name, comment) VALUES (new.id, new.name, new.comment);
+        END""",
+    "api_report_fts_ad": """
+        CREATE TRIGGER IF NOT EXISTS api_report_fts_ad AFTER DELETE ON api_report BEGIN
+            INSERT INTO api_report_fts(api_report_fts, rowid, name, comment)
+            VALUES ('delete', old.id, old.name, old.comment);
+        END""",
+    "api_report_fts_au": """
+        CREATE TRIGGER IF NOT EXISTS api_report_fts_au AFTER UPDATE OF name, comment ON api_report BEGIN
+            INSERT INTO api_report_fts(api_report_fts, rowid, name, comment)
+            VALUES ('delete', old.id, old.name, old.comment);
+            INSERT INTO api_report_fts(rowid, name, comment) VALUES (new.id, new.name, new.comment);
+        END""",
+}
+
+
+def install(connection=None) -> bool:
+    """Создаёт недостающее; True — что-то создали (и индекс перестроен)."""
+    connection = connection or default_connection
+    with connection.cursor() as cur:
+        if connection.vendor == "sqlite":
+            cur.execute("SELECT name FROM sqlite_master WHERE name = %s OR name LIKE %s",
+                        [FTS_TABLE, "api_report_fts_a_"])
+            existing = {row[0] for row in cur.fetchall()}
+            missing = ({FTS_TABLE} | set(_SQLITE_TRIGGERS)) - existing
+            if not missing:
+                return False
+            cur.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+                    name, comment, content='api_report', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )""")
+            for sql in _SQLITE_TRIGGERS.values():
+                cur.execute(sql)
+            cur.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+            return True
+        if connection.vendor == "postgresql":
+            cur.execute("SELECT 1 FROM pg_indexes WHERE indexname = %s", [PG_INDEX])
+            if cur.fetchone():
+                return False
+            cur.execute(f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON api_report USING GIN (({PG_VECTOR}))")
+            return True
+    return False
+
+
+def uninstall(connection=None) -> None:
+    connection = connection or default_connection
+    with connection.cursor() as cur:
+        if connection.vendor == "sqlite":
+            for name in _SQLITE_TRIGGERS:
+                cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cur.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        elif connection.vendor == "postgresql":
+            cur.execute(f"DROP INDEX IF EXISTS {PG_INDEX}")
+
+
+def _terms(q: str) -> list[str]:
+    # только буквы/цифры: синтаксис MATCH / to_tsquery из ввода не пропускаем
+    return re.findall(r"\w+", q.lower())[:8]
+
+
+def _fts_match(terms: list[str]) -> str:
+    return " ".join(f'"{t}"*' for t in terms)
+
+
+def _tsquery(terms: list[str]) -> str:
+    return " & ".join(f"{t}:*" for t in terms)
+
+
+def match_filter(q: str) -> Q:
+    """
+    Q для queryset Report: все совпадения q, без limit и ранжирования —
+    подзапрос к индексу, фильтры и пагинация остаются за ORM (админка).
+    """
+    terms = _terms(q)
+    if not terms:
+        return Q(pk__in=[])
+    vendor = default_connection.vendor
+    if vendor == "sqlite":
+        return Q(id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+                               [_fts_match(terms)]))
+    if vendor == "postgresql":
+        return Q(id__in=RawSQL(f"SELECT id FROM api_report WHERE ({PG_VECTOR}) @@ to_tsquery('simple', %s)",
+                               [_tsquery(terms)]))
+    cond = Q()
+    for t in terms:
+        cond &= Q(name__icontains=t) | Q(comment__icontains=t)
+    return cond
+
+
+def search_ids(q: str, limit: int, offset: int = 0, order: str = "relevance") -> list[tuple[int, float]]:
+    """
+    [(report_id, score)] от лучшего к худшему (score больше — лучше).
+    order="recent" — совпадения от новых к старым без ранжирования (индекс
+    отдаёт их по id, запрос останавливается на limit). "relevance" ранжирует
+    только REPORT_SEARCH_RANK_WINDOW самых новых совпадений: частое слово
+    совпадает почти со всеми заявками, и считать bm25 по всей таблице на
+    каждое нажатие клавиши незачем.
+    """
+    from ..models import Report
+
+    terms = _terms(q)
+    if not terms:
+        return []
+    window = max(settings.REPORT_SEARCH_RANK_WINDOW, offset + limit)
+    vendor = default_connection.vendor
+    with default_connection.cursor() as cur:
+        if vendor == "sqlite":
+            match = _fts_match(terms)
+            if order == "recent":
+                cur.execute(f"SELECT rowid, 0.0 FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                            f"ORDER BY rowid DESC LIMIT %s OFFSET %s", [match, limit, offset])
+                return list(cur.fetchall())
+            cur.execute(
+                f"SELECT rowid, bm25({FTS_TABLE}, 4.0, 1.0) AS score FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND rowid >= ("
+                f"  SELECT coalesce(min(rowid), 0) FROM ("
+                f"    SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s ORDER BY rowid DESC LIMIT %s))"
+                f" ORDER BY score, rowid DESC LIMIT %s OFFSET %s",
+                [match, match, window, limit, offset],
+            )
+            # bm25: чем меньше, тем лучше
+            return [(rid, -score) for rid, score in cur.fetchall()]
+        if vendor == "postgresql":
+            tsquery = _tsquery(terms)
+            if order == "recent":
+                cur.execute(f"SELECT id, 0.0 FROM api_report WHERE ({PG_VECTOR}) @@ to_tsquery('simple', %s) "
+                            f"ORDER BY id DESC LIMIT %s OFFSET %s", [tsquery, limit, offset])
+                return list(cur.fetchall())
+            cur.execute(
+                f"SELECT id, ts_rank({PG_VECTOR}, query) AS score "
+                f"FROM api_report, to_tsquery('simple', %s) query "
+                f"WHERE ({PG_VECTOR}) @@ query AND id >= ("
+                f"  SELECT coalesce(min(id), 0) FROM ("
+                f"    SELECT id FROM api_report WHERE ({PG_VECTOR}) @@ query ORDER BY id DESC LIMIT %s) w)"
+                f" ORDER BY score DESC, id DESC LIMIT %s OFFSET %s",
+                [tsquery, window, limit, offset],
+            )
+            return list(cur.fetchall())
+
+    qs = Report.objects.all()
+    for t in terms:
+        qs = qs.filter(Q(name__icontains=t) | Q(comment__icontains=t))
+    return [(rid, 0.0) for rid in qs.order_by("-id").values_list("id", flat=True)[offset:offset + limit]]
+
+
+def search(q: str, limit: int, offset: int = 0, order: str = "relevance") -> list:
+    """Report-ы в порядке search_ids, с атрибутом .score."""
+    from ..models import Report
+
+    ranked = search_ids(q, limit, offset, order)
+    reports = Report.objects.select_related("user").in_bulk([rid for rid, _ in ranked])
+    out = []
+    for rid, score in ranked:
+        report = reports.get(rid)
+        if report is not None:
+            report.score = score
+            out.append(report)
+    return out
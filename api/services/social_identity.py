@@ -0,0 +1,51 @@
+# api/services/social_identity.py
+"""
+Пользователь по входу через Google/Apple.
+
+Сначала — SocialIdentity по (provider, sub) (уникальный индекс). Нет привязки —
+пользователь по email из токена (или новый), и привязка создаётся. Без email
+у пользователя остаётся технический адрес {provider}_{sub}@example.invalid
+(email обязателен и уникален), но искать по нему больше не нужно.
+"""
+from __future__ import annotations
+
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+
+SYNTHETIC_EMAIL_RE = re.compile(r"^(?P<provider>google|apple)_(?P<sub>.+)@example\.invalid$")
+
+
+def synthetic_email(provider: str, sub: str) -> str:
+    return f"{provider}_{sub}@example.invalid"
+
+
+def resolve_social_user(provider: str, sub: str, email: str = "", defaults: dict | None = None):
+    """
+    -> (user, created). IntegrityError — параллельный вход успел раньше:
+    привязку (provider, sub) или пользователя с тем же email создал другой
+    запрос; второй проход находит их. Больше одного повтора не нужно.
+    """
+    from ..models import SocialIdentity
+
+    User = get_user_model()
+    for attempt in range(2):
+        ident = SocialIdentity.objects.select_related("user").filter(provider=provider, sub=sub).first()
+        if ident is not None:
+            return ident.user, False
+
+        try:
+            with transaction.atomic():
+                # по email — как раньше: вход через провайдера в уже существующий аккаунт;
+                # по техническому адресу — ещё не перенесённые backfill_social_identities
+                user, created = User.objects.get_or_create(
+                    email=email or synthetic_email(provider, sub),
+                    defaults=defaults or {},
+                )
+                SocialIdentity.objects.create(user=user, provider=provider, sub=sub, email=email)
+        except IntegrityError:
+            if attempt:
+                raise
+            continue
+        return user, created
@@ -2,22 +2,25 @@
 
 from __future__ import annotations
 
-from functools import lru_cache
 from typing import Dict, Any, Iterable, Union
 
-# --- Google ---
-from google.oauth2 import id_token as google_id_token
-from google.auth.transport import requests as grequests
-
-# --- Apple / JWT ---
+# --- Apple / Google: JWT + кэш JWKS ---
 import jwt
-from jwt import PyJWKClient
 
 # --- HTTP (иногда полезно для явных ошибок сети) ---
 import requests
 
+from .jwks import apple_keys, google_keys
+
 APPLE_ISS = "https://appleid.apple.com"
-APPLE_JWKS_URL = f"{APPLE_ISS}/auth/keys"
+GOOGLE_ISSUERS = ("https://accounts.google.com", "accounts.google.com")
+
+
+def _kid(token: str) -> str:
+    try:
+        return jwt.get_unverified_header(token)["kid"]
+    except (jwt.DecodeError, KeyError):
+        raise ValueError("Malformed token header (no kid)")
 
 
 # ---------- Google ----------
@@ -26,27 +29,24 @@ def verify_google_id_token(id_token: str, audience: str) -> Dict[str, Any]:
     Возвращает dict с полями Google:
     sub, email, email_verified, given_name, family_name, picture, ...
     Бросает Exception, если токен некорректен.
+    Ключи — из общего кэша JWKS (google-auth качал сертификаты на каждый вызов).
     """
-    info = google_id_token.verify_oauth2_token(
-        id_token, grequests.Request(), audience
+    key = google_keys().get_signing_key(_kid(id_token))
+    info = jwt.decode(
+        id_token,
+        key=key.key,
+        algorithms=["RS256"],
+        audience=audience,
+        options={"require": ["iss", "sub", "aud", "exp", "iat"]},
+        leeway=60,
     )
     iss = info.get("iss")
-    if iss not in ("https://accounts.google.com", "accounts.google.com"):
+    if iss not in GOOGLE_ISSUERS:
         raise ValueError("Invalid issuer")
     return info
 
 
 # ---------- Apple ----------
-@lru_cache(maxsize=1)
-def _get_pyjwk_client() -> PyJWKClient:
-    """
-    Кэшируем PyJWKClient: он сам подтянет и будет переиспользовать ключи Apple.
-    cache_clear() вызовется автоматически при обновлении кода процесса,
-    а при явной необходимости можно очистить кэш вручную.
-    """
-    return PyJWKClient(APPLE_JWKS_URL, cache_keys=True)
-
-
 def _aud_match(token_aud: Union[str, Iterable[str], None], expected: str) -> bool:
     if isinstance(token_aud, str):
         return token_aud == expected
@@ -59,7 +59,7 @@ def verify_apple_id_token(identity_token: str, audience: str, *, verify_aud_in_d
     """
     Верифицирует Apple ID token и возвращает claims.
     Делает:
-      - Подпись по JWK Apple (PyJWKClient)
+      - Подпись по JWK Apple (services/jwks.py)
       - Проверку iss
       - Проверку aud (в decode или вручную — см. verify_aud_in_decode)
       - Допуск по времени (leeway=300)
@@ -67,9 +67,8 @@ def verify_apple_id_token(identity_token: str, audience: str, *, verify_aud_in_d
     Явно бросает понятные ошибки при сбоях.
     """
     try:
-        # 1) Получаем ключ для подписи из заголовка токена (kid) через PyJWKClient
-        jwk_client = _get_pyjwk_client()
-        signing_key = jwk_client.get_signing_key_from_jwt(identity_token).key
+        # 1) Получаем ключ для подписи по kid из заголовка токена (кэш JWKS)
+        signing_key = apple_keys().get_signing_key(_kid(identity_token)).key
 
         # 2) Собираем опции декодирования
         options = {
@@ -0,0 +1,68 @@
+# api/services/timeseries.py
+"""Даунсэмплинг рядов для графиков."""
+from __future__ import annotations
+
+from typing import Sequence
+
+
+def lttb(points: Sequence[tuple[float, float]], threshold: int) -> list[tuple[float, float]]:
+    """
+    Largest-Triangle-Three-Buckets (Steinarsson, 2013): оставляет threshold
+    точек, сохраняя форму ряда (пики и провалы), в отличие от простого
+    усреднения. points — (x, y), отсортированы по x. Первая и последняя
+    точки сохраняются всегда.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0  # индекс последней выбранной точки
+
+    for i in range(threshold - 2):
+        # среднее следующего бакета — третья вершина треугольника
+        nxt_start = int((i + 1) * every) + 1
+        nxt_end = min(max(int((i + 2) * every) + 1, nxt_start + 1), n)
+        span = nxt_end - nxt_start
+        avg_x = sum(p[0] for p in points[nxt_start:nxt_end]) / span
+        avg_y = sum(p[1] for p in points[nxt_start:nxt_end]) / span
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = points[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+
+    sampled.append(points[-1])
+    return sampled
+
+
+def merge_buckets(buckets: Sequence[dict], limit: int) -> list[dict]:
+    """
+    Сливает соседние агрегаты {"t", "avg", "min", "max", "n"} (по времени)
+    так, чтобы их осталось не больше limit: avg — взвешенное по n, min/max —
+    по группе, t — начало первого бакета группы.
+    """
+    n = len(buckets)
+    if n <= limit:
+        return list(buckets)
+    size = -(-n // limit)  # ceil
+    merged = []
+    for i in range(0, n, size):
+        group = buckets[i:i + size]
+        total = sum(b["n"] for b in group)
+        merged.append({
+            "t": group[0]["t"],
+            "avg": sum(b["avg"] * b["n"] for b in group) / total,
+            "min": min(b["min"] for b in group),
+            "max": max(b["max"] for b in group),
+            "n": total,
+        })
+    return merged
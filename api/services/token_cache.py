@@ -0,0 +1,81 @@
+# api/services/token_cache.py
+"""
+Кэш уже проверенных ID-токенов Apple/Google.
+
+Клиент часто шлёт тот же id_token повторно (возврат в приложение, ретраи).
+Повтор находит в кэше claims и id пользователя и пропускает RS256-проверку
+и get_or_create; сам пользователь всё равно читается по pk (is_active=True),
+так что удалённый или отключённый в другом процессе токенов не получит. Ключ — sha256(провайдер, audience, токен): сам токен
+в памяти не храним. Запись живёт до exp токена (но не дольше
+SOCIAL_TOKEN_CACHE_MAX_TTL), так что истёкший токен снова идёт через полную
+проверку и отклоняется. Кэшируется только результат проверки подписи/iss/aud —
+nonce из запроса сверяется с claims при каждом вызове, как и раньше.
+
+Кэш на процесс (каждый воркер gunicorn — свой), размер ограничен LRU.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class VerifiedTokenCache:
+    def __init__(self, max_size: int, max_ttl: float):
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self._lock = threading.Lock()
+        # key -> (claims, user_id, expires_at unix time)
+        self._items: OrderedDict[str, tuple[dict, int, float]] = OrderedDict()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def _key(provider: str, audience: str, token: str) -> str:
+        return hashlib.sha256(f"{provider}\0{audience}\0{token}".encode("utf-8")).hexdigest()
+
+    def get(self, provider: str, audience: str, token: str) -> tuple[dict, int] | None:
+        if self.max_size <= 0:
+            return None
+        key = self._key(provider, audience, token)
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[2] <= time.time():
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0], item[1]
+
+    def put(self, provider: str, audience: str, token: str, claims: dict, user_id: int) -> None:
+        if self.max_size <= 0:
+            return
+        exp = claims.get("exp")
+        if not isinstance(exp, (int, float)):
+            return
+        expires_at = min(float(exp), time.time() + self.max_ttl)
+        if expires_at <= time.time():
+            return
+        key = self._key(provider, audience, token)
+        with self._lock:
+            self._items[key] = (claims, user_id, expires_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def forget_user(self, user_id: int) -> None:
+        """Пользователь удалён — не держать его записи (только в этом процессе)."""
+        with self._lock:
+            for key in [k for k, v in self._items.items() if v[1] == user_id]:
+                del self._items[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+verified_tokens = VerifiedTokenCache(settings.SOCIAL_TOKEN_CACHE_SIZE, settings.SOCIAL_TOKEN_CACHE_MAX_TTL)
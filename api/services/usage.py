@@ -0,0 +1,193 @@
+# api/services/usage.py
+"""
+Учёт токенов vision-модели и суточные бюджеты на пользователя.
+
+Проверка бюджета идёт по in-memory счётчику (без запросов в БД на каждый
+вызов). Приращения копятся и сбрасываются в DailyTokenUsage не позже чем
+через USAGE_FLUSH_INTERVAL секунд одним F()-апдейтом на пользователя:
+при следующем charge()/проверке бюджета, а если воркер простаивает — по
+таймеру в фоновом потоке.
+Итог из БД перечитывается после сброса и не реже раза в интервал, поэтому
+траты других воркеров видны с задержкой примерно в два интервала (их
+сброс + наше перечитывание) — для «потолка» этого достаточно.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CallStats:
+    """Сводка по одному анализу (может включать повторный запрос)."""
+    model: str = ""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    image_bytes: int = 0
+    latency_ms: int = 0
+    attempts: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add_response(self, resp, latency_s: float) -> None:
+        usage = getattr(resp, "usage", None)
+        if usage is not None:
+            self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+            self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+        self.model = getattr(resp, "model", "") or self.model
+        self.latency_ms += int(latency_s * 1000)
+        self.attempts += 1
+
+
+class TokenBudget:
+    def __init__(self, daily_limit: int, flush_interval: float):
+        self.daily_limit = daily_limit          # 0 = без лимита
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._day: date | None = None
+        self._db_spent: dict[int, tuple[int, float]] = {}  # user_id -> (токены в БД, когда прочитали)
+        self._pending: dict[int, list[int]] = {}  # user_id -> [tokens, calls] ещё не в БД
+        self._last_flush = time.monotonic()
+        self._timer: threading.Timer | None = None
+
+    # ---- internal ----
+    def _rollover(self) -> None:
+        today = timezone.localdate()
+        if self._day != today:
+            if self._day is not None and self._pending:
+                self._flush_locked()
+            self._day = today
+            self._db_spent.clear()
+
+    def _load(self, user_id: int) -> int:
+        """Токены за день: итог из БД (все воркеры) + ещё не сброшенные локальные."""
+        from ..models import DailyTokenUsage
+
+        cached = self._db_spent.get(user_id)
+        if cached is None or time.monotonic() - cached[1] >= self.flush_interval:
+            row = (DailyTokenUsage.objects
+                   .filter(user_id=user_id, day=self._day)
+                   .values_list("tokens", flat=True)
+                   .first())
+            cached = self._db_spent[user_id] = (row or 0, time.monotonic())
+        return cached[0] + self._pending.get(user_id, (0, 0))[0]
+
+    def _flush_if_due_locked(self) -> None:
+        if self._pending and time.monotonic() - self._last_flush >= self.flush_interval:
+            self._flush_locked()
+
+    def _schedule_locked(self) -> None:
+        # сброс по времени, даже если следующего вызова не будет (воркер простаивает)
+        if self._timer is None and self._pending:
+            self._timer = threading.Timer(max(self.flush_interval, 1.0), self._timed_flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _timed_flush(self) -> None:
+        try:
+            with self._lock:
+                self._timer = None
+                if self._day is not None:
+                    self._flush_locked()
+                self._schedule_locked()
+        finally:
+            # у потока таймера своё соединение с БД
+            connection.close()
+
+    def _flush_locked(self) -> None:
+        from ..models import DailyTokenUsage
+
+        pending, self._pending = self._pending, {}
+        self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            with transaction.atomic():
+                for user_id, (tokens, calls) in pending.items():
+                    updated = DailyTokenUsage.objects.filter(user_id=user_id, day=self._day).update(
+                        tokens=F("tokens") + tokens, calls=F("calls") + calls,
+                    )
+                    if not updated:
+                        DailyTokenUsage.objects.create(user_id=user_id, day=self._day, tokens=tokens, calls=calls)
+            # сброшенное теперь в БД — итог перечитаем вместе с чужими тратами
+            for user_id in pending:
+                self._db_spent.pop(user_id, None)
+        except Exception:
+            logger.exception("Token usage flush failed; %d users kept in memory", len(pending))
+            for user_id, (tokens, calls) in pending.items():
+                acc = self._pending.setdefault(user_id, [0, 0])
+                acc[0] += tokens
+                acc[1] += calls
+
+    # ---- public ----
+    def spent_today(self, user_id: int) -> int:
+        with self._lock:
+            self._rollover()
+            self._flush_if_due_locked()
+            return self._load(user_id)
+
+    def exceeded(self, user_id: int) -> bool:
+        if not self.daily_limit:
+            return False
+        return self.spent_today(user_id) >= self.daily_limit
+
+    def charge(self, user_id: int, tokens: int) -> None:
+        with self._lock:
+            self._rollover()
+            acc = self._pending.setdefault(user_id, [0, 0])
+            acc[0] += tokens
+            acc[1] += 1
+            self._flush_if_due_locked()
+            self._schedule_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._day is not None:
+                self._flush_locked()
+
+
+token_budget = TokenBudget(
+    daily_limit=settings.ANALYSIS_DAILY_TOKEN_BUDGET,
+    flush_interval=settings.USAGE_FLUSH_INTERVAL,
+)
+atexit.register(token_budget.flush)
+
+
+def record_analysis(user, stats: CallStats, meal=None, ok: bool = True):
+    """Пишет компактную запись о вызове и списывает токены из бюджета."""
+    from ..models import AnalysisUsage
+
+    usage = AnalysisUsage.objects.create(
+        user=user,
+        meal=meal,
+        model=stats.model[:64],
+        prompt_tokens=stats.prompt_tokens,
+        completion_tokens=stats.completion_tokens,
+        image_bytes=stats.image_bytes,
+        latency_ms=stats.latency_ms,
+        attempts=max(stats.attempts, 1),
+        ok=ok,
+    )
+    token_budget.charge(user.id, stats.total_tokens)
+    return usage
+
+
+def estimate_cost_usd(prompt_tokens: int, completion_tokens: int) -> float:
+    return round(
+        prompt_tokens * settings.OPENAI_PRICE_INPUT_PER_1M / 1_000_000
+        + completion_tokens * settings.OPENAI_PRICE_OUTPUT_PER_1M / 1_000_000,
+        6,
+    )
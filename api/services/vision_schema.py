@@ -0,0 +1,186 @@
+# api/services/vision_schema.py
+"""
+Схема ответа vision-модели + починка «почти правильных» ответов.
+
+Понимает два формата: подробный (title/calories/.../ingredients как объекты)
+и компактный (короткие ключи, ингредиенты кортежами) — см. COMPACT_KEYS.
+
+Мелкие огрехи (строки вместо чисел, "12 g", 12.6, отрицательные значения,
+итоги, не сходящиеся с суммой ингредиентов) чиним на месте. Невосстановимые
+случаи (не JSON, пустой анализ) поднимают ValidationError — тогда
+openai_vision делает ОДИН уточняющий повторный запрос.
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator, model_validator
+
+__all__ = ["Ingredient", "MealMeta", "MealAnalysis", "expand_compact", "parse_analysis", "ValidationError"]
+
+MACRO_FIELDS = ("calories", "protein_g", "fat_g", "carbs_g")
+
+# относительное расхождение итогов с суммой ингредиентов, после которого
+# доверяем ингредиентам и пересчитываем итог
+TOTALS_TOLERANCE = 0.15
+
+_NUM_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+# компактный ответ: {"t","k","p","f","c","i":[[name,k,p,f,c],...],"h","l"}
+COMPACT_KEYS = {
+    "t": "title",
+    "k": "calories",
+    "p": "protein_g",
+    "f": "fat_g",
+    "c": "carbs_g",
+    "i": "ingredients",
+}
+COMPACT_META_KEYS = {"h": "health_score", "l": "labels"}
+INGREDIENT_TUPLE = ("name",) + MACRO_FIELDS
+
+
+def expand_compact(data: Any) -> Any:
+    """Короткие ключи -> поля Meal. Подробный формат проходит как есть."""
+    if not isinstance(data, dict) or not (data.keys() & COMPACT_KEYS.keys()):
+        return data
+    out = {COMPACT_KEYS.get(k, k): v for k, v in data.items() if k not in COMPACT_META_KEYS}
+    meta = dict(out.get("meta") or {})
+    for short, field in COMPACT_META_KEYS.items():
+        if short in data:
+            meta[field] = data[short]
+    out["meta"] = meta
+    return out
+
+
+def _to_int(value: Any) -> int:
+    """12 / 12.6 / "12" / "12,6 g" / None -> неотрицательный int."""
+    if value is None or value == "":
+        return 0
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, int):
+        return max(value, 0)
+    if isinstance(value, float):
+        return max(int(round(value)), 0)
+    if isinstance(value, str):
+        m = _NUM_RE.search(value.replace(",", "."))
+        if m:
+            return max(int(round(float(m.group()))), 0)
+    raise ValueError(f"expected a number, got {value!r}")
+
+
+class Ingredient(BaseModel):
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True)
+
+    name: str
+    calories: int = 0
+    protein_g: int = 0
+    fat_g: int = 0
+    carbs_g: int = 0
+
+    @model_validator(mode="before")
+    @classmethod
+    def _from_plain_string(cls, data: Any) -> Any:
+        # модель иногда отдаёт ингредиенты просто строками,
+        # компактный формат — кортежем [name, kcal, p, f, c]
+        if isinstance(data, str):
+            return {"name": data}
+        if isinstance(data, (list, tuple)):
+            return dict(zip(INGREDIENT_TUPLE, data))
+        return data
+
+    @field_validator(*MACRO_FIELDS, mode="before")
+    @classmethod
+    def _coerce_int(cls, v: Any) -> int:
+        return _to_int(v)
+
+
+class MealMeta(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    health_score: Optional[int] = None
+    labels: List[str] = Field(default_factory=list)
+
+    @field_validator("health_score", mode="before")
+    @classmethod
+    def _coerce_score(cls, v: Any) -> Optional[int]:
+        return None if v is None or v == "" else _to_int(v)
+
+    @field_validator("labels", mode="before")
+    @classmethod
+    def _coerce_labels(cls, v: Any) -> List[str]:
+        if v is None:
+            return []
+        if isinstance(v, str):
+            v = [v]
+        return [str(x).strip() for x in v if str(x).strip()]
+
+
+class MealAnalysis(BaseModel):
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True)
+
+    title: str = ""
+    calories: int = 0
+    protein_g: int = 0
+    fat_g: int = 0
+    carbs_g: int = 0
+    ingredients: List[Ingredient] = Field(default_factory=list)
+    meta: MealMeta = Field(default_factory=MealMeta)
+
+    @model_validator(mode="before")
+    @classmethod
+    def _expand_compact(cls, data: Any) -> Any:
+        return expand_compact(data)
+
+    @field_validator("title", mode="before")
+    @classmethod
+    def _coerce_title(cls, v: Any) -> str:
+        return "" if v is None else str(v)
+
+    @field_validator(*MACRO_FIELDS, mode="before")
+    @classmethod
+    def _coerce_int(cls, v: Any) -> int:
+        return _to_int(v)
+
+    @field_validator("meta", mode="before")
+    @classmethod
+    def _coerce_meta(cls, v: Any) -> Any:
+        return v if isinstance(v, dict) else {}
+
+    @model_validator(mode="after")
+    def _repair_totals(self) -> "MealAnalysis":
+        repaired = []
+
+        # 1) итоги из ингредиентов (если в ингредиентах вообще есть цифры)
+        if self.ingredients:
+            for field in MACRO_FIELDS:
+                total = sum(getattr(i, field) for i in self.ingredients)
+                if total <= 0:
+                    continue
+                current = getattr(self, field)
+                if abs(current - total) > TOTALS_TOLERANCE * max(current, total):
+                    setattr(self, field, total)
+                    repaired.append(field)
+
+        # 2) калории из БЖУ, если модель их не дала
+        if self.calories == 0 and (self.protein_g or self.fat_g or self.carbs_g):
+            self.calories = 4 * self.protein_g + 9 * self.fat_g + 4 * self.carbs_g
+            repaired.append("calories")
+
+        if not (self.title or self.calories or self.ingredients):
+            raise ValueError("empty analysis: no title, calories or ingredients")
+
+        if repaired:
+            extra = self.meta.__pydantic_extra__
+            extra["repaired"] = sorted(set(repaired))
+        return self
+
+    def to_meal_fields(self) -> dict:
+        """Поля в формате модели Meal."""
+        return self.model_dump()
+
+
+def parse_analysis(text: str | bytes) -> MealAnalysis:
+    """Парсинг + валидация одним проходом (pydantic-core читает JSON сам)."""
+    return MealAnalysis.model_validate_json(text)
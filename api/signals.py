@@ -1,12 +1,57 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_migrate, post_save
 from django.dispatch import receiver
 
-from .models import UserProfile, NutritionPlan
+from .models import UserProfile, NutritionPlan, Meal, PlanStrategy, Entitlement
+from .services import entitlements, report_search
+from .services.ingredient_index import ingredient_names, loaded_index
+from .services.plan_strategies import invalidate_cache as invalidate_plan_strategy
+from .services.token_cache import verified_tokens
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
-def create_profile_and_plan(sender, instance, created, **kwargs):
-    if created:
-        UserProfile.objects.get_or_create(user=instance)
-        NutritionPlan.objects.get_or_create(user=instance)
+def create_profile_and_plan(sender, instance, created, raw=False, **kwargs):
+    # у только что созданного пользователя их точно нет — без SELECT-ов get_or_create
+    # (raw — loaddata: профили придут из фикстуры)
+    if created and not raw:
+        UserProfile.objects.create(user=instance)
+        NutritionPlan.objects.create(user=instance)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def forget_cached_social_tokens(sender, instance, **kwargs):
+    verified_tokens.forget_user(instance.pk)
+
+
+@receiver(post_save, sender=Meal)
+def index_edited_ingredients(sender, instance, created, update_fields=None, **kwargs):
+    # новые блюда индекс сам подтянет по watermark; здесь — только правки старых
+    idx = loaded_index()
+    if idx is None or created or instance.pk > idx.watermark:
+        return
+    if update_fields is not None and "ingredients" not in update_fields:
+        return
+    idx.add(ingredient_names(instance.ingredients))
+
+
+@receiver(post_save, sender=PlanStrategy)
+@receiver(post_delete, sender=PlanStrategy)
+def reset_plan_strategy_cache(sender, **kwargs):
+    # другие воркеры подхватят новую версию по PLAN_STRATEGY_CACHE_TTL
+    invalidate_plan_strategy()
+
+
+@receiver(post_save, sender=Entitlement)
+@receiver(post_delete, sender=Entitlement)
+@receiver(post_save, sender=UserProfile)
+def reset_premium_cache(sender, instance, **kwargs):
+    entitlements.invalidate([instance.user_id])
+
+
+@receiver(post_migrate)
+def ensure_report_search(sender, using="default", **kwargs):
+    # SQLite-миграция, пересоздавшая api_report, теряет FTS-триггеры — возвращаем
+    if sender.name != "api":
+        return
+    from django.db import connections
+    report_search.install(connections[using])
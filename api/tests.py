@@ -1,3 +1,1145 @@
-from django.test import TestCase
+import base64
+import json
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.x509.oid import NameOID
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import (AppStoreNotification, Entitlement, NotificationStatus, PaymentReceiptIOS, ReceiptStatus,
+                     User)
+from .services import appstore, appstore_notifications, jwks, receipts
+from .services.social_verify import verify_google_id_token
+
+
+# ---------- локальная цепочка «как у Apple» ----------
+
+def _cert(name, key, issuer_name, issuer_key, *, ca, oid=None):
+    now = datetime.now(dt_timezone.utc)
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)]))
+        .issuer_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, issuer_name)]))
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=30))
+    )
+    if ca is not None:
+        builder = builder.add_extension(x509.BasicConstraints(ca=ca, path_length=None), critical=True)
+    if oid is not None:
+        builder = builder.add_extension(x509.UnrecognizedExtension(oid, b"\x05\x00"), critical=False)
+    return builder.sign(issuer_key, hashes.SHA256())
+
+
+class AppleChain:
+    """Корень, промежуточный и лист; по умолчанию — с маркерами Apple."""
+
+    def __init__(self, leaf_oid=appstore.LEAF_OID, intermediate_oid=appstore.INTERMEDIATE_OID,
+                 intermediate_ca=True):
+        self.root_key, self.int_key, self.leaf_key = (ec.generate_private_key(ec.SECP256R1()) for _ in range(3))
+        self.root = _cert("Test Root", self.root_key, "Test Root", self.root_key, ca=True)
+        self.intermediate = _cert("Test WWDR", self.int_key, "Test Root", self.root_key,
+                                  ca=intermediate_ca, oid=intermediate_oid)
+        self.leaf = _cert("Test App Store", self.leaf_key, "Test WWDR", self.int_key, ca=False, oid=leaf_oid)
+
+    def x5c(self):
+        return [base64.b64encode(c.public_bytes(serialization.Encoding.DER)).decode()
+                for c in (self.leaf, self.intermediate, self.root)]
+
+    def sign(self, payload: dict) -> str:
+        return jwt.encode(payload, self.leaf_key, algorithm="ES256", headers={"x5c": self.x5c()})
+
+    def trust(self):
+        """override_settings с корнем этой цепочки как APPSTORE_ROOT_CERT_PATH."""
+        tmp = tempfile.NamedTemporaryFile(suffix=".cer", delete=False)
+        tmp.write(self.root.public_bytes(serialization.Encoding.DER))
+        tmp.close()
+        return override_settings(APPSTORE_ROOT_CERT_PATH=tmp.name, APPSTORE_ALLOW_UNTRUSTED_ROOT=False)
+
+
+def _ms(dt):
+    return int(dt.timestamp() * 1000)
+
+
+def reset_appstore_caches():
+    appstore._trusted_root.cache_clear()
+    appstore._verified_chains.clear()
+
+
+class AppStoreChainTests(TestCase):
+    def setUp(self):
+        reset_appstore_caches()
+        self.addCleanup(reset_appstore_caches)
+
+    def test_apple_like_chain_is_accepted(self):
+        chain = AppleChain()
+        with chain.trust():
+            self.assertEqual(appstore.decode_signed(chain.sign({"ok": 1})), {"ok": 1})
+
+    def test_self_signed_chain_without_apple_oids_is_rejected(self):
+        chain = AppleChain(leaf_oid=None, intermediate_oid=None)
+        with chain.trust(), self.assertRaisesRegex(appstore.InvalidSignedData, "App Store signing"):
+            appstore.decode_signed(chain.sign({"ok": 1}))
+
+    def test_intermediate_without_marker_is_rejected(self):
+        chain = AppleChain(intermediate_oid=None)
+        with chain.trust(), self.assertRaisesRegex(appstore.InvalidSignedData, "WWDR"):
+            appstore.decode_signed(chain.sign({"ok": 1}))
+
+    def test_intermediate_must_be_ca(self):
+        chain = AppleChain(intermediate_ca=False)
+        with chain.trust(), self.assertRaisesRegex(appstore.InvalidSignedData, "not a CA"):
+            appstore.decode_signed(chain.sign({"ok": 1}))
+
+    def test_other_root_is_rejected(self):
+        chain, other = AppleChain(), AppleChain()
+        with other.trust(), self.assertRaisesRegex(appstore.InvalidSignedData, "trusted Apple root"):
+            appstore.decode_signed(chain.sign({"ok": 1}))
+
+    def test_signature_by_other_key_is_rejected(self):
+        chain = AppleChain()
+        forged = jwt.encode({"ok": 1}, ec.generate_private_key(ec.SECP256R1()), algorithm="ES256",
+                            headers={"x5c": chain.x5c()})
+        with chain.trust(), self.assertRaisesRegex(appstore.InvalidSignedData, "signature"):
+            appstore.decode_signed(forged)
+
+
+class AppStoreAPITests(SimpleTestCase):
+    def setUp(self):
+        reset_appstore_caches()
+        self.addCleanup(reset_appstore_caches)
+        self.chain = AppleChain()
+        self.stub = StubServer()
+        self.addCleanup(self.stub.close)
+        key = tempfile.NamedTemporaryFile("w", suffix=".p8", delete=False)
+        key.write(ec.generate_private_key(ec.SECP256R1()).private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()).decode())
+        key.close()
+        for overrides in (self.chain.trust(), override_settings(
+                APPSTORE_API_URL=self.stub.url, APPSTORE_ISSUER_ID="issuer", APPSTORE_KEY_ID="KEY",
+                APPSTORE_PRIVATE_KEY_PATH=key.name)):
+            overrides.enable()
+            self.addCleanup(overrides.disable)
+        appstore._token = None
+        self.addCleanup(setattr, appstore, "_token", None)
+
+    def test_signed_transaction_is_verified(self):
+        signed = self.chain.sign({"transactionId": "t-1", "originalTransactionId": "otid-1"})
+        self.stub.respond = lambda path: (200, {"signedTransactionInfo": signed}, {})
+        self.assertEqual(appstore.get_transaction("t-1")["originalTransactionId"], "otid-1")
+
+    def test_transaction_signed_by_foreign_chain_is_rejected(self):
+        signed = AppleChain().sign({"transactionId": "t-1"})
+        self.stub.respond = lambda path: (200, {"signedTransactionInfo": signed}, {})
+        with self.assertRaises(appstore.InvalidSignedData):
+            appstore.get_transaction("t-1")
+
+    def test_not_found_rejects_and_server_error_retries(self):
+        with self.assertRaises(appstore.TransactionNotFound):
+            appstore.get_transaction("t-1")
+        self.stub.respond = lambda path: (503, {}, {})
+        with self.assertRaises(appstore.AppStoreError):
+            appstore.get_transaction("t-1")
+
+
+class RootNotConfiguredTests(TestCase):
+    def setUp(self):
+        reset_appstore_caches()
+        self.addCleanup(reset_appstore_caches)
+
+    @override_settings(APPSTORE_ROOT_CERT_PATH="", APPSTORE_ALLOW_UNTRUSTED_ROOT=False)
+    def test_missing_root_is_retryable_not_a_rejection(self):
+        with self.assertRaises(appstore.AppStoreError):
+            appstore.decode_signed(AppleChain().sign({"ok": 1}))
+
+
+class ReceiptQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="buyer@example.com")
+        self.pool = ThreadPoolExecutor(2)
+        self.addCleanup(self.pool.shutdown)
+
+    def _receipt(self, n, **fields):
+        return PaymentReceiptIOS.objects.create(user=self.user, product_id="pro.month",
+                                                original_transaction_id=f"otid-{n}", **fields)
+
+    def test_released_receipt_waits_for_backoff_even_after_claim_timeout(self):
+        long_ago = timezone.now() - timedelta(hours=1)
+        waiting = self._receipt(1, claim="", claimed_at=long_ago,
+                                next_attempt_at=timezone.now() + timedelta(minutes=30))
+        abandoned = self._receipt(2, claim="dead-worker", claimed_at=long_ago)
+        claimed = receipts.claim_receipts(10)
+        self.assertEqual([r.id for r in claimed], [abandoned.id])
+        self.assertNotIn(waiting.id, [r.id for r in claimed])
+
+    @override_settings(RECEIPT_MAX_ATTEMPTS=3)
+    def test_receipt_is_rejected_after_max_attempts(self):
+        receipt = self._receipt(1, attempts=2)
+        with mock.patch.object(receipts, "get_transaction", side_effect=appstore.AppStoreError("503")):
+            stats = receipts.verify_batch(receipts.claim_receipts(10), self.pool)
+        receipt.refresh_from_db()
+        self.assertEqual((stats.rejected, stats.retry), (1, 0))
+        self.assertEqual(receipt.status, ReceiptStatus.REJECTED)
+        self.assertIn("gave up after 3 attempts", receipt.status_reason)
+
+    def test_transient_error_schedules_retry(self):
+        receipt = self._receipt(1)
+        with mock.patch.object(receipts, "get_transaction", side_effect=appstore.AppStoreError("503")):
+            receipts.verify_batch(receipts.claim_receipts(10), self.pool)
+        receipt.refresh_from_db()
+        self.assertEqual((receipt.status, receipt.attempts, receipt.claim), (ReceiptStatus.PENDING, 1, ""))
+        self.assertGreater(receipt.next_attempt_at, timezone.now())
+        self.assertEqual(receipts.claim_receipts(10), [])
+
+
+class AppStoreNotificationTests(TestCase):
+    def setUp(self):
+        reset_appstore_caches()
+        self.addCleanup(reset_appstore_caches)
+        self.chain = AppleChain()
+        trust = self.chain.trust()
+        trust.enable()
+        self.addCleanup(trust.disable)
+        self.user = User.objects.create_user(email="subscriber@example.com")
+        Entitlement.objects.create(user=self.user, product_id="pro.month", original_transaction_id="otid-1",
+                                   expires_at=timezone.now() + timedelta(days=3), is_active=True)
+        self.t0 = timezone.now()
+
+    def _signed(self, kind, *, n, otid="otid-1", environment="Production", expires_days=30, chain=None):
+        chain = chain or self.chain
+        tx = chain.sign({"originalTransactionId": otid, "productId": "pro.month",
+                         "expiresDate": _ms(self.t0 + timedelta(days=expires_days))})
+        return chain.sign({
+            "notificationType": kind, "notificationUUID": f"uuid-{n}",
+            "signedDate": _ms(self.t0 + timedelta(minutes=n)),
+            "data": {"bundleId": "com.adconcept.snapai.ios", "environment": environment,
+                     "signedTransactionInfo": tx},
+        })
+
+    def _process(self):
+        return appstore_notifications.apply_batch(appstore_notifications.claim_notifications(100))
+
+    def _entitlement(self):
+        return Entitlement.objects.get(user=self.user)
+
+    def test_duplicate_delivery_is_stored_once(self):
+        signed = self._signed("DID_RENEW", n=1)
+        for _ in range(2):
+            resp = self.client.post("/api/iap/apple/notifications/", {"signedPayload": signed},
+                                    content_type="application/json")
+            self.assertEqual(resp.status_code, 200)
+        self.assertEqual(AppStoreNotification.objects.count(), 1)
+
+    def test_bad_signature_or_chain_is_rejected(self):
+        forged = jwt.encode({"notificationUUID": "x"}, ec.generate_private_key(ec.SECP256R1()),
+                            algorithm="ES256", headers={"x5c": self.chain.x5c()})
+        for signed in (forged, self._signed("DID_RENEW", n=1, chain=AppleChain())):
+            resp = self.client.post("/api/iap/apple/notifications/", {"signedPayload": signed},
+                                    content_type="application/json")
+            self.assertEqual(resp.status_code, 400)
+        self.assertFalse(AppStoreNotification.objects.exists())
+
+    def test_expire_delivered_after_later_renewal_is_skipped(self):
+        appstore_notifications.ingest(self._signed("DID_RENEW", n=2))
+        self._process()
+        appstore_notifications.ingest(self._signed("EXPIRED", n=1))
+        stats = self._process()
+        self.assertEqual((stats["applied"], stats["ignored"]), (0, 1))
+        self.assertTrue(self._entitlement().is_active)
+        self.assertEqual(AppStoreNotification.objects.get(notification_uuid="uuid-1").last_error,
+                         "older than the last applied notification")
+
+    def test_renew_then_expire_in_one_batch_applies_the_latest(self):
+        appstore_notifications.ingest(self._signed("EXPIRED", n=2))
+        appstore_notifications.ingest(self._signed("DID_RENEW", n=1))
+        self._process()
+        self.assertFalse(self._entitlement().is_active)
+
+    def test_unknown_subscription_is_retried(self):
+        appstore_notifications.ingest(self._signed("DID_RENEW", n=1, otid="otid-unknown"))
+        stats = self._process()
+        self.assertEqual(stats["retry"], 1)
+        row = AppStoreNotification.objects.get()
+        self.assertEqual((row.status, row.attempts), (NotificationStatus.PENDING, 1))
+        self.assertGreater(row.next_attempt_at, timezone.now())
+
+    def test_revoking_an_old_subscription_keeps_current_premium(self):
+        from .models import UserProfile
+
+        PaymentReceiptIOS.objects.create(user=self.user, product_id="pro.month", original_transaction_id="otid-old",
+                                         status=ReceiptStatus.VERIFIED)
+        UserProfile.objects.filter(user=self.user).update(has_premium=True)
+        appstore_notifications.ingest(self._signed("REFUND", n=1, otid="otid-old"))
+        self.assertEqual(self._process()["applied"], 1)
+        self.assertTrue(self._entitlement().is_active)
+        self.assertTrue(UserProfile.objects.get(user=self.user).has_premium)
+
+    def test_revoke_clears_premium_of_the_revoked_subscription(self):
+        from .models import UserProfile
+
+        UserProfile.objects.filter(user=self.user).update(has_premium=True)
+        appstore_notifications.ingest(self._signed("REFUND", n=1))
+        self._process()
+        self.assertFalse(self._entitlement().is_active)
+        self.assertFalse(UserProfile.objects.get(user=self.user).has_premium)
+
+    def test_sandbox_does_not_grant_in_production(self):
+        appstore_notifications.ingest(self._signed("DID_RENEW", n=1, environment="Sandbox", expires_days=365))
+        stats = self._process()
+        self.assertEqual(stats["ignored"], 1)
+        self.assertLess(self._entitlement().expires_at, self.t0 + timedelta(days=30))
+
+
+class StubServer:
+    """Локальный HTTP-сервер: respond(path) -> (status, dict, headers), подменяется в тесте."""
+
+    def __init__(self):
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                status, payload, headers = stub.respond(self.path)
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def respond(self, path):
+        return 404, {}, {}
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class JWKSStub(StubServer):
+    """JWKS-эндпоинт: набор ключей и код ответа меняются на ходу."""
+
+    def __init__(self):
+        super().__init__()
+        self.keys: dict[str, rsa.RSAPrivateKey] = {}
+        self.status = 200
+        self.url += "/certs"
+
+    def respond(self, path):
+        if self.status != 200:
+            return self.status, {}, {}
+        keys = [{**json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(k.public_key())), "kid": kid, "use": "sig"}
+                for kid, k in self.keys.items()]
+        # сразу просрочен: TTL = JWKS_MIN_TTL
+        return 200, {"keys": keys}, {"Cache-Control": "public, max-age=0"}
+
+    def add_key(self, kid):
+        self.keys[kid] = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def token(self, kid):
+        now = int(datetime.now().timestamp())
+        return jwt.encode({"iss": "https://accounts.google.com", "sub": "1", "aud": "client-1",
+                           "iat": now, "exp": now + 600}, self.keys[kid], algorithm="RS256",
+                          headers={"kid": kid})
+
+
+class JWKSTests(SimpleTestCase):
+    def setUp(self):
+        self.stub = JWKSStub()
+        self.addCleanup(self.stub.close)
+        jwks._keysets.clear()
+        self.addCleanup(jwks._keysets.clear)
+        overrides = override_settings(GOOGLE_JWKS_URL=self.stub.url, JWKS_UNKNOWN_KID_COOLDOWN=60,
+                                      JWKS_MIN_TTL=60, JWKS_STALE_TTL=3600)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.stub.add_key("k1")
+
+    def _verify(self, kid):
+        return verify_google_id_token(self.stub.token(kid), "client-1")
+
+    def test_rotated_key_is_fetched_once_and_garbage_kids_do_not_hit_provider(self):
+        self._verify("k1")
+        self.stub.add_key("k2")  # провайдер выпустил новый ключ, наш TTL ещё не истёк
+        self.assertEqual(self._verify("k2")["sub"], "1")
+        self.assertEqual(self.stub.requests, 2)
+        with self.assertRaisesRegex(ValueError, "unknown kid"):
+            jwks.google_keys().get_signing_key("garbage")
+        self.assertEqual(self.stub.requests, 2)  # в пределах JWKS_UNKNOWN_KID_COOLDOWN
+
+    def test_outage_serves_stale_keys_until_stale_ttl(self):
+        self._verify("k1")
+        self.stub.status = 503
+        keys = jwks.google_keys()
+        with mock.patch.object(jwks.time, "monotonic", return_value=keys._expires_at + 1), \
+                mock.patch.object(keys, "_refresh_in_background") as background:
+            self.assertEqual(self._verify("k1")["sub"], "1")
+        background.assert_called_once()
+        self.assertEqual(keys.stats["stale_served"], 1)
+        with mock.patch.object(jwks.time, "monotonic", return_value=keys._expires_at + 3601), \
+                self.assertLogs(jwks.logger, "WARNING"), self.assertRaisesRegex(ValueError, "unavailable"):
+            self._verify("k1")
+        self.assertEqual(keys.stats["refresh_errors"], 1)
+
+    def test_first_fetch_during_outage_fails_closed(self):
+        self.stub.status = 500
+        with self.assertLogs(jwks.logger, "WARNING"), self.assertRaisesRegex(ValueError, "unavailable"):
+            self._verify("k1")
+
+
+class TokenBudgetTests(TestCase):
+    def test_other_workers_spending_is_seen_after_their_flush(self):
+        from .services.usage import TokenBudget
+
+        user = User.objects.create_user(email="eater@example.com")
+        worker_a = TokenBudget(daily_limit=1000, flush_interval=0)
+        worker_b = TokenBudget(daily_limit=1000, flush_interval=0)
+        self.assertFalse(worker_b.exceeded(user.id))
+
+        worker_a.charge(user.id, 600)  # flush_interval=0 — сразу в БД
+        worker_b.charge(user.id, 600)
+        self.assertEqual(worker_b.spent_today(user.id), 1200)
+        self.assertTrue(worker_a.exceeded(user.id))
+        self.assertTrue(worker_b.exceeded(user.id))
+
+    def test_unflushed_local_spending_counts(self):
+        from .services.usage import TokenBudget
+
+        user = User.objects.create_user(email="eater@example.com")
+        budget = TokenBudget(daily_limit=1000, flush_interval=3600)
+        budget.charge(user.id, 1500)
+        self.assertTrue(budget.exceeded(user.id))
+
+    def test_pending_spending_is_flushed_on_read_after_interval(self):
+        from .models import DailyTokenUsage
+        from .services.usage import TokenBudget
+
+        user = User.objects.create_user(email="eater@example.com")
+        budget = TokenBudget(daily_limit=1000, flush_interval=60)
+        with mock.patch("api.services.usage.time.monotonic", return_value=budget._last_flush + 1):
+            budget.charge(user.id, 400)
+        self.addCleanup(budget._timer.cancel)
+        self.assertFalse(DailyTokenUsage.objects.exists())
+
+        with mock.patch("api.services.usage.time.monotonic", return_value=budget._last_flush + 61):
+            self.assertEqual(budget.spent_today(user.id), 400)
+        self.assertEqual(DailyTokenUsage.objects.get(user=user).tokens, 400)
+
+    def test_idle_worker_flushes_on_timer(self):
+        from .services.usage import TokenBudget
+
+        user = User.objects.create_user(email="eater@example.com")
+        budget = TokenBudget(daily_limit=1000, flush_interval=60)
+        with mock.patch("api.services.usage.threading.Timer") as timer:
+            budget.charge(user.id, 400)
+            budget.charge(user.id, 100)
+            timer.assert_called_once_with(60, budget._timed_flush)
+            with mock.patch.object(budget, "_flush_locked") as flush, mock.patch("api.services.usage.connection"):
+                budget._timed_flush()
+        flush.assert_called_once_with()
+
+
+class OTPEmailScrubTests(TestCase):
+    @override_settings(EMAIL_OUTBOX=False)
+    def test_otp_body_is_erased_after_send(self):
+        from django.core import mail
+        from .services.emailer import enqueue_otp_email
+
+        row = enqueue_otp_email("otp@example.com", "123456")
+        self.assertIn("123456", mail.outbox[0].body)
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.text_body, row.html_body), ("sent", "", ""))
+
+    @override_settings(EMAIL_OUTBOX=True)
+    def test_expired_otp_is_erased_and_generic_mail_kept(self):
+        from .models import OutboundEmail
+        from .services.emailer import claim_batch, deliver, enqueue_email, enqueue_otp_email
+
+        otp = enqueue_otp_email("otp@example.com", "123456")
+        OutboundEmail.objects.filter(pk=otp.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        digest = enqueue_email("team@example.com", "feedback", "5 stars", kind="feedback")
+        self.assertEqual(deliver(claim_batch(10))["expired"], 1)
+        otp.refresh_from_db()
+        digest.refresh_from_db()
+        self.assertEqual((otp.status, otp.text_body), ("failed", ""))
+        self.assertEqual(digest.text_body, "5 stars")
+
+
+class SignupRateLimitTests(TestCase):
+    @override_settings(RATE_LIMIT_CLIENT_IP_HEADER="X-Real-IP")
+    def test_client_ip_comes_from_proxy_header(self):
+        from django.test import RequestFactory
+        from .services.rate_limit import client_ip
+
+        request = RequestFactory().post("/", REMOTE_ADDR="172.18.0.3", HTTP_X_REAL_IP="203.0.113.7")
+        self.assertEqual(client_ip(request), "203.0.113.7")
+
+    @override_settings(RATE_LIMIT_TRUST_X_FORWARDED_FOR=True)
+    def test_forwarded_for_uses_address_added_by_proxy(self):
+        from django.test import RequestFactory
+        from .services.rate_limit import client_ip
+
+        request = RequestFactory().post("/", REMOTE_ADDR="172.18.0.3",
+                                        HTTP_X_FORWARDED_FOR="1.2.3.4, 203.0.113.7")
+        self.assertEqual(client_ip(request), "203.0.113.7")
+
+    @override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMIT_STORE="db", SIGNUP_RATE_PER_IP="2/h",
+                       SIGNUP_RATE_PER_EMAIL="100/h")
+    def test_limit_applies_before_validation(self):
+        from rest_framework.test import APIClient
+        from .services import rate_limit
+
+        rate_limit._limiter = None
+        self.addCleanup(setattr, rate_limit, "_limiter", None)
+        client = APIClient()
+        with mock.patch("api.serializers.validate_password") as validate:
+            codes = [client.post("/api/auth/register/start/", {"email": f"bot{i}@example.com", "password": "Bot-password-1"},
+                                 format="json").status_code for i in range(3)]
+        self.assertEqual(codes[-1], 429)
+        self.assertEqual(validate.call_count, 2)
+
+    @override_settings(RATE_LIMIT_IDLE_TTL=3600)
+    def test_reaper_prunes_idle_buckets(self):
+        from django.core.management import call_command
+        from .models import RateLimitBucket
+
+        now = timezone.now().timestamp()
+        RateLimitBucket.objects.bulk_create(
+            [RateLimitBucket(key=f"ip:{i}", tokens=1.0, refilled_at=now - 7200) for i in range(5)]
+            + [RateLimitBucket(key="ip:fresh", tokens=0.0, refilled_at=now - 60)]
+        )
+        call_command("reap_pending_signups", chunk_size=2, pause=0, stdout=mock.MagicMock())
+        self.assertEqual(list(RateLimitBucket.objects.values_list("key", flat=True)), ["ip:fresh"])
+
+
+class FeedbackDispatchTests(TestCase):
+    class Sink:
+        def __init__(self, name, fail=False):
+            self.name, self.fail, self.sent = name, fail, []
+
+        def send(self, items):
+            if self.fail:
+                raise RuntimeError(f"{self.name} is down")
+            self.sent.append([it["id"] for it in items])
+
+    def test_failed_sink_does_not_resend_to_the_others(self):
+        from .models import Report
+        from .services.feedback import dispatch_batch
+
+        report = Report.objects.create(name="bug", comment="crash")
+        webhook, file = self.Sink("webhook", fail=True), self.Sink("file")
+        with self.assertRaisesRegex(RuntimeError, "webhook is down"):
+            dispatch_batch([webhook, file], 10)
+        report.refresh_from_db()
+        self.assertEqual((report.forwarded_at, report.forwarded_sinks), (None, "file"))
+
+        webhook.fail = False
+        self.assertEqual(dispatch_batch([webhook, file], 10)["report"], 1)
+        self.assertEqual((webhook.sent, file.sent), ([[report.id]], [[report.id]]))
+        report.refresh_from_db()
+        self.assertIsNotNone(report.forwarded_at)
+
+    def test_migration_marks_existing_feedback_as_forwarded(self):
+        from importlib import import_module
+        from django.apps import apps as global_apps
+        from .models import Report
+        from .services.feedback import pending_items
+
+        Report.objects.create(name="old")
+        import_module("api.migrations.0017_feedback_forwarding").mark_existing_forwarded(global_apps, None)
+        self.assertEqual(pending_items("report", 10), [])
+
+
+class WeightSeriesTests(TestCase):
+    def test_day_buckets_are_capped_at_points(self):
+        from .models import WeightLog
+
+        user = User.objects.create_user(email="scale@example.com")
+        start = timezone.now() - timedelta(days=40)
+        WeightLog.objects.bulk_create([WeightLog(user=user, weight_kg=80 + i % 3, recorded_at=start + timedelta(days=i))
+                                       for i in range(40)])
+        client = APIClient()
+        client.force_authenticate(user)
+        resp = client.get("/api/weight/series/", {"mode": "day", "points": 10,
+                                                       "from": (start - timedelta(days=1)).isoformat()})
+        self.assertEqual(resp.status_code, 200)
+        points = resp.data["points"]
+        self.assertLessEqual(len(points), 10)
+        self.assertEqual(sum(p["n"] for p in points), 40)
+        self.assertEqual((min(p["min"] for p in points), max(p["max"] for p in points)), (80, 82))
+
+
+class PlanStrategyParamsTests(SimpleTestCase):
+    def test_nested_override_keeps_other_defaults(self):
+        from .services.plan_strategies import DEFAULT_PARAMS, merge_params
+
+        params = merge_params({"activity_mult": {"active": 1.6}, "min_calories": 1300})
+        self.assertEqual(params["activity_mult"], {**DEFAULT_PARAMS["activity_mult"], "active": 1.6})
+        self.assertEqual((params["min_calories"], params["macro_split"]),
+                         (1300, DEFAULT_PARAMS["macro_split"]))
+
+    def test_invalid_params_are_rejected(self):
+        from django.core.exceptions import ValidationError
+        from .models import PlanStrategy
+
+        for params in ({"macro_split": {"protein": 0.5}}, {"activity_mult": 1.4}, {"activty_mult": {}},
+                       {"goal_offsets": {"lose": "-400"}}):
+            with self.subTest(params=params), self.assertRaises(ValidationError):
+                PlanStrategy(name="mifflin", version=2, params=params).clean()
+        PlanStrategy(name="mifflin", version=2,
+                     params={"macro_split": {"protein": 0.3, "carbs": 0.4}}).clean()
+
+
+class ReportAdminSearchTests(TestCase):
+    def test_search_unions_text_index_and_email(self):
+        from django.contrib.admin.sites import site
+        from django.test import RequestFactory
+        from .models import Report
+
+        chef = User.objects.create_user(email="chef@example.com", password="x")
+        by_text = Report.objects.bulk_create([Report(name=f"Chicken soup {i}") for i in range(3)])
+        by_email = Report.objects.create(name="Broken scanner", user=chef)
+        Report.objects.create(name="Salad")
+
+        model_admin = site._registry[Report]
+        request = RequestFactory().get("/")
+        qs, _ = model_admin.get_search_results(request, Report.objects.all(), "chick")
+        self.assertEqual(set(qs.values_list("id", flat=True)), {r.id for r in by_text})
+        qs, _ = model_admin.get_search_results(request, Report.objects.all(), "chef@")
+        self.assertEqual(list(qs.values_list("id", flat=True)), [by_email.id])
+        qs, _ = model_admin.get_search_results(request, Report.objects.filter(name__startswith="Chicken"), "chef")
+        self.assertFalse(qs.exists())
+
+
+class FoodMatchTests(TestCase):
+    def setUp(self):
+        from .services.nutrition import clear_match_cache
+
+        clear_match_cache()
+        self.addCleanup(clear_match_cache)
+
+    def test_miss_is_not_cached(self):
+        from .models import FoodItem
+        from .services.nutrition import match_food
+
+        self.assertIsNone(match_food("dragonfruit"))
+        FoodItem.objects.create(name="Dragonfruit", name_key="dragonfruit", kcal_100g=60, protein_100g=1.2,
+                                fat_100g=0.4, carbs_100g=13, portion_g=200)
+        self.assertEqual(match_food("dragonfruit").name, "Dragonfruit")
+
+    def test_partial_match_keeps_meal_macros(self):
+        from .models import FoodItem, Meal
+
+        FoodItem.objects.create(name="Rice", name_key="rice", kcal_100g=130, protein_100g=2.7,
+                                fat_100g=0.3, carbs_100g=28, portion_g=150)
+        user = User.objects.create_user(email="cook@example.com")
+        meal = Meal.objects.create(user=user, title="Plov", calories=700, protein_g=25, fat_g=30, carbs_g=80)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        r = client.patch(f"/api/meals/{meal.id}/ingredients/", {"ingredients": ["200g rice", "lamb"]}, format="json")
+        self.assertEqual((r.data["calories"], r.data["protein_g"]), (700, 25))
+        self.assertEqual(r.data["meta"]["pricing"]["unmatched"], ["lamb"])
+        self.assertFalse(r.data["meta"]["pricing"]["applied"])
+
+        r = client.patch(f"/api/meals/{meal.id}/ingredients/", {"ingredients": ["200g rice"]}, format="json")
+        self.assertEqual(r.data["calories"], 260)
+
+
+class ManualEntitlementTests(TestCase):
+    def test_purchase_does_not_replace_hand_granted_premium(self):
+        from .services.entitlements import expire_due
+
+        user = User.objects.create_user(email="vip@example.com")
+        Entitlement.objects.create(user=user, product_id="manual", is_active=True, expires_at=None)
+        receipts.upsert_entitlements({user.id: ("pro.month", "otid-1", timezone.now() + timedelta(days=30))})
+        list(expire_due(now=timezone.now() + timedelta(days=31)))
+        ent = Entitlement.objects.get(user=user)
+        self.assertEqual((ent.product_id, ent.expires_at, ent.is_active), ("manual", None, True))
+
+
+class SocialIdentityRaceTests(TestCase):
+    def test_email_collision_race_retries_the_lookup(self):
+        from django.db import IntegrityError
+        from .services.social_identity import resolve_social_user
+
+        existing = User.objects.create_user(email="race@example.com")
+        real = User.objects.get_or_create
+        calls = []
+
+        def get_or_create(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                # между нашим SELECT и INSERT пользователя с этим email создал параллельный запрос
+                raise IntegrityError("UNIQUE constraint failed: api_user.email")
+            return real(**kwargs)
+
+        with mock.patch.object(User.objects, "get_or_create", side_effect=get_or_create):
+            user, created = resolve_social_user("google", "sub-1", "race@example.com")
+        self.assertEqual((user.pk, created), (existing.pk, False))
+        self.assertTrue(existing.social_identities.filter(provider="google", sub="sub-1").exists())
+
+
+class ManualPremiumMigrationTests(TestCase):
+    def test_hand_granted_premium_gets_a_no_expiry_entitlement(self):
+        from importlib import import_module
+        from django.apps import apps as global_apps
+        from .models import Entitlement, UserProfile
+        from .services.entitlements import premium_cache, resolve
+
+        migration = import_module("api.migrations.0019_manual_premium_entitlements")
+        manual = User.objects.create_user(email="vip@example.com")
+        bought = User.objects.create_user(email="buyer@example.com")
+        for user in (manual, bought):
+            UserProfile.objects.update_or_create(user=user, defaults={"has_premium": True})
+        Entitlement.objects.create(user=bought, product_id="pro.month", is_active=False)
+
+        migration.grant_manual_premium(global_apps, None)
+        premium_cache.clear()
+
+        ent = Entitlement.objects.get(user=manual)
+        self.assertEqual((ent.product_id, ent.is_active, ent.expires_at), ("manual", True, None))
+        self.assertTrue(resolve(manual.id).active)
+        self.assertEqual(Entitlement.objects.get(user=bought).product_id, "pro.month")
+
+
+@mock.patch.dict("os.environ", {"GOOGLE_CLIENT_ID": "client-1"})
+class SocialTokenCacheTests(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+        from .services.token_cache import verified_tokens
+
+        verified_tokens.clear()
+        self.addCleanup(verified_tokens.clear)
+        self.client = APIClient()
+        self.claims = {"iss": "https://accounts.google.com", "aud": "client-1", "sub": "g-1",
+                       "email": "social@example.com", "exp": int(datetime.now().timestamp()) + 3600}
+
+    def _login(self):
+        with mock.patch("api.views_auth_social.verify_google_id_token", return_value=dict(self.claims)) as verify:
+            resp = self.client.post("/api/auth/google/", {"id_token": "tok"}, format="json")
+        return resp, verify
+
+    def test_cache_hit_skips_verification(self):
+        self.assertEqual(self._login()[0].status_code, 201)
+        resp, verify = self._login()
+        self.assertEqual(resp.status_code, 200)
+        verify.assert_not_called()
+
+    def test_deactivated_user_gets_no_token_from_cache(self):
+        self._login()
+        User.objects.filter(email="social@example.com").update(is_active=False)  # без сигналов, как из другого процесса
+        resp, verify = self._login()
+        self.assertEqual(resp.status_code, 403)
+        self.assertNotIn("access", resp.data)
+        verify.assert_called_once()
+
+    def test_deleted_user_is_not_resurrected_from_cache(self):
+        self._login()
+        from .services.token_cache import verified_tokens
+
+        with mock.patch.object(verified_tokens, "forget_user"):  # удалили в другом процессе
+            User.objects.filter(email="social@example.com").delete()
+        resp, _ = self._login()
+        self.assertEqual(resp.status_code, 201)  # полная проверка создаёт аккаунт заново, а не выдаёт JWT на старый pk
+        self.assertTrue(User.objects.filter(email="social@example.com").exists())
+
+
+class RunWorkersTests(SimpleTestCase):
+    def test_crashed_job_is_restarted_until_stop(self):
+        from .management.commands import run_workers
+
+        supervisor = run_workers.Command()
+        calls = []
+
+        def job(command, **opts):
+            calls.append(command._stop_event)
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            supervisor._stop_event.set()  # второй запуск отработал до SIGTERM
+
+        with mock.patch.object(run_workers, "call_command", side_effect=job), \
+                mock.patch.object(run_workers, "connections"), self.assertLogs(run_workers.logger, "WARNING"):
+            supervisor._supervise("send_emails", restart_delay=0)
+        self.assertEqual(calls, [supervisor._stop_event] * 2)
+
+
+class VisionSchemaTests(SimpleTestCase):
+    def test_loose_values_are_coerced(self):
+        from .services.vision_schema import parse_analysis
+
+        fields = parse_analysis(json.dumps({
+            "title": "  Omelette ", "calories": "310 kcal", "protein_g": 18.6, "fat_g": "22,4 g",
+            "carbs_g": -3, "ingredients": ["eggs"], "meta": {"health_score": "7", "labels": "breakfast"},
+        })).to_meal_fields()
+        self.assertEqual((fields["title"], fields["calories"], fields["protein_g"], fields["fat_g"],
+                          fields["carbs_g"]), ("Omelette", 310, 19, 22, 0))
+        self.assertEqual(fields["ingredients"], [{"name": "eggs", "calories": 0, "protein_g": 0,
+                                                  "fat_g": 0, "carbs_g": 0}])
+        self.assertEqual((fields["meta"]["health_score"], fields["meta"]["labels"]), (7, ["breakfast"]))
+
+    def test_totals_follow_ingredients(self):
+        from .services.vision_schema import parse_analysis
+
+        fields = parse_analysis(json.dumps({
+            "title": "Lunch", "calories": 100, "protein_g": 30, "fat_g": 0, "carbs_g": 0,
+            "ingredients": [{"name": "rice", "calories": 260, "carbs_g": 56},
+                            {"name": "chicken", "calories": 240, "protein_g": 31, "fat_g": 12}],
+        })).to_meal_fields()
+        # белок 30 против 31 — в пределах TOTALS_TOLERANCE, остаётся как есть
+        self.assertEqual((fields["calories"], fields["protein_g"], fields["fat_g"], fields["carbs_g"]),
+                         (500, 30, 12, 56))
+        self.assertEqual(fields["meta"]["repaired"], ["calories", "carbs_g", "fat_g"])
+
+    def test_calories_from_macros_and_empty_analysis(self):
+        from .services.vision_schema import ValidationError, parse_analysis
+
+        fields = parse_analysis('{"title": "Shake", "protein_g": 20, "fat_g": 5, "carbs_g": 10}').to_meal_fields()
+        self.assertEqual(fields["calories"], 4 * 20 + 9 * 5 + 4 * 10)
+        for text in ('{"title": "", "ingredients": []}', "not json", '{"calories": "lots"}'):
+            with self.subTest(text=text), self.assertRaises(ValidationError):
+                parse_analysis(text)
+
+
+class VisionReaskTests(SimpleTestCase):
+    """analyze_image с подменённым клиентом OpenAI: ответы берутся по очереди из replies."""
+
+    VALID = '{"t": "Toast", "k": 250, "p": 8, "f": 9, "c": 33, "i": [], "h": 6, "l": []}'
+
+    def _analyze(self, *replies):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from types import SimpleNamespace
+        from .services import openai_vision
+        from .services.usage import CallStats
+
+        def create(**kwargs):
+            self.requests.append(kwargs["messages"])
+            content = replies[len(self.requests) - 1]
+            return SimpleNamespace(model="fake-vision",
+                                   usage=SimpleNamespace(prompt_tokens=100, completion_tokens=20),
+                                   choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+        self.requests = []
+        fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        stats = CallStats()
+        with mock.patch.object(openai_vision, "client", fake):
+            result = openai_vision.analyze_image(SimpleUploadedFile("meal.jpg", b"\xff\xd8jpeg"), stats,
+                                                 variant="compact")
+        return result, stats
+
+    def test_valid_reply_needs_one_call(self):
+        result, stats = self._analyze(self.VALID)
+        self.assertEqual((result["title"], result["calories"]), ("Toast", 250))
+        self.assertEqual((stats.attempts, stats.total_tokens, stats.image_bytes), (1, 120, 6))
+
+    def test_repairable_reply_is_not_reasked(self):
+        # итогов нет, есть только БЖУ — калории досчитываются без модели
+        result, stats = self._analyze('{"t": "Toast", "p": 8, "f": 9, "c": 33}')
+        self.assertEqual((result["calories"], stats.attempts), (4 * 8 + 9 * 9 + 4 * 33, 1))
+
+    def test_malformed_reply_is_reasked_once_with_errors(self):
+        for broken in ('{"t": "Toast", "k": 250', "Sure! Here is the JSON:", '{"t": "", "i": []}'):
+            with self.subTest(broken=broken):
+                result, stats = self._analyze(broken, self.VALID)
+                self.assertEqual((result["title"], stats.attempts), ("Toast", 2))
+                retry = self.requests[1]
+                self.assertEqual(retry[-2], {"role": "assistant", "content": broken})
+                self.assertIn("Ответ не прошёл проверку", retry[-1]["content"])
+
+    def test_second_invalid_reply_gives_up(self):
+        with self.assertLogs("api.services.openai_vision", "WARNING"):
+            result, stats = self._analyze('{"k": "lots"}', '{"i": "nothing"}', self.VALID)
+        self.assertIsNone(result)
+        self.assertEqual(stats.attempts, 2)
+
+
+class PremiumCacheTests(TestCase):
+    def setUp(self):
+        from .services import entitlements
+
+        entitlements.premium_cache.clear()
+        self.addCleanup(entitlements.premium_cache.clear)
+        self.user = User.objects.create_user(email="subscriber@example.com")
+        self.request = mock.Mock(user=self.user)
+
+    def _allowed(self):
+        from .views import HasPremium
+
+        return HasPremium().has_permission(self.request, None)
+
+    def test_grant_is_cached_and_revoke_denies(self):
+        self.assertFalse(self._allowed())
+        ent = Entitlement.objects.create(user=self.user, product_id="premium.monthly", is_active=True,
+                                         expires_at=timezone.now() + timedelta(days=30))
+        self.assertTrue(self._allowed())
+        with self.assertNumQueries(0):
+            self.assertTrue(self._allowed())
+
+        ent.is_active = False
+        ent.save()
+        self.assertFalse(self._allowed())
+        with self.assertNumQueries(0):
+            self.assertFalse(self._allowed())
+
+    def test_positive_entry_ends_at_expiry(self):
+        from .services import entitlements
+
+        Entitlement.objects.create(user=self.user, is_active=True, expires_at=timezone.now() + timedelta(days=1))
+        self.assertTrue(self._allowed())
+        # срок наступил раньше TTL: кэш на него не полагается, sweep ещё не прошёл
+        Entitlement.objects.filter(user=self.user).update(expires_at=timezone.now() - timedelta(seconds=1))
+        later = timezone.now() + timedelta(days=2)
+        with mock.patch("api.services.entitlements.time.time", return_value=later.timestamp()):
+            self.assertFalse(entitlements.is_premium(self.user.id))
+
+
+class VerifySignupTests(TestCase):
+    URL = "/api/auth/register/verify/"
+    PASSWORD = "Signup-password-1"
+
+    def setUp(self):
+        import hashlib
+        from .models import PendingSignup
+
+        self.pending = PendingSignup.new("new@example.com", hashlib.sha256(self.PASSWORD.encode()).hexdigest())
+        self.code = self.pending._raw_otp
+        self.client = APIClient()
+
+    def _verify(self, otp):
+        return self.client.post(self.URL, {"session_id": str(self.pending.session_id), "otp": otp,
+                                           "password": self.PASSWORD}, format="json")
+
+    def _wrong(self):
+        return next(c for c in ("0000", "1111") if c != self.code)
+
+    def test_success_query_count(self):
+        from .models import PendingSignup
+
+        # SELECT сессии, UPDATE попытки; SAVEPOINT, INSERT user, профиль и план, DELETE сессии, RELEASE
+        with self.assertNumQueries(8):
+            resp = self._verify(self.code)
+        self.assertEqual(resp.status_code, 201, resp.data)
+        self.assertTrue(User.objects.get(email="new@example.com").check_password(self.PASSWORD))
+        self.assertFalse(PendingSignup.objects.exists())
+
+    def test_attempts_are_limited(self):
+        from .models import PendingSignup
+
+        for _ in range(PendingSignup.MAX_ATTEMPTS):
+            self.assertEqual(self._verify(self._wrong()).status_code, 400)
+        # лимит исчерпан: даже верный код не принимается, сессия удаляется
+        self.assertEqual(self._verify(self.code).status_code, 429)
+        self.assertFalse(PendingSignup.objects.exists())
+        self.assertFalse(User.objects.filter(email="new@example.com").exists())
+
+
+class CompactResponseTests(SimpleTestCase):
+    def test_short_keys_and_tuples_are_expanded(self):
+        from .services.vision_schema import expand_compact, parse_analysis
+
+        compact = {"t": "Pasta", "k": 640, "p": 22, "f": 18, "c": 95,
+                   "i": [["spaghetti", 420, 15, 2, 85], ["pesto", 220, 7, 16, 10]], "h": 5, "l": ["vegetarian"]}
+        self.assertEqual(expand_compact(compact), {
+            "title": "Pasta", "calories": 640, "protein_g": 22, "fat_g": 18, "carbs_g": 95,
+            "ingredients": compact["i"], "meta": {"health_score": 5, "labels": ["vegetarian"]},
+        })
+        fields = parse_analysis(json.dumps(compact)).to_meal_fields()
+        self.assertEqual(fields["ingredients"][1], {"name": "pesto", "calories": 220, "protein_g": 7,
+                                                    "fat_g": 16, "carbs_g": 10})
+        self.assertEqual(fields["meta"], {"health_score": 5, "labels": ["vegetarian"]})
+
+    def test_verbose_and_short_tuples_pass(self):
+        from .services.vision_schema import expand_compact, parse_analysis
+
+        verbose = {"title": "Pasta", "calories": 640, "meta": {"labels": []}}
+        self.assertIs(expand_compact(verbose), verbose)
+        self.assertEqual(expand_compact(["t"]), ["t"])
+        # кортеж короче полного — недостающие макросы нули (и итог чинится по ингредиентам)
+        fields = parse_analysis('{"t": "Soup", "k": 180, "i": [["broth"], ["noodles", 120]]}').to_meal_fields()
+        self.assertEqual([i["calories"] for i in fields["ingredients"]], [0, 120])
+        self.assertEqual((fields["calories"], fields["meta"]["repaired"]), (120, ["calories"]))
+
+
+class IngredientSuggestTests(TestCase):
+    def setUp(self):
+        from .services import ingredient_index
+
+        ingredient_index._index = None
+        self.addCleanup(setattr, ingredient_index, "_index", None)
+
+    def test_ranking_word_prefix_and_typos(self):
+        from .services.ingredient_index import IngredientIndex
+
+        idx = IngredientIndex()
+        idx.add(["chicken breast", "chickpeas", "chicken"])
+        idx.add(["chickpeas"], weight=3)
+        # вес важнее длины, при равном весе короче — выше
+        self.assertEqual([r["name"] for r in idx.suggest("chi")], ["chickpeas", "chicken", "chicken breast"])
+        self.assertEqual(idx.suggest("Bre"), [{"name": "chicken breast", "count": 1, "match": "prefix"}])
+        self.assertEqual([(r["name"], r["match"]) for r in idx.suggest("chiken", limit=1)],
+                         [("chicken", "fuzzy")])
+        self.assertEqual(idx.suggest("xyz"), [])
+
+    @override_settings(INGREDIENT_INDEX_REFRESH=0)
+    def test_endpoint_ranks_by_meal_usage_and_picks_up_new_meals(self):
+        from .models import FoodItem, Meal
+
+        user = User.objects.create_user(email="cook@example.com")
+        FoodItem.objects.create(name="Rice", name_key="rice", kcal_100g=130, protein_100g=2.7,
+                                fat_100g=0.3, carbs_100g=28, portion_g=150)
+        Meal.objects.create(user=user, ingredients=["200 g red lentils", {"name": "Red Onion"}])
+        Meal.objects.create(user=user, ingredients=["red onion"])
+        client = APIClient()
+        client.force_authenticate(user)
+
+        resp = client.get("/api/ingredients/suggest/", {"q": "red"})
+        self.assertEqual([(r["name"], r["count"]) for r in resp.data["results"]],
+                         [("red onion", 2), ("red lentils", 1)])
+        self.assertEqual(client.get("/api/ingredients/suggest/", {"q": "ri"}).data["results"][0]["name"], "rice")
+
+        Meal.objects.create(user=user, ingredients=["red lentils", "red lentils soup"])
+        Meal.objects.create(user=user, ingredients=["red lentils"])
+        resp = client.get("/api/ingredients/suggest/", {"q": "red", "limit": 2})
+        self.assertEqual([(r["name"], r["count"]) for r in resp.data["results"]],
+                         [("red lentils", 3), ("red onion", 2)])
+        self.assertEqual(client.get("/api/ingredients/suggest/", {"limit": "x"}).status_code, 400)
+
+
+class RegeneratePlansTests(TestCase):
+    def setUp(self):
+        from .models import UserProfile
+        from .services.plan_strategies import invalidate_cache
+
+        invalidate_cache()
+        self.addCleanup(invalidate_cache)
+        self.users = [User.objects.create_user(email=f"plan{i}@example.com") for i in range(4)]
+        UserProfile.objects.filter(user__in=self.users[:3]).update(
+            gender="female", date_of_birth=date(1990, 5, 1), weight_kg=70, height_cm=168)
+        # 0 — устаревший план, 1 — ручной, 2 — уже по активной версии, 3 — без данных профиля
+
+    def _run(self, **opts):
+        from django.core.management import call_command
+        from io import StringIO
+
+        out = StringIO()
+        call_command("regenerate_plans", stdout=out, **opts)
+        return out.getvalue()
+
+    def test_only_stale_non_custom_plans_are_rewritten(self):
+        from .models import NutritionPlan, PlanStrategy, UserProfile
+        from .utils import plan_from_profile
+
+        PlanStrategy.objects.update(is_active=False)
+        strategy = PlanStrategy.objects.create(name="mifflin", version=99, is_active=True,
+                                               params={"macro_split": {"protein": 0.3, "carbs": 0.4}})
+        NutritionPlan.objects.filter(user=self.users[1]).update(calories=1500, is_custom=True)
+        NutritionPlan.objects.filter(user=self.users[2]).update(calories=1234, strategy=strategy)
+
+        out = self._run(dry_run=True)
+        self.assertIn(f"user {self.users[0].id}: calories 0 ->", out)
+        self.assertFalse(NutritionPlan.objects.filter(strategy=strategy).exclude(user=self.users[2]).exists())
+
+        out = self._run()
+        self.assertIn("Updated 1 plans, created 0, unchanged 0, skipped 1", out)
+        plans = NutritionPlan.objects.in_bulk([u.id for u in self.users], field_name="user_id")
+        expected = plan_from_profile(UserProfile.objects.get(user=self.users[0]))
+        self.assertEqual({f: getattr(plans[self.users[0].id], f) for f in expected},
+                         {**expected, "strategy_id": strategy.id})
+        self.assertEqual((plans[self.users[1].id].calories, plans[self.users[1].id].strategy_id), (1500, None))
+        self.assertEqual(plans[self.users[2].id].calories, 1234)
+
+        self.assertIn("Updated 0 plans", self._run())
+        # --all: и план с активной версией, но чужими цифрами; ручной — всё равно нет
+        self.assertIn("Updated 1 plans, created 0, unchanged 1", self._run(all=True))
+        self.assertNotEqual(NutritionPlan.objects.get(user=self.users[2]).calories, 1234)
+
+
+class ReceiptIngestTests(TestCase):
+    URL = "/api/iap/apple/ingest/"
+    BODY = {"product_id": "pro.month", "original_transaction_id": "otid-1", "transaction_id": "t-1"}
+
+    def setUp(self):
+        self.buyer = User.objects.create_user(email="buyer@example.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def test_repeat_is_200_without_new_row(self):
+        first = self.client.post(self.URL, self.BODY, format="json")
+        self.assertEqual(first.status_code, 201)
+        # повтор известного чека: один SELECT, без записи
+        with self.assertNumQueries(1):
+            again = self.client.post(self.URL, {**self.BODY, "bundle_id": "com.snapai"}, format="json")
+        self.assertEqual((again.status_code, again.data["id"], again.data["status"]),
+                         (200, first.data["id"], "pending"))
+        self.assertEqual(PaymentReceiptIOS.objects.count(), 1)
+
+    def test_receipt_of_another_account_is_409(self):
+        self.assertEqual(self.client.post(self.URL, self.BODY, format="json").status_code, 201)
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(email="other@example.com"))
+        self.assertEqual(other.post(self.URL, self.BODY, format="json").status_code, 409)
+        self.assertEqual(list(PaymentReceiptIOS.objects.values_list("user_id", flat=True)), [self.buyer.id])
+
+
+class MergeDuplicateReceiptsTests(TransactionTestCase):
+    """Повторы из времени до уникального ограничения: снимаем его на время теста."""
+
+    def setUp(self):
+        from django.db import connection
+
+        self.constraint = next(c for c in PaymentReceiptIOS._meta.constraints
+                               if set(c.fields) == {"original_transaction_id", "transaction_id"})
+        # SQLite пересобирает таблицу по Meta.constraints — убираем его и оттуда
+        others = [c for c in PaymentReceiptIOS._meta.constraints if c is not self.constraint]
+        with mock.patch.object(PaymentReceiptIOS._meta, "constraints", others), \
+                connection.schema_editor() as editor:
+            editor.remove_constraint(PaymentReceiptIOS, self.constraint)
+        self.addCleanup(self._restore_constraint)
+        self.user = User.objects.create_user(email="buyer@example.com")
+
+    def _restore_constraint(self):
+        from django.db import connection
+
+        PaymentReceiptIOS.objects.all().delete()
+        with connection.schema_editor() as editor:
+            editor.add_constraint(PaymentReceiptIOS, self.constraint)
+
+    def _receipt(self, otid, status, expires_days=None):
+        expires_at = timezone.now() + timedelta(days=expires_days) if expires_days is not None else None
+        return PaymentReceiptIOS.objects.create(user=self.user, product_id="pro.month", original_transaction_id=otid,
+                                                transaction_id="t-1", status=status, expires_at=expires_at)
+
+    def test_best_row_is_kept_with_latest_expiry(self):
+        pending = self._receipt("otid-1", ReceiptStatus.PENDING)
+        verified = self._receipt("otid-1", ReceiptStatus.VERIFIED, expires_days=10)
+        self._receipt("otid-1", ReceiptStatus.VERIFIED, expires_days=40)
+        self._receipt("otid-1", ReceiptStatus.REJECTED)
+        older = self._receipt("otid-2", ReceiptStatus.PENDING)
+        self._receipt("otid-2", ReceiptStatus.PENDING)
+        single = self._receipt("otid-3", ReceiptStatus.REJECTED)
+
+        self.assertEqual(list(receipts.merge_duplicate_receipts(batch_size=1)), [(1, 3), (1, 1)])
+        kept = PaymentReceiptIOS.objects.in_bulk()
+        self.assertEqual(set(kept), {verified.id, older.id, single.id})
+        self.assertNotIn(pending.id, kept)
+        self.assertEqual(kept[verified.id].expires_at.date(), (timezone.now() + timedelta(days=40)).date())
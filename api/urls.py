@@ -2,14 +2,16 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from .views import ProfileViewSet, MealViewSet, PlanViewSet, RatingViewSet, AnalyzePhoto, StartSignupView, VerifySignupView, ResendOTPView, ReportViewSet
+from .views import ProfileViewSet, WeightLogViewSet, MealViewSet, PlanViewSet, RatingViewSet, AnalyzePhoto, StartSignupView, VerifySignupView, ResendOTPView, ReportViewSet, IngredientSuggestView
 from .views_auth_social import GoogleLoginView, AppleLoginView
-from .views_iap import IOSReceiptIngestView
+from .views_iap import AppStoreNotificationView, IOSReceiptIngestView
+from .views_admin import AuthKeysStatusView, FeedbackQueueView, ReportSearchView, UsageReportView
 
 router = DefaultRouter()
 router.register(r"profile", ProfileViewSet, basename="profile")
 router.register(r"meals", MealViewSet, basename="meals")
 router.register(r"plan", PlanViewSet, basename="plan")
+router.register(r"weight", WeightLogViewSet, basename="weight")
 router.register(r"ratings", RatingViewSet, basename="ratings")
 
 urlpatterns = [
@@ -18,10 +20,16 @@ urlpatterns = [
     path("auth/register/start/", StartSignupView.as_view(), name="register_start"),
     path("auth/register/verify/", VerifySignupView.as_view(), name="register_verify"),
     path("auth/register/resend/", ResendOTPView.as_view(), name="register_resend"),
+    path("ingredients/suggest/", IngredientSuggestView.as_view(), name="ingredients-suggest"),
     path("analyze/", AnalyzePhoto.as_view(), name="analyze_stub"),
     path("auth/google/", GoogleLoginView.as_view(), name="auth-google"),
     path("auth/apple/", AppleLoginView.as_view(), name="auth-apple"),
     path("iap/apple/ingest/", IOSReceiptIngestView.as_view()),
+    path("iap/apple/notifications/", AppStoreNotificationView.as_view(), name="iap-apple-notifications"),
+    path("admin/usage-report/", UsageReportView.as_view(), name="admin-usage-report"),
+    path("admin/auth-keys/", AuthKeysStatusView.as_view(), name="admin-auth-keys"),
+    path("admin/feedback-queue/", FeedbackQueueView.as_view(), name="admin-feedback-queue"),
+    path("admin/reports/search/", ReportSearchView.as_view(), name="admin-report-search"),
     path("reports/", ReportViewSet.as_view({"get": "list", "post": "create"}), name="reports"),
     path("", include(router.urls)),
 ]
@@ -1,11 +1,14 @@
-from datetime import timedelta
-import base64, re, hashlib, secrets, random
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+import base64, re, hashlib, hmac, secrets, random
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import TruncDay, TruncWeek
 from django.utils import timezone
 from django.utils.timezone import now
+from django.utils.dateparse import parse_date, parse_datetime
 
 from rest_framework import viewsets, permissions, mixins, status
 from rest_framework.decorators import action
@@ -13,15 +16,22 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .models import UserProfile, Meal, NutritionPlan, AppRating, PendingSignup, Report
+from .models import UserProfile, Meal, NutritionPlan, AppRating, PendingSignup, Report, WeightLog
 from .serializers import (
     UserProfileSerializer, MealSerializer, NutritionPlanSerializer, AppRatingSerializer,
-    StartSignupSerializer, VerifySignupSerializer, ResendOTPSerializer, ReportSerializer
+    StartSignupSerializer, VerifySignupSerializer, ResendOTPSerializer, ReportSerializer,
+    WeightLogSerializer,
 )
 from django.core.files.base import ContentFile
 from .utils import plan_from_profile
 from .services.openai_vision import analyze_image
-from .services.emailer import send_otp_email_html
+from .services.usage import CallStats, record_analysis, token_budget
+from .services.nutrition import price_ingredients, MACRO_FIELDS
+from .services.ingredient_index import get_index
+from .services.timeseries import lttb, merge_buckets
+from .services.emailer import enqueue_otp_email
+from .services.rate_limit import client_ip, email_key, get_limiter
+from .services.entitlements import is_premium
 import logging
 
 from rest_framework.exceptions import ValidationError
@@ -39,6 +49,14 @@ class IsOwner(permissions.BasePermission):
         return owner == request.user
 
 
+class HasPremium(permissions.BasePermission):
+    """Премиум по services/entitlements.py; повторные запросы — из кэша, без SELECT."""
+    message = "Premium subscription required"
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated and is_premium(request.user.id))
+
+
 # ================== PROFILE / PLAN ==================
 
 class ProfileViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin, mixins.UpdateModelMixin):
@@ -49,12 +67,19 @@ class ProfileViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin, mixins.
         profile, _ = UserProfile.objects.get_or_create(user=self.request.user)
         return profile
 
+    def perform_update(self, serializer):
+        old_weight = serializer.instance.weight_kg
+        profile = serializer.save()
+        # weight_kg перезаписывается — историю ведём в WeightLog
+        if profile.weight_kg and profile.weight_kg != old_weight:
+            WeightLog.objects.create(user=profile.user, weight_kg=profile.weight_kg)
+
     @action(detail=False, methods=["post"], url_path="onboarding")
     def onboarding(self, request):
         profile = self.get_object()
         ser = self.get_serializer(profile, data=request.data, partial=True)
         ser.is_valid(raise_exception=True)
-        ser.save()
+        self.perform_update(ser)
         return Response(ser.data)
 
     @action(detail=False, methods=["post"], url_path="generate-plan")
@@ -67,6 +92,7 @@ class ProfileViewSet(viewsets.GenericViewSet, mixins.RetrieveModelMixin, mixins.
             plan, _ = NutritionPlan.objects.get_or_create(user=request.user)
             for k, v in data.items():
                 setattr(plan, k, v)
+            plan.is_custom = False
             plan.save()
         return Response(NutritionPlanSerializer(plan).data)
 
@@ -84,7 +110,7 @@ class PlanViewSet(viewsets.GenericViewSet):
         NutritionPlan.objects.filter(user=request.user).delete()
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save(user=request.user)
+        serializer.save(user=request.user, is_custom=True, strategy=None)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(detail=False, methods=["get"], url_path="", url_name="get")
@@ -97,11 +123,93 @@ class PlanViewSet(viewsets.GenericViewSet):
         plan = self.get_object()
         serializer = self.get_serializer(plan, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        serializer.save(is_custom=True, strategy=None)
         return Response(serializer.data)
 
 
 
+# ================== WEIGHT ==================
+
+class WeightLogViewSet(viewsets.GenericViewSet,
+                       mixins.CreateModelMixin,
+                       mixins.ListModelMixin,
+                       mixins.DestroyModelMixin):
+    """
+    /api/weight/          — записи (новые сверху), POST — добавить замер
+    /api/weight/series/   — ряд для графика с даунсэмплингом на сервере
+    """
+    serializer_class = WeightLogSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    SERIES_MODES = ("lttb", "day", "week", "raw")
+    MAX_POINTS = 1000
+
+    def get_queryset(self):
+        return WeightLog.objects.filter(user=self.request.user).order_by("-recorded_at")
+
+    def perform_create(self, serializer):
+        log = serializer.save(user=self.request.user)
+        # последний по времени замер — текущий вес профиля
+        latest = WeightLog.objects.filter(user=self.request.user).order_by("-recorded_at").first()
+        if latest and latest.pk == log.pk:
+            UserProfile.objects.filter(user=self.request.user).update(weight_kg=log.weight_kg, updated_at=now())
+
+    @action(detail=False, methods=["get"], url_path="series")
+    def series(self, request):
+        """
+        ?from=ISO&to=ISO&mode=lttb|day|week|raw&points=200
+        lttb — не больше points точек с сохранением формы; day/week — агрегаты
+        в БД (avg/min/max/n), соседние сливаются, если их больше points;
+        raw — как есть (обрезается до MAX_POINTS).
+        """
+        def _parse(name, default):
+            raw = request.query_params.get(name)
+            if not raw:
+                return default
+            value = parse_datetime(raw) or parse_date(raw)
+            if value is None:
+                raise ValidationError({name: "Expected ISO date or datetime"})
+            if not isinstance(value, datetime):
+                value = datetime.combine(value, time.min)
+            return value if timezone.is_aware(value) else timezone.make_aware(value)
+
+        end = _parse("to", now())
+        start = _parse("from", end - timedelta(days=90))
+        mode = request.query_params.get("mode", "lttb")
+        if mode not in self.SERIES_MODES:
+            raise ValidationError({"mode": f"Expected one of: {', '.join(self.SERIES_MODES)}"})
+        try:
+            points = max(3, min(int(request.query_params.get("points", 200)), self.MAX_POINTS))
+        except ValueError:
+            raise ValidationError({"points": "Must be an integer"})
+
+        qs = WeightLog.objects.filter(user=request.user, recorded_at__gte=start, recorded_at__lte=end)
+
+        if mode in ("day", "week"):
+            trunc = TruncDay if mode == "day" else TruncWeek
+            rows = (qs.annotate(bucket=trunc("recorded_at"))
+                      .values("bucket")
+                      .annotate(avg=Avg("weight_kg"), min=Min("weight_kg"), max=Max("weight_kg"), n=Count("id"))
+                      .order_by("bucket"))
+            data = [
+                {"t": r["bucket"], "avg": r["avg"], "min": r["min"], "max": r["max"], "n": r["n"]}
+                for r in rows
+            ]
+            # длинный период даёт больше бакетов, чем points, — сливаем соседние
+            data = merge_buckets(data, points)
+            for d in data:
+                d["avg"] = round(d["avg"], 2)
+        else:
+            raw = list(qs.order_by("recorded_at").values_list("recorded_at", "weight_kg")[:100_000])
+            if mode == "lttb":
+                sampled = lttb([(t.timestamp(), w) for t, w in raw], points)
+                data = [{"t": datetime.fromtimestamp(x, tz=dt_timezone.utc), "weight_kg": y} for x, y in sampled]
+            else:
+                data = [{"t": t, "weight_kg": w} for t, w in raw[-self.MAX_POINTS:]]
+
+        return Response({"mode": mode, "from": start, "to": end, "count": len(data), "points": data})
+
+
 # ================== MEALS ==================
 
 class MealViewSet(viewsets.ModelViewSet):
@@ -126,7 +234,35 @@ class MealViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=["patch"], url_path="ingredients")
     def update_ingredients(self, request, pk=None):
         meal = self.get_object()
+        normalized = self._ingredients_from(request)
+        meal.ingredients = normalized
+
+        # Опционально можно сразу поправить калории/БЖУ/название, если пришли
+        for field in ("title", "calories", "protein_g", "fat_g", "carbs_g"):
+            if field in request.data:
+                setattr(meal, field, request.data[field])
+
+        # макросы не прислали — считаем сами по таблице FoodItem (без модели)
+        if not any(f in request.data for f in MACRO_FIELDS):
+            self._apply_pricing(meal, normalized)
+
+        meal.save()
+        return Response(MealSerializer(meal).data, status=200)
+
+    # Блюдо без фото: список ингредиентов -> КБЖУ по локальной таблице
+    @action(detail=False, methods=["post"], url_path="from-text")
+    def from_text(self, request):
+        normalized = self._ingredients_from(request)
+        if not normalized:
+            raise ValidationError({"ingredients": "At least one ingredient is required"})
+
+        meal = Meal(user=request.user, title=str(request.data.get("title", ""))[:160], ingredients=normalized)
+        self._apply_pricing(meal, normalized, partial=True)
+        meal.save()
+        return Response(MealSerializer(meal).data, status=201)
 
+    @staticmethod
+    def _ingredients_from(request):
         ingredients = request.data.get("ingredients")
         if ingredients is None:
             raise ValidationError({"ingredients": "This field is required"})
@@ -134,16 +270,51 @@ class MealViewSet(viewsets.ModelViewSet):
             raise ValidationError({"ingredients": "Must be a list of strings"})
 
         # Нормализуем строки и убираем пустые
-        normalized = [str(x).strip() for x in ingredients if str(x).strip()]
-        meal.ingredients = normalized
+        return [str(x).strip() for x in ingredients if str(x).strip()]
+
+    @staticmethod
+    def _apply_pricing(meal, ingredients, partial=False):
+        """
+        Макросы из таблицы FoodItem. Если сопоставлены не все ингредиенты,
+        макросы блюда (от модели или клиента) не трогаем — частичная сумма
+        их занизила бы; partial=True — ставим сумму по сопоставленным (блюдо
+        без своих макросов). Разбор и unmatched — в meta["pricing"].
+        """
+        priced = price_ingredients(ingredients)
+        if not priced["matched"]:
+            return
+        applied = partial or not priced["unmatched"]
+        if applied:
+            for field in MACRO_FIELDS:
+                setattr(meal, field, priced[field])
+        meal.meta = {
+            **(meal.meta or {}),
+            "pricing": {
+                "source": "food_table",
+                "applied": applied,
+                "matched": priced["matched"],
+                "unmatched": priced["unmatched"],
+                "ingredients": priced["ingredients"],
+            },
+        }
 
-        # Опционально можно сразу поправить калории/БЖУ/название, если пришли
-        for field in ("title", "calories", "protein_g", "fat_g", "carbs_g"):
-            if field in request.data:
-                setattr(meal, field, request.data[field])
 
-        meal.save()
-        return Response(MealSerializer(meal).data, status=200)
+# ================== INGREDIENTS ==================
+
+class IngredientSuggestView(APIView):
+    """
+    GET /api/ingredients/suggest/?q=chi&limit=10
+    Автодополнение по in-memory индексу (services/ingredient_index.py).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        q = request.query_params.get("q", "")
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", 10)), 50))
+        except ValueError:
+            raise ValidationError({"limit": "Must be an integer"})
+        return Response({"q": q, "results": get_index().suggest(q, limit=limit)})
 
 
 # ================== RATINGS ==================
@@ -156,8 +327,8 @@ class RatingViewSet(viewsets.ModelViewSet):
         return AppRating.objects.filter(user=self.request.user).order_by("-created_at")
 
     def perform_create(self, serializer):
-        stars = int(self.request.data.get("stars", 0))
-        sent = stars >= 4
+        # один INSERT; 4+ звёзд перешлёт manage.py dispatch_feedback
+        sent = serializer.validated_data["stars"] >= 4
         serializer.save(user=self.request.user, sent_to_store=sent)
 
 
@@ -166,6 +337,11 @@ class RatingViewSet(viewsets.ModelViewSet):
 class AnalyzePhoto(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_permissions(self):
+        if settings.ANALYZE_REQUIRES_PREMIUM:
+            return [permissions.IsAuthenticated(), HasPremium()]
+        return super().get_permissions()
+
     def post(self, request):
         image_file = None
 
@@ -194,19 +370,21 @@ class AnalyzePhoto(APIView):
         if not image_file:
             return Response({"detail": "image is required"}, status=400)
 
+        if token_budget.exceeded(request.user.id):
+            return Response({"detail": "Daily analysis limit reached"}, status=429)
+
         meal = Meal.objects.create(user=request.user, title="", image=image_file, taken_at=now())
-        result = analyze_image(meal.image)
+        stats = CallStats()
+        result = analyze_image(meal.image, stats=stats)
+        if stats.attempts:
+            record_analysis(request.user, stats, meal=meal, ok=bool(result))
 
         if not result:
             return Response({"detail": "AI analysis failed"}, status=502)
 
-        meal.title = result.get("title", "")
-        meal.calories = result.get("calories", 0)
-        meal.protein_g = result.get("protein_g", 0)
-        meal.fat_g = result.get("fat_g", 0)
-        meal.carbs_g = result.get("carbs_g", 0)
-        meal.ingredients = result.get("ingredients", [])
-        meal.meta = result.get("meta", {})
+        # result уже провалидирован схемой (services/vision_schema.py)
+        for field, value in result.items():
+            setattr(meal, field, value)
         meal.save()
 
         return Response(MealSerializer(meal).data, status=201)
@@ -218,33 +396,57 @@ def _sha256(s: str) -> str:
     return hashlib.sha256(s.encode("utf-8")).hexdigest()
 
 
+def _signup_rate_limited(request, email: str):
+    """429 с Retry-After, если исчерпан лимит по IP или по email, иначе None."""
+    limits = [(f"signup:ip:{client_ip(request)}", settings.SIGNUP_RATE_PER_IP)]
+    if email:
+        limits.append((f"signup:email:{email_key(email)}", settings.SIGNUP_RATE_PER_EMAIL))
+    retry_after = get_limiter().check(limits)
+    if not retry_after:
+        return None
+    return Response({"detail": "Too many requests", "retry_after": retry_after},
+                    status=429, headers={"Retry-After": str(retry_after)})
+
+
 class StartSignupView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def post(self, request):
+        # лимит — до сериализатора: боты не должны доходить до запроса «занят ли email»
+        # и validate_password; email нормализуем так же, как сериализатор
+        raw_email = request.data.get("email")
+        limited = _signup_rate_limited(request, raw_email.lower().strip() if isinstance(raw_email, str) else "")
+        if limited:
+            return limited
+
         ser = StartSignupSerializer(data=request.data)
         ser.is_valid(raise_exception=True)
-        email = ser.validated_data["email"].lower().strip()
+        # email уже нормализован, а занятость проверена в сериализаторе
+        email = ser.validated_data["email"]
         password = ser.validated_data["password"]
 
-        if User.objects.filter(email=email).exists():
-            return Response({"detail": "User with this email already exists"}, status=400)
-
         # возьмём локаль из тела (если пришла) или из заголовка, иначе ru
         locale = (request.data.get("locale")
                   or request.headers.get("Accept-Language", "ru"))[:8] or "ru"
 
-        ps = PendingSignup.new(
-            email=email,
-            password_sha256=_sha256(password),
-            ttl_minutes=10,
-            locale=locale,  # <-- передали
-        )
-
+        # повторный старт на тот же email — продолжаем живую сессию, а не плодим новые
+        ps = PendingSignup.active_for(email)
+        if ps is not None:
+            ps.restart(password_sha256=_sha256(password), ttl_minutes=10, locale=locale)
+        else:
+            ps = PendingSignup.new(
+                email=email,
+                password_sha256=_sha256(password),
+                ttl_minutes=10,
+                locale=locale,  # <-- передали
+            )
+
+        # письмо уходит из очереди (send_emails), здесь только ставим его в неё
         try:
-            email_sent = send_otp_email_html(email=email, otp=ps._raw_otp, ttl_minutes=10)
+            enqueue_otp_email(email=email, otp=ps._raw_otp, ttl_minutes=10)
+            email_sent = True
         except Exception:
-            logger.exception("OTP email send failed")
+            logger.exception("OTP email enqueue failed")
             email_sent = False
 
         payload = {
@@ -284,26 +486,28 @@ class VerifySignupView(APIView):
             ps.delete()
             return Response({"detail": "OTP expired"}, status=400)
 
-        if ps.attempts >= 5:
+        if not ps.take_attempt():
             ps.delete()
             return Response({"detail": "Too many attempts"}, status=429)
 
-        if not ps.verify_and_consume(otp):
+        if not ps.check_otp(otp):
             return Response({"detail": "Invalid code"}, status=400)
 
-        if _sha256(password) != ps.password_sha256:
+        if not hmac.compare_digest(_sha256(password), ps.password_sha256):
             return Response({"detail": "Password mismatch with initial step"}, status=400)
 
-        if User.objects.filter(email=ps.email).exists():
-            # гонка: кто-то уже зарегался на этот email
-            ps.delete()
+        # дорогой хэш пароля — до транзакции, чтобы не держать блокировку записи
+        user = User(email=User.objects.normalize_email(ps.email))
+        user.set_password(password)
+        try:
+            with transaction.atomic():
+                user.save()  # профиль и план создаёт сигнал post_save
+                ps.delete()
+        except IntegrityError:
+            # гонка: кто-то уже зарегался на этот email (unique на User.email)
+            PendingSignup.objects.filter(pk=ps.pk).delete()
             return Response({"detail": "User with this email already exists"}, status=400)
 
-        with transaction.atomic():
-            user = User.objects.create_user(email=ps.email, password=password)
-            UserProfile.objects.get_or_create(user=user)
-            ps.delete()
-
         refresh = RefreshToken.for_user(user)
         return Response({
             "access": str(refresh.access_token),
@@ -328,6 +532,10 @@ class ResendOTPView(APIView):
         if timezone.now() > ps.expires_at:
             return Response({"detail": "OTP expired"}, status=400)
 
+        limited = _signup_rate_limited(request, ps.email)
+        if limited:
+            return limited
+
         if ps.resends >= 3:
             return Response({"detail": "Resend limit reached"}, status=429)
 
@@ -345,11 +553,7 @@ class ResendOTPView(APIView):
 
         # ВАЖНО: без locale
         try:
-            ok = send_otp_email_html(email=ps.email, otp=code, ttl_minutes=ttl_minutes_left)
-            if not ok:
-                # на всякий случай логируем
-                logger.error("send_otp_email_html returned False for %s", ps.email)
-                return Response({"detail": "Failed to send OTP"}, status=502)
+            enqueue_otp_email(email=ps.email, otp=code, ttl_minutes=ttl_minutes_left)
         except Exception as e:
             logger.exception("Resend OTP failed")
             payload = {"detail": "Failed to send OTP"}
@@ -416,6 +620,7 @@ class ReportViewSet(viewsets.GenericViewSet,
 
         serializer = self.get_serializer(data=data)
         serializer.is_valid(raise_exception=True)
-        instance: Report = serializer.save(user=request.user if request.user.is_authenticated else None)
+        # один INSERT (+ файл фото); дальше заявку перешлёт manage.py dispatch_feedback
+        serializer.save(user=request.user if request.user.is_authenticated else None)
         headers = self.get_success_headers(serializer.data)
-        return Response(ReportSerializer(instance).data, status=201, headers=headers)
+        return Response(serializer.data, status=201, headers=headers)
@@ -0,0 +1,133 @@
+# api/views_admin.py
+from datetime import timedelta
+
+from django.db.models import Avg, Count, F, Sum
+from django.utils import timezone
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .models import AnalysisUsage, Report
+from .serializers import ReportSerializer
+from .services.feedback import queue_metrics
+from .services.jwks import keysets_snapshot
+from .services.report_search import search as search_reports
+from .services.usage import estimate_cost_usd, token_budget
+
+
+class UsageReportView(APIView):
+    """
+    GET /api/admin/usage-report/?days=7&limit=50
+    Сводка по вызовам vision-модели: всего и топ пользователей по токенам.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            days = max(1, min(int(request.query_params.get("days", 7)), 90))
+            limit = max(1, min(int(request.query_params.get("limit", 50)), 500))
+        except ValueError:
+            return Response({"detail": "days/limit must be integers"}, status=400)
+
+        # свежие приращения из памяти этого воркера — в БД до отчёта
+        token_budget.flush()
+
+        since = timezone.now() - timedelta(days=days)
+        qs = AnalysisUsage.objects.filter(created_at__gte=since)
+        aggregates = dict(
+            calls=Count("id"),
+            prompt_tokens=Sum("prompt_tokens"),
+            completion_tokens=Sum("completion_tokens"),
+            image_bytes=Sum("image_bytes"),
+            avg_latency_ms=Avg("latency_ms"),
+        )
+
+        totals = qs.aggregate(**aggregates)
+        failed = qs.filter(ok=False).count()
+
+        rows = (qs.values("user_id", "user__email")
+                  .annotate(**aggregates)
+                  .annotate(tokens=F("prompt_tokens") + F("completion_tokens"))
+                  .order_by("-tokens")[:limit])
+
+        def _row(r):
+            prompt = r["prompt_tokens"] or 0
+            completion = r["completion_tokens"] or 0
+            return {
+                "calls": r["calls"],
+                "prompt_tokens": prompt,
+                "completion_tokens": completion,
+                "total_tokens": prompt + completion,
+                "image_bytes": r["image_bytes"] or 0,
+                "avg_latency_ms": int(r["avg_latency_ms"] or 0),
+                "cost_usd": estimate_cost_usd(prompt, completion),
+            }
+
+        return Response({
+            "days": days,
+            "since": since,
+            "daily_token_budget": token_budget.daily_limit,
+            "totals": {**_row(totals), "failed": failed},
+            "users": [
+                {"user_id": r["user_id"], "email": r["user__email"], **_row(r)}
+                for r in rows
+            ],
+        })
+
+
+class AuthKeysStatusView(APIView):
+    """
+    GET /api/admin/auth-keys/
+    Состояние кэша JWKS в этом воркере: kid-ы, возраст, попадания/обновления/ошибки.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(keysets_snapshot())
+
+
+class FeedbackQueueView(APIView):
+    """
+    GET /api/admin/feedback-queue/
+    Очередь пересылки оценок и заявок: сколько ждёт и возраст самой старой записи.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(queue_metrics())
+
+
+class ReportSearchView(APIView):
+    """
+    GET /api/admin/reports/search/?q=crash+login&order=relevance&page=1&page_size=20
+    Разбор заявок: полнотекстовый поиск по названию и комментарию (services/report_search.py).
+    order=relevance (по умолчанию) или recent; без q — самые новые.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        q = request.query_params.get("q", "").strip()
+        order = request.query_params.get("order", "relevance")
+        if order not in ("relevance", "recent"):
+            return Response({"detail": "order must be relevance or recent"}, status=400)
+        try:
+            page = max(1, min(int(request.query_params.get("page", 1)), 500))
+            page_size = max(1, min(int(request.query_params.get("page_size", 20)), 100))
+        except ValueError:
+            return Response({"detail": "page/page_size must be integers"}, status=400)
+
+        offset = (page - 1) * page_size
+        # на одну больше — узнать, есть ли следующая страница, без COUNT(*)
+        if q:
+            reports = search_reports(q, limit=page_size + 1, offset=offset, order=order)
+        else:
+            reports = list(Report.objects.select_related("user")
+                           .order_by("-id")[offset:offset + page_size + 1])
+        has_more = len(reports) > page_size
+        results = []
+        for report in reports[:page_size]:
+            item = ReportSerializer(report, context={"request": request}).data
+            item["user_email"] = report.user.email if report.user else None
+            item["score"] = getattr(report, "score", 0.0)
+            results.append(item)
+        return Response({"q": q, "order": order, "page": page, "page_size": page_size, "has_more": has_more, "results": results})
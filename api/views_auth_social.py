@@ -9,6 +9,8 @@ from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 from .serializers import SocialIDTokenSerializer
 from .services.social_verify import verify_google_id_token, verify_apple_id_token
+from .services.social_identity import resolve_social_user
+from .services.token_cache import verified_tokens
 import base64, hashlib
 from jwt import ExpiredSignatureError, InvalidIssuerError, InvalidAudienceError, InvalidSignatureError
 
@@ -19,6 +21,17 @@ def issue_jwt(user) -> dict:
     r = RefreshToken.for_user(user)
     return {"access": str(r.access_token), "refresh": str(r)}
 
+
+def _cached_user(cached):
+    """Пользователь из кэша проверенных токенов — только если он ещё есть и активен."""
+    if not cached:
+        return None
+    return User.objects.filter(pk=cached[1], is_active=True).first()
+
+
+def _inactive_response():
+    return Response({"detail": "User account is disabled"}, status=status.HTTP_403_FORBIDDEN)
+
 class GoogleLoginView(APIView):
     permission_classes = [AllowAny]
 
@@ -33,6 +46,12 @@ class GoogleLoginView(APIView):
             logger.error(msg)
             return Response({"detail": msg}, status=500 if settings.DEBUG else 400)
 
+        # повтор того же токена — без RS256, один SELECT по pk: удалённый или
+        # отключённый пользователь (кэш у каждого процесса свой) идёт через полную проверку
+        cached_user = _cached_user(verified_tokens.get("google", aud, id_token))
+        if cached_user is not None:
+            return Response(issue_jwt(cached_user), status=200)
+
         try:
             info = verify_google_id_token(id_token, aud)
             iss = info.get("iss")
@@ -46,29 +65,19 @@ class GoogleLoginView(APIView):
             first_name = info.get("given_name", "")
             last_name = info.get("family_name", "")
 
-            created = False
-            if email:
-                user, created = User.objects.get_or_create(
-                    email=email,
-                    defaults={"first_name": first_name, "last_name": last_name},
-                )
-            else:
-                # без email — технич. адрес
-                user, created = User.objects.get_or_create(email=f"google_{sub}@example.invalid")
-
-            if hasattr(user, "provider") and hasattr(user, "provider_sub"):
-                to_update = []
-                if getattr(user, "provider", "") != "google":
-                    user.provider = "google"; to_update.append("provider")
-                if getattr(user, "provider_sub", "") != sub:
-                    user.provider_sub = sub; to_update.append("provider_sub")
-                if to_update:
-                    user.save(update_fields=to_update)
+            user, created = resolve_social_user(
+                "google", sub, email,
+                defaults={"first_name": first_name, "last_name": last_name},
+            )
 
             if settings.DEBUG:
                 logger.warning("Google ok: sub=%s aud=%s iss=%s email=%s created=%s",
                                sub, info.get("aud"), iss, email, created)
 
+            if not user.is_active:
+                return _inactive_response()
+            verified_tokens.put("google", aud, id_token, info, user.pk)
+
             return Response(issue_jwt(user), status=201 if created else 200)
 
         except Exception as e:
@@ -87,6 +96,22 @@ def _sha256_b64url(s: str) -> str:
 class AppleLoginView(APIView):
     permission_classes = [AllowAny]
 
+    @staticmethod
+    def _check_nonce(claims, raw_nonce):
+        if not raw_nonce:
+            return None
+        token_nonce = (claims.get("nonce") or "").strip()
+        exp_hex = _sha256_hex(raw_nonce)
+        exp_b64 = _sha256_b64url(raw_nonce)
+        if token_nonce in (exp_hex, exp_b64):
+            return None
+        return Response({
+            "detail": "nonce mismatch",
+            "token_nonce": token_nonce,
+            "expected_hex": exp_hex,
+            "expected_b64url": exp_b64,
+        }, status=400)
+
     def post(self, request):
         ser = SocialIDTokenSerializer(data=request.data)
         ser.is_valid(raise_exception=True)
@@ -95,7 +120,17 @@ class AppleLoginView(APIView):
         raw_nonce = (request.data.get("nonce") or "").strip()
         aud = "com.adconcept.snapai.ios"
 
+        # повтор того же токена: claims уже проверены, nonce сверяем заново ниже
+        cached = verified_tokens.get("apple", aud, id_token)
+
         try:
+            cached_user = _cached_user(cached)
+            if cached_user is not None:
+                nonce_error = self._check_nonce(cached[0], raw_nonce)
+                if nonce_error:
+                    return nonce_error
+                return Response(issue_jwt(cached_user), status=200)
+
             # 1) Проверим подпись+issuer внутри verify_apple_id_token,
             #    НО audience вручную, чтобы отдать понятную ошибку
             claims = verify_apple_id_token(id_token, aud, verify_aud_in_decode=False)
@@ -114,17 +149,9 @@ class AppleLoginView(APIView):
                 return Response({"detail": f"aud mismatch: token aud={token_aud}, expected={aud}"}, status=400)
 
             # 4) nonce — примем и hex, и base64url
-            if raw_nonce:
-                token_nonce = (claims.get("nonce") or "").strip()
-                exp_hex = _sha256_hex(raw_nonce)
-                exp_b64 = _sha256_b64url(raw_nonce)
-                if token_nonce not in (exp_hex, exp_b64):
-                    return Response({
-                        "detail": "nonce mismatch",
-                        "token_nonce": token_nonce,
-                        "expected_hex": exp_hex,
-                        "expected_b64url": exp_b64,
-                    }, status=400)
+            nonce_error = self._check_nonce(claims, raw_nonce)
+            if nonce_error:
+                return nonce_error
 
             # 5) user
             sub = claims.get("sub")
@@ -132,21 +159,11 @@ class AppleLoginView(APIView):
                 return Response({"detail": "Missing sub in Apple token"}, status=400)
 
             email = (claims.get("email") or "").lower().strip()
-            created = False
-            if email:
-                user, created = User.objects.get_or_create(email=email)
-            else:
-                user, created = User.objects.get_or_create(email=f"apple_{sub}@example.invalid")
-
-            if hasattr(user, "provider") and hasattr(user, "provider_sub"):
-                to_update = []
-                if getattr(user, "provider", "") != "apple":
-                    user.provider = "apple"; to_update.append("provider")
-                if getattr(user, "provider_sub", "") != sub:
-                    user.provider_sub = sub; to_update.append("provider_sub")
-                if to_update:
-                    user.save(update_fields=to_update)
+            user, created = resolve_social_user("apple", sub, email)
+            if not user.is_active:
+                return _inactive_response()
 
+            verified_tokens.put("apple", aud, id_token, claims, user.pk)
             return Response(issue_jwt(user), status=201 if created else 200)
 
         except ExpiredSignatureError:
@@ -1,12 +1,15 @@
 # api/views_iap.py
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 
 from .models import PaymentReceiptIOS, Entitlement
 from .serializers import IOSReceiptInSerializer
+from .services.appstore import AppStoreError, InvalidSignedData
+from .services.appstore_notifications import ingest
 from drf_spectacular.utils import extend_schema
 
 
@@ -18,7 +21,8 @@ from drf_spectacular.utils import extend_schema
 class IOSReceiptIngestView(APIView):
     """
     POST /api/iap/apple/ingest/
-    Принимает чек от iOS (без немедленной верификации).
+    Принимает чек от iOS (без немедленной верификации). Повтор уже
+    известного чека — 200 с его текущим статусом, без новой строки.
     """
     permission_classes = [IsAuthenticated]
 
@@ -27,19 +31,63 @@ class IOSReceiptIngestView(APIView):
         ser.is_valid(raise_exception=True)
         data = ser.validated_data
 
-        receipt = PaymentReceiptIOS.objects.create(
-            user=request.user,
-            product_id=data["product_id"],
-            original_transaction_id=data["original_transaction_id"],
-            transaction_id=data.get("transaction_id", ""),
-            bundle_id=data.get("bundle_id", ""),
-            app_account_token=data.get("app_account_token", ""),
-            raw_payload=data.get("raw_payload"),
-            status="pending",
-        )
-        # здесь можно запустить async-верификацию, но ты просил просто принять чек
+        key = {
+            "original_transaction_id": data["original_transaction_id"],
+            "transaction_id": data.get("transaction_id", ""),
+        }
+        # приложение присылает тот же чек на каждом запуске и restore:
+        # уже известный — один SELECT по уникальному индексу, без записи
+        receipt = PaymentReceiptIOS.objects.filter(**key).only("id", "user_id", "status", *key).first()
+        created = False
+        if receipt is None:
+            try:
+                with transaction.atomic():
+                    receipt = PaymentReceiptIOS.objects.create(
+                        user=request.user,
+                        product_id=data["product_id"],
+                        bundle_id=data.get("bundle_id", ""),
+                        app_account_token=data.get("app_account_token", ""),
+                        raw_payload=data.get("raw_payload"),
+                        status="pending",
+                        **key,
+                    )
+                created = True
+            except IntegrityError:
+                # параллельный повтор того же чека успел первым
+                receipt = PaymentReceiptIOS.objects.get(**key)
+
+        if receipt.user_id != request.user.id:
+            return Response({"detail": "Receipt is already registered to another account"},
+                            status=status.HTTP_409_CONFLICT)
+
+        # проверку через App Store Server API делает воркер manage.py verify_receipts
         return Response({
             "id": receipt.id,
             "status": receipt.status,
             "original_transaction_id": receipt.original_transaction_id,
-        }, status=status.HTTP_201_CREATED)
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+
+@extend_schema(request=dict, responses={200: dict})
+class AppStoreNotificationView(APIView):
+    """
+    POST /api/iap/apple/notifications/
+    App Store Server Notifications v2: {"signedPayload": "..."}.
+    Проверяет подпись, сохраняет в AppStoreNotification и сразу отвечает 200;
+    Entitlement обновляет manage.py process_appstore_notifications.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def post(self, request):
+        signed = request.data.get("signedPayload") if isinstance(request.data, dict) else None
+        if not signed:
+            return Response({"detail": "signedPayload is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            notification_uuid = ingest(signed)
+        except InvalidSignedData as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except AppStoreError as e:
+            # не настроен корень Apple — Apple повторит доставку позже
+            return Response({"detail": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({"notificationUUID": notification_uuid}, status=status.HTTP_200_OK)
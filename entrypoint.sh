@@ -1,25 +1,13 @@
 #!/bin/sh
 
-echo "🔄 Применяем миграции..."
-uv run python manage.py makemigrations --noinput
-uv run python manage.py migrate --noinput
+# миграции (если есть новые), таблица продуктов, суперюзер, статика из образа —
+# одним процессом; makemigrations на старте больше нет: миграции лежат в репозитории
+echo "🔄 Подготовка: manage.py bootstrap..."
+uv run python manage.py bootstrap || exit 1
 
-echo "🧹 Собираем статику..."
-uv run python manage.py collectstatic --noinput
-
-
-echo "👤 Создаем суперюзера, если его нет..."
-uv run python manage.py shell -c "
-from django.contrib.auth import get_user_model;
-from django.conf import settings
-User = get_user_model();
-if not User.objects.filter(is_superuser=True).exists():
-    User.objects.create_superuser(
-        email=settings.SUPERUSER_EMAIL,
-        password=settings.SUPERUSER_PASSWORD,
-        is_active=True
-    );
-"
+# фоновые циклы (письма, чеки, уведомления App Store, пересылка оценок, подписки,
+# регистрации) — отдельный сервис worker: manage.py run_workers (deploy/*/docker-compose.yml)
 
 echo "Запускаем сервер"
-exec uv run gunicorn snapAI.wsgi:application --workers 2 --bind 0.0.0.0:8000
+# профиль и таймауты — GUNICORN_* (snapAI/gunicorn_conf.py)
+exec uv run gunicorn -c python:snapAI.gunicorn_conf snapAI.wsgi:application
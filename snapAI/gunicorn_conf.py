@@ -0,0 +1,66 @@
+# snapAI/gunicorn_conf.py
+"""
+Настройки gunicorn: gunicorn -c python:snapAI.gunicorn_conf snapAI.wsgi:application
+
+Профиль — GUNICORN_PROFILE:
+- gthread (по умолчанию) — потоки внутри воркера. Основное время запроса
+  /api/analyze/ — ожидание ответа OpenAI, поток в это время GIL не держит,
+  поэтому на 0.5 CPU два процесса по 8 потоков обслуживают 16 таких запросов
+  разом без лишней памяти на процессы.
+- sync — как было: один запрос на процесс.
+
+uvicorn-воркеров нет сознательно: все view синхронные, а Django под ASGI
+выполняет sync-view через sync_to_async(thread_sensitive=True) — по одному
+за раз на процесс, то есть медленнее gthread.
+
+Каждое значение переопределяется своим GUNICORN_*. Сравнение профилей —
+manage.py bench_server.
+"""
+import os
+
+PROFILES = {
+    "gthread": {"worker_class": "gthread", "workers": 2, "threads": 8},
+    "sync": {"worker_class": "sync", "workers": 2, "threads": 1},
+}
+
+profile = os.getenv("GUNICORN_PROFILE", "gthread")
+if profile not in PROFILES:
+    raise RuntimeError(f"GUNICORN_PROFILE must be one of {', '.join(PROFILES)}, got {profile!r}")
+_p = PROFILES[profile]
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+worker_class = _p["worker_class"]
+workers = int(os.getenv("GUNICORN_WORKERS", _p["workers"]))
+threads = int(os.getenv("GUNICORN_THREADS", _p["threads"]))
+
+# приложение импортируется один раз в мастере, воркеры получают его через fork
+# (copy-on-write: Django, DRF, OpenAI SDK, таблица продуктов не копируются в каждый)
+preload_app = os.getenv("GUNICORN_PRELOAD", "True") == "True"
+
+# перезапуск воркера после N запросов: in-process кэши и фрагментация не растут бесконечно;
+# jitter — чтобы воркеры не перезапускались одновременно
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+# один вызов vision: VISION_TIMEOUT на попытку, VISION_MAX_RETRIES повторов SDK; анализ —
+# до двух вызовов (_complete и повторный запрос при невалидном JSON, openai_vision.py).
+# sync-воркер, занятый дольше timeout, убивается — запас на оба вызова + 30 с
+_vision_call = float(os.getenv("VISION_TIMEOUT", 60)) * (int(os.getenv("VISION_MAX_RETRIES", 2)) + 1)
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 2 * _vision_call + 30))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+# keep-alive к nginx (proxy_http_version 1.1)
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+# heartbeat воркеров — в tmpfs: в контейнере /tmp бывает на overlayfs и подтормаживает
+worker_tmp_dir = os.getenv("GUNICORN_WORKER_TMP_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else None)
+
+accesslog = os.getenv("GUNICORN_ACCESSLOG", "-") or None  # пусто — без access-лога
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOGLEVEL", "info")
+
+
+def post_fork(server, worker):
+    # с preload_app соединения с БД, открытые в мастере, не должны делиться между процессами
+    from django.db import connections
+
+    connections.close_all()
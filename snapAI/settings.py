@@ -37,6 +37,27 @@ INSTALLED_APPS = [
 
 AUTH_USER_MODEL = "api.User"   # или "accounts.User", если приложение называется иначе
 
+# --- Password hashing (api/hashers.py) ---
+# scrypt | pbkdf2; старые хэши проверяются и
+# перехэшируются текущим профилем при входе
+PASSWORD_HASHER = os.getenv("PASSWORD_HASHER", "scrypt")
+SCRYPT_WORK_FACTOR = int(os.getenv("SCRYPT_WORK_FACTOR", 2 ** 14))
+SCRYPT_BLOCK_SIZE = int(os.getenv("SCRYPT_BLOCK_SIZE", 8))
+SCRYPT_PARALLELISM = int(os.getenv("SCRYPT_PARALLELISM", 1))
+PBKDF2_ITERATIONS = int(os.getenv("PBKDF2_ITERATIONS", 0))  # 0 = дефолт Django
+# сколько хэшей одновременно на процесс (по умолчанию — число CPU; 0 = без ограничения)
+PASSWORD_HASHING_POOL_SIZE = int(os.getenv("PASSWORD_HASHING_POOL_SIZE", os.cpu_count() or 1))
+# сколько ждать свободного места в пуле, сек; дальше — 503
+PASSWORD_HASHING_TIMEOUT = float(os.getenv("PASSWORD_HASHING_TIMEOUT", 5))
+
+PASSWORD_HASHER_PROFILES = {
+    "scrypt": "api.hashers.TunedScryptPasswordHasher",
+    "pbkdf2": "api.hashers.TunedPBKDF2PasswordHasher",
+}
+PASSWORD_HASHERS = [PASSWORD_HASHER_PROFILES[PASSWORD_HASHER]] + [
+    h for name, h in PASSWORD_HASHER_PROFILES.items() if name != PASSWORD_HASHER
+]
+
 DB_DIR = BASE_DIR / "db"
 DB_DIR.mkdir(parents=True, exist_ok=True)  # авто-создание папки
 
@@ -82,7 +103,10 @@ DATABASES = {
 
 # ——— Стастика/медиа ———
 STATIC_URL = "/static/"
-STATIC_ROOT = BASE_DIR / "static"
+STATIC_ROOT = Path(os.getenv("STATIC_ROOT", BASE_DIR / "static"))
+# статика, собранная при сборке образа (Dockerfile); manage.py bootstrap копирует её
+# в STATIC_ROOT (общий с nginx volume), только если сменился .build-id
+STATIC_BUILD_ROOT = os.getenv("STATIC_BUILD_ROOT", "")
 MEDIA_URL = os.getenv("MEDIA_URL", "/media/")
 MEDIA_ROOT = os.getenv("MEDIA_ROOT", BASE_DIR / "media")
 
@@ -142,8 +166,131 @@ else:
     EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
     DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "dev@localhost")
 
+# письма кладутся в OutboundEmail и уходят через `manage.py send_emails --loop`;
+# False — отправка прямо в запросе (удобно с console backend)
+EMAIL_OUTBOX = os.getenv("EMAIL_OUTBOX", str("smtp" in backend_env)) == "True"
+EMAIL_OUTBOX_POLL_INTERVAL = float(os.getenv("EMAIL_OUTBOX_POLL_INTERVAL", 1))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", 5))
+# база экспоненциальной задержки между попытками, сек (30, 60, 120, ... до часа)
+EMAIL_OUTBOX_BACKOFF = float(os.getenv("EMAIL_OUTBOX_BACKOFF", 30))
+# письмо в sending дольше этого (упавший отправщик) берётся снова
+EMAIL_OUTBOX_LOCK_TIMEOUT = float(os.getenv("EMAIL_OUTBOX_LOCK_TIMEOUT", 300))
+
 
 # --- SUPERUSER ---
 SUPERUSER_EMAIL = os.getenv('SUPERUSER_EMAIL', 'admin@example.com')
 SUPERUSER_PASSWORD = os.getenv('SUPERUSER_PASSWORD', 'Admin_333')
 
+
+# --- AI usage / budgets ---
+# суточный лимит токенов vision-модели на пользователя (0 = без лимита, по умолчанию).
+# Фото с телефона при VISION_IMAGE_DETAIL=auto стоит у gpt-4o-mini порядка 25k+ prompt-токенов —
+# лимит задавать по /api/admin/usage-report/ (токены на вызов), а не наугад
+ANALYSIS_DAILY_TOKEN_BUDGET = int(os.getenv("ANALYSIS_DAILY_TOKEN_BUDGET", 0))
+# как часто (сек) in-memory счётчик сбрасывается в БД
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", 30))
+# цены gpt-4o-mini, $ за 1M токенов — только для отчёта
+OPENAI_PRICE_INPUT_PER_1M = float(os.getenv("OPENAI_PRICE_INPUT_PER_1M", 0.15))
+OPENAI_PRICE_OUTPUT_PER_1M = float(os.getenv("OPENAI_PRICE_OUTPUT_PER_1M", 0.60))
+
+# --- Vision ---
+VISION_MODEL = os.getenv("VISION_MODEL", "gpt-4o-mini")
+# compact (короткие ключи) | verbose (старый подробный JSON)
+VISION_PROMPT = os.getenv("VISION_PROMPT", "compact")
+# low | high | auto — detail для image_url
+VISION_IMAGE_DETAIL = os.getenv("VISION_IMAGE_DETAIL", "auto")
+# 0 = взять max_tokens из варианта промпта
+VISION_MAX_TOKENS = int(os.getenv("VISION_MAX_TOKENS", 0))
+# таймаут одной попытки запроса к OpenAI, сек (у SDK по умолчанию 600) и число повторов SDK;
+# из них же snapAI/gunicorn_conf.py считает timeout воркера
+VISION_TIMEOUT = float(os.getenv("VISION_TIMEOUT", 60))
+VISION_MAX_RETRIES = int(os.getenv("VISION_MAX_RETRIES", 2))
+
+# --- Ingredient suggest ---
+# как часто (сек) in-memory индекс подтягивает новые Meal
+INGREDIENT_INDEX_REFRESH = float(os.getenv("INGREDIENT_INDEX_REFRESH", 60))
+
+# --- Nutrition plan strategies ---
+# сколько (сек) держать активную версию PlanStrategy в памяти процесса
+PLAN_STRATEGY_CACHE_TTL = float(os.getenv("PLAN_STRATEGY_CACHE_TTL", 300))
+
+# --- Rate limits (OTP signup) ---
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True") == "True"
+# memory (в процессе, на воркер) | db (общая таблица RateLimitBucket)
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "db")
+# ведро, не тронутое столько секунд, уже полное — его строку удаляет reap_pending_signups
+# (не меньше самого длинного периода лимитов)
+RATE_LIMIT_IDLE_TTL = float(os.getenv("RATE_LIMIT_IDLE_TTL", 86400))
+# заголовок с IP клиента от своего reverse proxy (deploy/*: nginx ставит X-Real-IP);
+# пусто — REMOTE_ADDR. Без proxy не включать: заголовок может прислать сам клиент
+RATE_LIMIT_CLIENT_IP_HEADER = os.getenv("RATE_LIMIT_CLIENT_IP_HEADER", "")
+# брать IP из X-Forwarded-For — последний адрес, дописанный своим proxy
+RATE_LIMIT_TRUST_X_FORWARDED_FOR = os.getenv("RATE_LIMIT_TRUST_X_FORWARDED_FOR", "False") == "True"
+# "N/период", период: s, m, h, d, 10m ...; пусто = без лимита
+SIGNUP_RATE_PER_IP = os.getenv("SIGNUP_RATE_PER_IP", "20/h")
+SIGNUP_RATE_PER_EMAIL = os.getenv("SIGNUP_RATE_PER_EMAIL", "5/h")
+
+# --- Social login keys (api/services/jwks.py) ---
+APPLE_JWKS_URL = os.getenv("APPLE_JWKS_URL", "https://appleid.apple.com/auth/keys")
+GOOGLE_JWKS_URL = os.getenv("GOOGLE_JWKS_URL", "https://www.googleapis.com/oauth2/v3/certs")
+# TTL без Cache-Control и пределы для max-age, сек
+JWKS_DEFAULT_TTL = float(os.getenv("JWKS_DEFAULT_TTL", 3600))
+JWKS_MIN_TTL = float(os.getenv("JWKS_MIN_TTL", 300))
+JWKS_MAX_TTL = float(os.getenv("JWKS_MAX_TTL", 86400))
+# с какой доли TTL обновлять в фоне
+JWKS_REFRESH_AHEAD = float(os.getenv("JWKS_REFRESH_AHEAD", 0.8))
+# сколько ещё отдавать истёкшие ключи, если провайдер недоступен, сек
+JWKS_STALE_TTL = float(os.getenv("JWKS_STALE_TTL", 86400))
+JWKS_UNKNOWN_KID_COOLDOWN = float(os.getenv("JWKS_UNKNOWN_KID_COOLDOWN", 60))
+JWKS_HTTP_TIMEOUT = float(os.getenv("JWKS_HTTP_TIMEOUT", 5))
+# кэш проверенных id_token (повторы без RS256/БД): сколько записей и макс. TTL, сек; 0 — выкл.
+SOCIAL_TOKEN_CACHE_SIZE = int(os.getenv("SOCIAL_TOKEN_CACHE_SIZE", 10000))
+SOCIAL_TOKEN_CACHE_MAX_TTL = float(os.getenv("SOCIAL_TOKEN_CACHE_MAX_TTL", 600))
+
+# --- App Store Server API (api/services/appstore.py, manage.py verify_receipts) ---
+APPSTORE_ISSUER_ID = os.getenv("APPSTORE_ISSUER_ID", "")
+APPSTORE_KEY_ID = os.getenv("APPSTORE_KEY_ID", "")
+APPSTORE_PRIVATE_KEY_PATH = os.getenv("APPSTORE_PRIVATE_KEY_PATH", "")  # .p8 ключ In-App Purchase
+APPSTORE_BUNDLE_ID = os.getenv("APPSTORE_BUNDLE_ID", "com.adconcept.snapai.ios")
+APPSTORE_ENVIRONMENT = os.getenv("APPSTORE_ENVIRONMENT", "auto")  # production | sandbox | auto
+APPSTORE_API_URL = os.getenv("APPSTORE_API_URL", "")  # переопределение (локальная заглушка)
+# корень Apple (AppleRootCA-G3.cer); без него чеки и уведомления не отклоняются, а ждут повтора
+APPSTORE_ROOT_CERT_PATH = os.getenv("APPSTORE_ROOT_CERT_PATH", "")
+APPSTORE_ALLOW_UNTRUSTED_ROOT = os.getenv("APPSTORE_ALLOW_UNTRUSTED_ROOT", "False") == "True"
+APPSTORE_HTTP_TIMEOUT = float(os.getenv("APPSTORE_HTTP_TIMEOUT", 10))
+RECEIPT_VERIFY_CONCURRENCY = int(os.getenv("RECEIPT_VERIFY_CONCURRENCY", 8))
+# базовая пауза перед повтором при ошибке Apple/сети, растёт вдвое с каждой попыткой (до часа)
+RECEIPT_RETRY_BACKOFF = float(os.getenv("RECEIPT_RETRY_BACKOFF", 30))
+# через сколько секунд чек, взятый упавшим воркером, снова попадает в очередь
+RECEIPT_CLAIM_TIMEOUT = float(os.getenv("RECEIPT_CLAIM_TIMEOUT", 300))
+# после стольких временных ошибок подряд чек отклоняется (при backoff 30 с — примерно сутки)
+RECEIPT_MAX_ATTEMPTS = int(os.getenv("RECEIPT_MAX_ATTEMPTS", 30))
+# уведомление о неизвестной подписке (чек ещё не проверен) повторяем столько раз
+APPSTORE_NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("APPSTORE_NOTIFICATION_MAX_ATTEMPTS", 8))
+# data.environment уведомлений, которые меняют доступ (Production, Sandbox через запятую):
+# по умолчанию sandbox-покупки не выдают премиум на боевом сервере
+APPSTORE_NOTIFICATION_ENVIRONMENTS = set(os.getenv(
+    "APPSTORE_NOTIFICATION_ENVIRONMENTS", "Sandbox" if APPSTORE_ENVIRONMENT == "sandbox" else "Production"
+).split(","))
+
+# --- Premium (api/services/entitlements.py) ---
+# кэш статуса премиума в процессе: сколько пользователей, TTL для «есть» и «нет», сек
+ENTITLEMENT_CACHE_SIZE = int(os.getenv("ENTITLEMENT_CACHE_SIZE", 50000))
+ENTITLEMENT_CACHE_TTL = float(os.getenv("ENTITLEMENT_CACHE_TTL", 300))
+ENTITLEMENT_CACHE_NEGATIVE_TTL = float(os.getenv("ENTITLEMENT_CACHE_NEGATIVE_TTL", 30))
+# требовать премиум для /api/analyze/
+ANALYZE_REQUIRES_PREMIUM = os.getenv("ANALYZE_REQUIRES_PREMIUM", "False") == "True"
+
+# --- Feedback forwarding (api/services/feedback.py, manage.py dispatch_feedback) ---
+# куда пересылать оценки 4+ и заявки: через запятую из webhook, email, file; пусто — никуда
+FEEDBACK_SINKS = [s.strip() for s in os.getenv("FEEDBACK_SINKS", "").split(",") if s.strip()]
+FEEDBACK_WEBHOOK_URL = os.getenv("FEEDBACK_WEBHOOK_URL", "")
+FEEDBACK_WEBHOOK_TIMEOUT = float(os.getenv("FEEDBACK_WEBHOOK_TIMEOUT", 10))
+FEEDBACK_DIGEST_EMAIL = os.getenv("FEEDBACK_DIGEST_EMAIL", "")  # кому слать дайджест
+FEEDBACK_FILE_PATH = os.getenv("FEEDBACK_FILE_PATH", str(DB_DIR / "feedback.jsonl"))
+# пауза после неудачной пересылки пачки, сек (удваивается до 10 минут)
+FEEDBACK_RETRY_BACKOFF = float(os.getenv("FEEDBACK_RETRY_BACKOFF", 30))
+
+# --- Report search (api/services/report_search.py) ---
+# по скольким самым новым совпадениям считать релевантность (bm25 / ts_rank)
+REPORT_SEARCH_RANK_WINDOW = int(os.getenv("REPORT_SEARCH_RANK_WINDOW", 2000))